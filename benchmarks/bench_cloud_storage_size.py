@@ -0,0 +1,367 @@
+"""offline benchmark of the ying.cloud_storage_size engines
+
+Synthetic buckets are seeded into local stand-ins of the storage providers,
+then every (provider, objects, engine, parallelism) case is measured in a
+fresh subprocess, so peak RSS and connection setup belong to that case only.
+
+    python benchmarks/bench_cloud_storage_size.py run --providers=s3,minio --objects=10000,100000
+    python benchmarks/bench_cloud_storage_size.py compare old.json new.json
+
+See benchmarks/README.md for the stand-in services.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import random
+import platform
+import resource
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import fire
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+REPO_DIR = BENCH_DIR.parent
+
+AZURITE_CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;"
+)
+SHARDS = 16
+SEED_CONCURRENCY = 64
+
+
+def object_key(i):
+    return f"shard{i % SHARDS:02d}/dir{i % 7}/object-{i:09d}"
+
+
+def object_size(i):
+    return random.Random(i).randint(0, 1024)
+
+
+def bucket_name(objects):
+    return f"ying-bench-{objects}"
+
+
+def _free_local_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _is_listening(url):
+    from urllib.parse import urlparse
+
+    parsed_url = urlparse(url if "://" in url else f"http://{url}")
+    try:
+        with socket.create_connection((parsed_url.hostname, parsed_url.port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def start_moto_server():
+    """start a local moto server, the s3 and minio stand-in"""
+    port = _free_local_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    endpoint = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if _is_listening(endpoint):
+            return process, endpoint
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("moto server did not start")
+
+
+def provider_env(provider, endpoint):
+    """environment of a benchmark case, pointing the engines at the stand-in"""
+    fake_credentials = {
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }
+    if provider == "s3":
+        return dict(
+            fake_credentials,
+            AWS_ENDPOINT_URL=endpoint,
+            RCLONE_CONFIG_MYREMOTE_PROVIDER="Other",
+            RCLONE_CONFIG_MYREMOTE_ACCESS_KEY_ID="bench",
+            RCLONE_CONFIG_MYREMOTE_SECRET_ACCESS_KEY="bench",
+            RCLONE_CONFIG_S3_ENDPOINT=endpoint,
+        )
+    elif provider == "minio":
+        return {
+            "MINIO_ENDPOINT": endpoint.split("://", 1)[-1],
+            "MINIO_ACCESS_KEY": os.environ.get("BENCH_MINIO_ACCESS_KEY", "bench"),
+            "MINIO_SECRET_KEY": os.environ.get("BENCH_MINIO_SECRET_KEY", "bench"),
+        }
+    elif provider == "az":
+        return {"AZURE_STORAGE_CONNECTION_STRING": endpoint}
+    elif provider == "gs":
+        return {"STORAGE_EMULATOR_HOST": endpoint}
+    raise ValueError(f"unsupported provider {provider}")
+
+
+def seed_s3_compatible(endpoint, access_key, secret_key, objects):
+    import boto3
+    from botocore.config import Config
+
+    client = boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name="us-east-1",
+        config=Config(max_pool_connections=SEED_CONCURRENCY),
+    )
+    name = bucket_name(objects)
+    if name in [bucket["Name"] for bucket in client.list_buckets()["Buckets"]]:
+        return
+    client.create_bucket(Bucket=name)
+    with ThreadPoolExecutor(SEED_CONCURRENCY) as executor:
+        list(executor.map(
+            lambda i: client.put_object(Bucket=name, Key=object_key(i), Body=b"x" * object_size(i)),
+            range(objects),
+        ))
+
+
+def seed_az(connection_string, objects):
+    from azure.storage.blob import BlobServiceClient
+
+    container_client = BlobServiceClient.from_connection_string(
+        connection_string
+    ).get_container_client(bucket_name(objects))
+    if container_client.exists():
+        return
+    container_client.create_container()
+    with ThreadPoolExecutor(SEED_CONCURRENCY) as executor:
+        list(executor.map(
+            lambda i: container_client.upload_blob(object_key(i), b"x" * object_size(i)),
+            range(objects),
+        ))
+
+
+def seed_gs(emulator_host, objects):
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import storage
+
+    os.environ["STORAGE_EMULATOR_HOST"] = emulator_host
+    client = storage.Client(project="emulator", credentials=AnonymousCredentials())
+    bucket = client.bucket(bucket_name(objects))
+    if bucket.exists():
+        return
+    bucket = client.create_bucket(bucket_name(objects))
+    with ThreadPoolExecutor(SEED_CONCURRENCY) as executor:
+        list(executor.map(
+            lambda i: bucket.blob(object_key(i)).upload_from_string(b"x" * object_size(i)),
+            range(objects),
+        ))
+
+
+def seed(provider, endpoint, objects):
+    started_at = time.monotonic()
+    if provider == "s3":
+        seed_s3_compatible(endpoint, "bench", "bench", objects)
+    elif provider == "minio":
+        env = provider_env("minio", endpoint)
+        seed_s3_compatible(endpoint, env["MINIO_ACCESS_KEY"], env["MINIO_SECRET_KEY"], objects)
+    elif provider == "az":
+        seed_az(endpoint, objects)
+    elif provider == "gs":
+        seed_gs(endpoint, objects)
+    print(f"[{provider}] {bucket_name(objects)} ready in {time.monotonic() - started_at:.1f}s", file=sys.stderr)
+
+
+def count_http_requests():
+    """count every HTTP request sent through urllib3, used by all the provider SDKs"""
+    import urllib3.connectionpool
+
+    counter = {"requests": 0}
+    urlopen = urllib3.connectionpool.HTTPConnectionPool.urlopen
+
+    def counting_urlopen(self, *args, **kwargs):
+        counter["requests"] += 1
+        return urlopen(self, *args, **kwargs)
+
+    urllib3.connectionpool.HTTPConnectionPool.urlopen = counting_urlopen
+    return counter
+
+
+def run_case(provider, objects, engine="sdk", parallelism=1):
+    """run one case in this process and print its measurements as JSON"""
+    sys.path.insert(0, str(REPO_DIR))
+    from ying.cloud_storage_size import get_bucket_objects_count_and_bytes
+
+    counter = count_http_requests()
+    bucket_uri = f"{provider}://{bucket_name(objects)}"
+
+    cpu_started_at = time.process_time()
+    started_at = time.perf_counter()
+    result = get_bucket_objects_count_and_bytes(bucket_uri, engine=engine, parallelism=parallelism)
+    wall_time = time.perf_counter() - started_at
+    cpu_time = time.process_time() - cpu_started_at
+
+    if result is None:
+        raise RuntimeError(f"{engine} engine returned no result for {bucket_uri}")
+    if result["count"] != objects:
+        raise RuntimeError(f"{bucket_uri}: listed {result['count']} objects, expected {objects}")
+
+    print(json.dumps({
+        "provider": provider,
+        "objects": objects,
+        "engine": engine,
+        "parallelism": parallelism,
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "objects_per_second": objects / wall_time if wall_time > 0 else None,
+        # rclone talks to the provider from its own process
+        "api_calls": counter["requests"] if engine != "rclone" else None,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "bytes": result["bytes"],
+    }))
+
+
+def _run_case_subprocess(provider, endpoint, objects, engine, parallelism):
+    env = dict(os.environ, **provider_env(provider, endpoint))
+    env["HOME"] = str(RESULTS_DIR / "home")
+    command = [
+        sys.executable, __file__, "run_case",
+        f"--provider={provider}", f"--objects={objects}",
+        f"--engine={engine}", f"--parallelism={parallelism}",
+    ]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {
+            "provider": provider, "objects": objects, "engine": engine,
+            "parallelism": parallelism, "error": completed.stderr.strip().splitlines()[-1:],
+        }
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [item for item in str(value).split(",") if item]
+
+
+def run(providers="s3,minio", objects="10000,100000", parallelism="1,4,16", rclone=True, output=None):
+    """seed the stand-ins and benchmark every case
+
+    Args:
+        providers: comma separated, from s3, minio, az, gs
+        objects: comma separated object counts, e.g. 10000,100000,1000000,10000000
+        parallelism: comma separated sdk parallelism settings
+        rclone: also benchmark the rclone engine when rclone is installed
+        output: result file, defaults to benchmarks/results/<timestamp>.json
+
+    Stand-in endpoints come from `BENCH_S3_ENDPOINT`, `BENCH_MINIO_ENDPOINT`,
+    `BENCH_AZURE_CONNECTION_STRING` and `BENCH_GCS_EMULATOR_HOST`. Without
+    `BENCH_S3_ENDPOINT`/`BENCH_MINIO_ENDPOINT` a moto server is started and
+    shared by s3 and minio. Azurite and fake-gcs-server must be running, see
+    benchmarks/docker-compose.yml.
+    """
+    sys.path.insert(0, str(REPO_DIR))
+    from ying.cloud_storage_size.rclone import find_rclone
+
+    providers = _as_list(providers)
+    object_counts = [int(count) for count in _as_list(objects)]
+    parallelism_settings = [int(setting) for setting in _as_list(parallelism)]
+
+    moto_process = None
+    endpoints = {}
+    try:
+        for provider in providers:
+            if provider in ("s3", "minio"):
+                endpoint = os.environ.get(f"BENCH_{provider.upper()}_ENDPOINT")
+                if endpoint is None:
+                    if moto_process is None:
+                        moto_process, moto_endpoint = start_moto_server()
+                    endpoint = moto_endpoint
+            elif provider == "az":
+                endpoint = os.environ.get("BENCH_AZURE_CONNECTION_STRING", AZURITE_CONNECTION_STRING)
+                if not _is_listening(endpoint.split("BlobEndpoint=")[1].split(";")[0]):
+                    print("[az] Azurite is not running, skipped", file=sys.stderr)
+                    continue
+            elif provider == "gs":
+                endpoint = os.environ.get("BENCH_GCS_EMULATOR_HOST", "http://127.0.0.1:4443")
+                if not _is_listening(endpoint):
+                    print("[gs] fake-gcs-server is not running, skipped", file=sys.stderr)
+                    continue
+            else:
+                raise ValueError(f"unsupported provider {provider}")
+            endpoints[provider] = endpoint
+
+        results = []
+        for provider, endpoint in endpoints.items():
+            engines = [("sdk", setting) for setting in parallelism_settings]
+            if rclone and provider in ("s3", "az", "gs") and find_rclone() is not None:
+                engines.append(("rclone", 1))
+            for count in object_counts:
+                seed(provider, endpoint, count)
+                for engine, setting in engines:
+                    result = _run_case_subprocess(provider, endpoint, count, engine, setting)
+                    print(json.dumps(result), file=sys.stderr)
+                    results.append(result)
+    finally:
+        if moto_process is not None:
+            moto_process.terminate()
+
+    report = {"metadata": _metadata(), "results": results}
+    output = Path(output) if output else RESULTS_DIR / f"{datetime.now():%Y%m%dT%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(output)
+
+
+def _metadata():
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=REPO_DIR, capture_output=True, text=True
+            ).stdout.strip()
+        except OSError:
+            return None
+
+    return {
+        "created_at": datetime.now().isoformat(),
+        "git_revision": git("rev-parse", "HEAD"),
+        "git_describe": git("describe", "--always", "--dirty"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(baseline, candidate):
+    """print the objects/sec and peak RSS change of every case between two result files"""
+
+    def load(path):
+        report = json.loads(Path(path).read_text())
+        return {
+            (r["provider"], r["objects"], r["engine"], r["parallelism"]): r
+            for r in report["results"]
+            if "error" not in r
+        }
+
+    old, new = load(baseline), load(candidate)
+    print(f"{'case':<40} {'obj/s old':>12} {'obj/s new':>12} {'change':>8} {'rss MB new':>10}")
+    for key in sorted(old.keys() & new.keys()):
+        old_rate, new_rate = old[key]["objects_per_second"], new[key]["objects_per_second"]
+        case = "{}:{} {} p={}".format(*key)
+        print(
+            f"{case:<40} {old_rate:>12.0f} {new_rate:>12.0f} "
+            f"{(new_rate / old_rate - 1) * 100:>+7.1f}% {new[key]['peak_rss_kb'] / 1024:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "run_case": run_case, "compare": compare})
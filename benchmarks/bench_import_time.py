@@ -0,0 +1,110 @@
+"""import time benchmark of the ying entry points
+
+Every module is imported `repeat` times in a fresh interpreter with
+`python -X importtime`, and `ying --help` is timed end to end, minus the
+startup of a bare interpreter. The median is compared with a target, so a
+slow import sneaking back in shows up.
+
+    python benchmarks/bench_import_time.py run
+    python benchmarks/bench_import_time.py run --target_ms=200 --repeat=20
+    python benchmarks/bench_import_time.py top ying.plog
+"""
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import fire
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+REPO_DIR = BENCH_DIR.parent
+
+MODULES = ("ying", "ying.config", "ying.cli", "ying.cloud_storage_size", "ying.plog")
+
+
+def _env(home):
+    # an empty home, so no settings file or cached state changes what gets imported
+    return dict(os.environ, PYTHONPATH=str(REPO_DIR), HOME=home)
+
+
+def import_times(module, home):
+    """microseconds of every module imported by `import module`, {name: (self, cumulative)}"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_env(home),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def run_seconds(code, home):
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(_env(home), PAGER="cat"),
+        capture_output=True,
+        check=True,
+    )
+    return time.perf_counter() - started
+
+
+def top(module="ying.cli", limit=15):
+    """the modules taking the longest to import, by cumulative time"""
+    with tempfile.TemporaryDirectory() as home:
+        times = import_times(module, home)
+    for name, (self_us, cumulative_us) in sorted(times.items(), key=lambda item: -item[1][1])[:limit]:
+        print(f"{cumulative_us / 1000:8.1f} ms {self_us / 1000:8.1f} ms self  {name}")
+
+
+def run(repeat=10, target_ms=150, output=None):
+    """median import time of every entry point, and of `ying --help`
+
+    Exits with an error when `ying --help` takes `target_ms` longer than
+    starting a bare interpreter.
+    """
+    results = {"metadata": {"python": sys.version, "created_at": datetime.now().isoformat()}}
+    with tempfile.TemporaryDirectory() as home:
+        for module in MODULES:
+            samples = [import_times(module, home)[module][1] / 1000 for _ in range(repeat)]
+            results[module] = {"median_ms": statistics.median(samples), "samples_ms": samples}
+            print(f"import {module:<28} {results[module]['median_ms']:8.1f} ms")
+
+        help_code = "import sys; from ying.cli import main; sys.argv = ['ying', '--help']; main()"
+        for name, code in (("python -c pass", "pass"), ("ying --help", help_code)):
+            samples = [run_seconds(code, home) * 1000 for _ in range(repeat)]
+            results[name] = {"median_ms": statistics.median(samples), "samples_ms": samples}
+        overhead = results["ying --help"]["median_ms"] - results["python -c pass"]["median_ms"]
+        results["ying --help"]["overhead_ms"] = overhead
+        print(f"{'python -c pass':<35} {results['python -c pass']['median_ms']:8.1f} ms")
+        print(f"{'ying --help':<35} {results['ying --help']['median_ms']:8.1f} ms, "
+              f"{overhead:.1f} ms over the interpreter (target {target_ms} ms)")
+        created = sorted(str(path.relative_to(home)) for path in Path(home).rglob("*"))
+        if created:
+            print(f"files created under HOME: {created}")
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = Path(output) if output else RESULTS_DIR / f"import-time-{datetime.now():%Y%m%dT%H%M%S}.json"
+    output.write_text(json.dumps(results, indent=2))
+    print(f"results written to {output}")
+    if overhead > target_ms:
+        sys.exit(f"ying --help took {overhead:.1f} ms over the interpreter, the target is {target_ms} ms")
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "top": top})
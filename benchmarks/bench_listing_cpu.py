@@ -0,0 +1,260 @@
+"""CPU time per million listed objects, rich SDK objects against the lean listing
+
+The real `iter_pages_*` functions run against fake transports serving
+pre-built list pages shaped like the provider responses (every object
+property included, as the services send them unless asked otherwise), so
+only the client-side work is measured: request building, parsing and
+summing the sizes. No network or cloud account is involved.
+
+    python benchmarks/bench_listing_cpu.py run
+    python benchmarks/bench_listing_cpu.py run --objects=1000000 --providers=s3,gs,az
+"""
+import io
+import os
+import sys
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+import fire
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+S3_PAGE_SIZE = 1000
+GCS_PAGE_SIZE = 1000
+AZURE_PAGE_SIZE = 5000
+
+
+def object_key(i):
+    return f"shard{i % 16:02d}/dir{i % 7}/object-{i:09d}"
+
+
+def requests_response(body, content_type, status_code=200):
+    import requests
+
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers["Content-Type"] = content_type
+    response.headers["Content-Length"] = str(len(body))
+    response.raw = io.BytesIO(body)
+    response.encoding = "utf-8"
+    return response
+
+
+class PagedBucket(object):
+    """`objects` objects served `page_size` at a time, the page body is built once"""
+
+    def __init__(self, objects, page_size, render):
+        self.objects = objects
+        self.page_size = page_size
+        self.pages = (objects + page_size - 1) // page_size
+        self._render = render
+        self._bodies = {}
+
+    def page(self, token):
+        index = int(token) if token else 0
+        size = min(self.page_size, self.objects - index * self.page_size)
+        next_token = str(index + 1) if index + 1 < self.pages else None
+        if size not in self._bodies:
+            self._bodies[size] = self._render(size)
+        return self._bodies[size].replace(b"@NEXT@", (next_token or "").encode()), next_token
+
+
+def render_s3_page(size):
+    contents = "".join(
+        f"<Contents><Key>{object_key(i)}</Key><LastModified>2024-01-01T00:00:00.000Z</LastModified>"
+        f"<ETag>&quot;d41d8cd98f00b204e9800998ecf8427e&quot;</ETag><ChecksumAlgorithm>CRC64NVME</ChecksumAlgorithm>"
+        f"<ChecksumType>FULL_OBJECT</ChecksumType><Size>{i % 1024}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+        for i in range(size)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"><Name>bench</Name><Prefix></Prefix>'
+        f"<KeyCount>{size}</KeyCount><MaxKeys>1000</MaxKeys><IsTruncated>@TRUNCATED@</IsTruncated>"
+        f"<NextContinuationToken>@NEXT@</NextContinuationToken>{contents}</ListBucketResult>"
+    ).encode()
+
+
+def render_gcs_page(size, lean):
+    items = []
+    for i in range(size):
+        item = {"name": object_key(i), "size": str(i % 1024)}
+        if not lean:
+            item.update(
+                kind="storage#object",
+                id=f"bench/{object_key(i)}/1704067200000000",
+                selfLink=f"https://www.googleapis.com/storage/v1/b/bench/o/{object_key(i).replace('/', '%2F')}",
+                mediaLink=f"https://storage.googleapis.com/download/storage/v1/b/bench/o/{object_key(i)}?alt=media",
+                bucket="bench",
+                generation="1704067200000000",
+                metageneration="1",
+                contentType="application/octet-stream",
+                storageClass="STANDARD",
+                md5Hash="1B2M2Y8AsgTpgAmY7PhCfg==",
+                crc32c="AAAAAA==",
+                etag="CICA8ZPy/oIDEAE=",
+                timeCreated="2024-01-01T00:00:00.000Z",
+                updated="2024-01-01T00:00:00.000Z",
+                timeStorageClassUpdated="2024-01-01T00:00:00.000Z",
+            )
+        items.append(item)
+    return json.dumps({"kind": "storage#objects", "nextPageToken": "@NEXT@", "items": items}).encode()
+
+
+def render_azure_page(size):
+    blobs = "".join(
+        f"<Blob><Name>{object_key(i)}</Name><Properties><Creation-Time>Mon, 01 Jan 2024 00:00:00 GMT</Creation-Time>"
+        "<Last-Modified>Mon, 01 Jan 2024 00:00:00 GMT</Last-Modified><Etag>0x8DC0A5B7E6D3F21</Etag>"
+        f"<Content-Length>{i % 1024}</Content-Length><Content-Type>application/octet-stream</Content-Type>"
+        "<Content-Encoding /><Content-Language /><Content-CRC64 /><Content-MD5>1B2M2Y8AsgTpgAmY7PhCfg==</Content-MD5>"
+        "<Cache-Control /><Content-Disposition /><BlobType>BlockBlob</BlobType><AccessTier>Hot</AccessTier>"
+        "<AccessTierInferred>true</AccessTierInferred><LeaseStatus>unlocked</LeaseStatus>"
+        "<LeaseState>available</LeaseState><ServerEncrypted>true</ServerEncrypted></Properties><OrMetadata /></Blob>"
+        for i in range(size)
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><EnumerationResults ServiceEndpoint="http://127.0.0.1/bench/" '
+        f'ContainerName="bench"><MaxResults>{AZURE_PAGE_SIZE}</MaxResults><Blobs>{blobs}</Blobs>'
+        "<NextMarker>@NEXT@</NextMarker></EnumerationResults>"
+    ).encode()
+
+
+class FakeSession(object):
+    """`requests.Session` stand-in answering list requests from a PagedBucket"""
+
+    is_mtls = False
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = 0
+
+    def request(self, method, url, **kwargs):
+        self.requests += 1
+        query = {name: values[0] for name, values in parse_qs(urlparse(url).query).items()}
+        query.update(kwargs.get("params") or {})
+        return self.respond(query)
+
+    def mount(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+def s3_setup(objects, lean):
+    from botocore.awsrequest import AWSResponse
+    from ying.cloud_storage_size.clients import get_boto3_client
+
+    os.environ.update(AWS_ACCESS_KEY_ID="bench", AWS_SECRET_ACCESS_KEY="bench", AWS_DEFAULT_REGION="us-east-1")
+    bucket = PagedBucket(objects, S3_PAGE_SIZE, render_s3_page)
+
+    class Raw(object):
+        def __init__(self, body):
+            self.body = body
+
+        def stream(self, *args, **kwargs):
+            yield self.body
+
+    def before_send(request, **kwargs):
+        token = parse_qs(urlparse(request.url).query).get("continuation-token", [None])[0]
+        body, next_token = bucket.page(token)
+        body = body.replace(b"@TRUNCATED@", b"true" if next_token else b"false")
+        return AWSResponse(request.url, 200, {"x-amz-request-id": "bench"}, Raw(body))
+
+    client = get_boto3_client("s3", lean=lean)
+    client.meta.events.register("before-send.s3.ListObjectsV2", before_send)
+    return mock.patch("ying.cloud_storage_size.clients.get_boto3_client", return_value=client)
+
+
+def gs_setup(objects, lean):
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import storage
+
+    buckets = {
+        lean_body: PagedBucket(objects, GCS_PAGE_SIZE, lambda size, lean_body=lean_body: render_gcs_page(size, lean_body))
+        for lean_body in (False, True)
+    }
+
+    def respond(query):
+        # the JSON API only returns the requested fields
+        body, _ = buckets["fields" in query].page(query.get("pageToken"))
+        return requests_response(body.replace(b'"nextPageToken": "",', b""), "application/json")
+
+    client = storage.Client(project="bench", credentials=AnonymousCredentials(), _http=FakeSession(respond))
+    return mock.patch("ying.cloud_storage_size.clients.get_gcs_client", return_value=client)
+
+
+def az_setup(objects, lean):
+    from azure.core.pipeline.transport import RequestsTransport
+    from azure.storage.blob import BlobServiceClient
+
+    bucket = PagedBucket(objects, AZURE_PAGE_SIZE, render_azure_page)
+
+    def respond(query):
+        body, _ = bucket.page(query.get("marker"))
+        return requests_response(body.replace(b"<NextMarker></NextMarker>", b"<NextMarker />"), "application/xml")
+
+    connection_string = (
+        "DefaultEndpointsProtocol=http;AccountName=bench;"
+        "AccountKey=YmVuY2hiZW5jaGJlbmNoYmVuY2hiZW5jaGJlbmNoYmVuY2g=;BlobEndpoint=http://127.0.0.1/bench;"
+    )
+    client = BlobServiceClient.from_connection_string(
+        connection_string, transport=RequestsTransport(session=FakeSession(respond), session_owner=False)
+    )
+    return mock.patch("ying.cloud_storage_size.clients.get_azure_blob_service_client", return_value=client)
+
+
+SETUPS = {"s3": s3_setup, "gs": gs_setup, "az": az_setup}
+
+
+def measure(provider, objects, lean):
+    from ying.cloud_storage_size import list_object_count_and_bytes
+
+    iter_pages = list_object_count_and_bytes.PAGE_ITERATORS[provider]
+    with SETUPS[provider](objects, lean):
+        started = time.process_time()
+        total_bytes = 0
+        total_count = 0
+        for items, _ in iter_pages("bench", None, None, lean=lean):
+            total_bytes += sum(size for _, size in items)
+            total_count += len(items)
+        cpu_time = time.process_time() - started
+    if total_count != objects:
+        raise RuntimeError(f"{provider} listed {total_count} objects instead of {objects}")
+    return {
+        "provider": provider,
+        "mode": "lean" if lean else "rich",
+        "objects": objects,
+        "bytes": total_bytes,
+        "cpu_time": cpu_time,
+        "cpu_seconds_per_million": cpu_time * 1000000 / objects,
+    }
+
+
+def run(objects=200000, providers="s3,gs,az", output=None):
+    """CPU seconds per million objects of every provider, rich and lean"""
+    providers = providers.split(",") if isinstance(providers, str) else list(providers)
+    results = {"metadata": {"python": sys.version, "created_at": datetime.now().isoformat()}, "cases": []}
+    for provider in providers:
+        rich = measure(provider, objects, False)
+        lean = measure(provider, objects, True)
+        results["cases"] += [rich, lean]
+        print(
+            f"{provider:>3}: rich {rich['cpu_seconds_per_million']:7.2f}s, lean {lean['cpu_seconds_per_million']:7.2f}s"
+            f" per million objects, {rich['cpu_time'] / lean['cpu_time']:5.1f}x less CPU"
+        )
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = Path(output) if output else RESULTS_DIR / f"listing-cpu-{datetime.now():%Y%m%dT%H%M%S}.json"
+    output.write_text(json.dumps(results, indent=2))
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run})
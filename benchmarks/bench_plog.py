@@ -0,0 +1,141 @@
+"""throughput benchmark of the ying.plog pty relay
+
+A command writing `size` bytes runs natively (stdout to /dev/null), under a
+bare pty drained by a minimal read loop (the ceiling of any pty relay) and
+under `run_command` with Telegram replaced by a stub that takes `latency`
+seconds per call. Every case is measured in a fresh subprocess.
+
+    python benchmarks/bench_plog.py run --sizes=100M,1G,4G --latency=0.5
+    python benchmarks/bench_plog.py run --sizes=1G --session_log=False
+"""
+import os
+import sys
+import json
+import time
+import resource
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import fire
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+REPO_DIR = BENCH_DIR.parent
+
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(size):
+    size = str(size).upper()
+    if size[-1] in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1]])
+    return int(size)
+
+
+def output_command(size):
+    # 80 column lines with colors, like a chatty build
+    return f"yes $'\\033[32mok\\033[0m building target with a reasonably long line of output...' | head -c {size}"
+
+
+def run_case(size, relay="plog", latency=0.5, mode="a", session_log=True):
+    """run one case in this process and print its measures as JSON"""
+    command = output_command(parse_size(size))
+    calls = []
+    session_bytes = 0
+    started = time.perf_counter()
+    if relay == "native":
+        with open(os.devnull, "wb") as devnull:
+            subprocess.run(command, shell=True, stdout=devnull, executable="/bin/bash", check=True)
+    elif relay == "pty":
+        import pty
+
+        master_fd, slave_fd = pty.openpty()
+        process = subprocess.Popen(["/bin/bash", "-c", command], stdout=slave_fd, stderr=slave_fd)
+        os.close(slave_fd)
+        while True:
+            try:
+                if not os.read(master_fd, 65536):
+                    break
+            except OSError:
+                break
+        os.close(master_fd)
+        process.wait()
+    else:
+        import tempfile
+        from unittest import mock
+        import ying.plog
+        import ying.plog.session
+
+        def send(text, message_id):
+            calls.append(len(text))
+            time.sleep(latency)
+            return 1
+
+        devnull = open(os.devnull, "wb")
+        sessions = tempfile.TemporaryDirectory()
+        with mock.patch.object(ying.plog, "send_data_to_telegram", send), mock.patch.object(
+            ying.plog, "settings", {"tg_chat_id": 0, "plog_session_log": session_log}
+        ), mock.patch.object(ying.plog, "format_host_banner", lambda: "bench"), mock.patch.object(
+            ying.plog, "get_client"
+        ), mock.patch.object(
+            ying.plog.session, "sessions_dir", lambda: Path(sessions.name)
+        ), mock.patch(
+            "sys.stdout", mock.Mock(buffer=devnull)
+        ):
+            ying.plog.run_command(f"exec /bin/bash -c {json.dumps(command)}", mode)
+        session_bytes = sum(path.stat().st_size for path in Path(sessions.name).rglob("*") if path.is_file())
+        sessions.cleanup()
+    wall_time = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    print(
+        json.dumps(
+            {
+                "size": parse_size(size),
+                "relay": relay,
+                "latency": latency,
+                "mode": mode,
+                "wall_time": wall_time,
+                "relay_cpu_time": usage.ru_utime + usage.ru_stime,
+                "command_cpu_time": children.ru_utime + children.ru_stime,
+                "mb_per_second": parse_size(size) / wall_time / UNITS["M"],
+                "telegram_calls": len(calls),
+                "session_log_bytes": session_bytes,
+            }
+        )
+    )
+
+
+def run(sizes="100M,1G", latency=0.5, mode="a", session_log=True, output=None):
+    """measure every size natively, under a bare pty and under plog, and write the results
+
+    `session_log` records the plog output in a temporary session dir, as `ying plog` does by default.
+    """
+    sizes = sizes.split(",") if isinstance(sizes, str) else list(sizes)
+    results = []
+    for size in sizes:
+        for relay in ("native", "pty", "plog"):
+            completed = subprocess.run(
+                [sys.executable, __file__, "run_case", str(size), relay, str(latency), mode, str(session_log)],
+                cwd=REPO_DIR,
+                env=dict(os.environ, PYTHONPATH=str(REPO_DIR)),
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(
+                f"{size:>6} {relay:>6}: {result['wall_time']:8.2f}s {result['mb_per_second']:9.1f} MB/s"
+                f" relay cpu {result['relay_cpu_time']:6.2f}s telegram calls {result['telegram_calls']}"
+            )
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    output = Path(output) if output else RESULTS_DIR / f"plog-{datetime.now():%Y%m%dT%H%M%S}.json"
+    output.write_text(json.dumps(results, indent=2))
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "run_case": run_case})
@@ -1,8 +1,7 @@
 import os
 import logging
-from ying.cloud_storage_size import get_bucket_objects_count_and_bytes
+from ying.cloud_storage_size import get_many_bucket_objects_count_and_bytes, export_results
 from cloud_sheets_slim import CloudSheetsSlim
-from ying.utils import formatter
 import config
 
 logger = logging.getLogger(__name__)
@@ -20,28 +19,34 @@ def main():
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = google_service_account_json
     cloud_sheet = CloudSheetsSlim(google_sheets_url, googel_sheets_name)
 
-    rows = cloud_sheet.find({})
+    sheet = cloud_sheet.to_pdp().get_df()
 
-    bucket_uri_list = [row.get(cloud_storage_bucket_column_name, None) for row in rows]
+    bucket_uri_list = sheet[cloud_storage_bucket_column_name].tolist() if len(sheet) else []
 
-    filtered_bucket_uri_list = list(filter(lambda x: x is not None, bucket_uri_list))
+    filtered_bucket_uri_list = [uri for uri in bucket_uri_list if uri]
 
     logger.info(filtered_bucket_uri_list)
-    for bucket_uri in filtered_bucket_uri_list:
-        value = get_bucket_objects_count_and_bytes(
-            bucket_uri, project_id=google_project_id
-        )
-        logger.info(value)
-        cloud_sheet.update_one(
-            {cloud_storage_bucket_column_name: bucket_uri},
-            {
-                cloud_storage_bytes_column_name: formatter.human_readable_bytes(
-                    value["bytes"], decimal_places=4
-                ),
-                cloud_storage_count_column_name: value["count"],
-            },
-            upsert=True,
-        )
+
+    def update_sheet(table):
+        # every bucket updated in the sheet copy, then pushed in one write
+        valid = table["valid"]
+        sizes = dict(zip(table["bucket_uri"][valid].tolist(), table["bytes_human"][valid].tolist()))
+        counts = dict(zip(table["bucket_uri"][valid].tolist(), table["count"][valid].tolist()))
+        for bucket_uri, error in zip(table["bucket_uri"][~valid].tolist(), table["error"][~valid].tolist()):
+            logger.error("[bucket_uri: %s] %s", bucket_uri, error)
+        if not sizes:
+            return
+        updated = sheet[cloud_storage_bucket_column_name].isin(list(sizes))
+        buckets = sheet.loc[updated, cloud_storage_bucket_column_name]
+        sheet.loc[updated, cloud_storage_bytes_column_name] = buckets.map(sizes)
+        sheet.loc[updated, cloud_storage_count_column_name] = buckets.map(counts)
+        cloud_sheet.push_df(sheet)
+
+    export_results(
+        get_many_bucket_objects_count_and_bytes(filtered_bucket_uri_list, project_id=google_project_id),
+        update_sheet,
+        decimal_places=4,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+import unittest
+
+from ying.cloud_storage_size.breakdown import PrefixBreakdown
+
+
+class TestPrefixBreakdown(unittest.TestCase):
+    def test_to_dict_nests_prefixes_up_to_depth(self):
+        breakdown = PrefixBreakdown(depth=2)
+        breakdown.add_items(
+            [("a/b/1", 1), ("a/b/c/2", 2), ("a/3", 3), ("d/4", 4), ("root", 5)]
+        )
+        self.assertEqual(
+            breakdown.to_dict(),
+            {
+                "a/": {
+                    "bytes": 6,
+                    "count": 3,
+                    "prefixes": {"a/b/": {"bytes": 3, "count": 2, "prefixes": {}}},
+                },
+                "d/": {"bytes": 4, "count": 1, "prefixes": {}},
+            },
+        )
+
+    def test_empty_path_segments(self):
+        breakdown = PrefixBreakdown(depth=2)
+        breakdown.add("a//b", 1)
+        self.assertEqual(breakdown.to_dict()["a/"]["prefixes"]["a//"]["count"], 1)
+
+    def test_max_prefixes_truncates(self):
+        breakdown = PrefixBreakdown(depth=1, max_prefixes=2)
+        breakdown.add_items([("a/1", 1), ("b/1", 1), ("c/1", 1), ("a/2", 1)])
+        self.assertEqual(sorted(breakdown.counters), ["a/", "b/"])
+        self.assertEqual(breakdown.counters["a/"], [2, 2])
+        self.assertTrue(breakdown.truncated)
+
+    def test_state_round_trip(self):
+        breakdown = PrefixBreakdown(depth=3)
+        breakdown.add("x/y/z", 7)
+        restored = PrefixBreakdown.from_state(breakdown.state())
+        self.assertEqual(restored.to_dict(), breakdown.to_dict())
+
+
+if __name__ == "__main__":
+    unittest.main()
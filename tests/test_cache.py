@@ -0,0 +1,132 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+from ying.cloud_storage_size import get_bucket_objects_count_and_bytes
+from ying.cloud_storage_size.planner import DEFAULT_BUDGETS
+from ying.cloud_storage_size.cache import ResultCache, cache_key, get_known_count
+
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {"bytes": self.calls * 100, "count": self.calls}
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, "cache.sqlite3")
+
+    def test_fresh_hit(self):
+        cache = ResultCache(self.path, ttl=60)
+        compute = Counter()
+        self.assertEqual(cache.get_or_compute("sdk:s3://a", compute), {"bytes": 100, "count": 1})
+        self.assertEqual(cache.get_or_compute("sdk:s3://a", compute), {"bytes": 100, "count": 1})
+        self.assertEqual(compute.calls, 1)
+
+    def test_stale_while_revalidate(self):
+        cache = ResultCache(self.path, ttl=0.05, stale_ttl=60)
+        compute = Counter()
+        cache.get_or_compute("sdk:s3://a", compute)
+        time.sleep(0.1)
+        self.assertEqual(cache.get_or_compute("sdk:s3://a", compute), {"bytes": 100, "count": 1})
+        for _ in range(50):
+            if cache.get("sdk:s3://a")[0]["count"] == 2:
+                break
+            time.sleep(0.02)
+        self.assertEqual(cache.get("sdk:s3://a")[0], {"bytes": 200, "count": 2})
+
+    def test_expired_is_recomputed(self):
+        cache = ResultCache(self.path, ttl=0.05, stale_ttl=0)
+        compute = Counter()
+        cache.get_or_compute("sdk:s3://a", compute)
+        time.sleep(0.1)
+        self.assertEqual(cache.get_or_compute("sdk:s3://a", compute)["count"], 2)
+
+    def test_lru_eviction(self):
+        cache = ResultCache(self.path, max_entries=2)
+        cache.set("a", {"bytes": 1, "count": 1})
+        time.sleep(0.01)
+        cache.set("b", {"bytes": 2, "count": 2})
+        time.sleep(0.01)
+        cache.get("a")
+        time.sleep(0.01)
+        cache.set("c", {"bytes": 3, "count": 3})
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_metrics_miss_is_not_cached(self):
+        cache = ResultCache(self.path)
+        cache.get_or_compute("metrics:gs://a", lambda: {"bytes": -1, "count": -1})
+        self.assertIsNone(cache.get("metrics:gs://a"))
+
+    def test_get_latest_matches_keys_with_arguments(self):
+        cache = ResultCache(self.path)
+        cache.set("sdk:s3://a_b", {"bytes": 1, "count": 1})
+        time.sleep(0.01)
+        cache.set("sdk:s3://a?breakdown_depth=2", {"bytes": 2, "count": 2})
+        self.assertEqual(cache.get_latest("sdk:s3://a")[0]["count"], 2)
+        self.assertEqual(cache.get_latest("sdk:s3://a_b")[0]["count"], 1)
+        self.assertIsNone(cache.get_latest("sdk:s3://a_"))
+
+    def test_known_count_of_any_engine(self):
+        cache = ResultCache(self.path)
+        self.assertIsNone(get_known_count("s3://a", cache))
+        cache.set("sdk:s3://a", {"bytes": 1, "count": 1})
+        time.sleep(0.01)
+        cache.set("inventory:s3://a?inventory_manifest=s3%3A%2F%2Finv%2F", {"bytes": 5, "count": 5})
+        self.assertEqual(get_known_count("s3://a", cache), 5)
+        time.sleep(0.01)
+        cache.set("tracker:s3://a", {"bytes": 7, "count": 7})
+        self.assertEqual(get_known_count("s3://a", cache), 7)
+
+    def test_planner_reads_the_callers_cache(self):
+        cache = ResultCache(self.path)
+        cache.set("sdk:s3://a", {"bytes": 10**12, "count": 10**9})
+        with mock.patch("ying.cloud_storage_size.rclone.find_rclone", return_value=None), mock.patch(
+            "ying.cloud_storage_size.planner.run_hedged", return_value=("metrics", {"bytes": 1, "count": 1})
+        ) as run_hedged:
+            get_bucket_objects_count_and_bytes("s3://a", cache=cache)
+        plans = run_hedged.call_args[0][0]
+        self.assertEqual([plan.engine for plan in plans], ["metrics", "sdk"])
+        self.assertEqual(plans[1].start_after, DEFAULT_BUDGETS["hedge_after_large"])
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_result_affecting_arguments(self):
+        self.assertEqual(cache_key("sdk", "s3://a"), "sdk:s3://a")
+        self.assertEqual(cache_key("sdk", "s3://a", breakdown_depth=0, parallelism=8, resume=True), "sdk:s3://a")
+        self.assertEqual(cache_key("sdk", "s3://a", breakdown_depth=2), "sdk:s3://a?breakdown_depth=2")
+        self.assertEqual(
+            cache_key("metrics", "s3://a", region="eu-west-1", breakdown_depth=1),
+            "metrics:s3://a?breakdown_depth=1&region=eu-west-1",
+        )
+        self.assertNotEqual(
+            cache_key("inventory", "s3://a", inventory_manifest="s3://inv/1/"),
+            cache_key("inventory", "s3://a", inventory_manifest="s3://inv/2/"),
+        )
+
+    def test_queries_with_other_arguments_do_not_share_an_entry(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResultCache(os.path.join(tmp_dir, "cache.sqlite3"))
+            with mock.patch(
+                "ying.cloud_storage_size.inventory.query_inventory",
+                side_effect=lambda manifest, depth: {"bytes": len(manifest), "count": 1},
+            ) as query_inventory:
+                for manifest in ("s3://inv/a/", "s3://inv/bb/", "s3://inv/a/"):
+                    get_bucket_objects_count_and_bytes(
+                        "s3://bkt", engine="inventory", inventory_manifest=manifest, cache=cache
+                    )
+            self.assertEqual(query_inventory.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ying.cloud_storage_size import checkpoint
+from ying.cloud_storage_size.list_object_count_and_bytes import count_pages
+
+
+def make_pages(page_count, page_size=10, fail_at=None):
+    """fake listing, page n holds `page_size` objects of n bytes"""
+
+    def iter_pages(page_token):
+        start = int(page_token) if page_token else 0
+        for n in range(start, page_count):
+            if n == fail_at:
+                raise RuntimeError("listing interrupted")
+            items = [(f"{n}/{i}", n) for i in range(page_size)]
+            next_page_token = str(n + 1) if n + 1 < page_count else None
+            yield items, next_page_token
+
+    return iter_pages
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(checkpoint, "checkpoint_dir", Path(self.tmp_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def test_count_pages_without_resume(self):
+        result = count_pages(make_pages(5), "s3", "bucket")
+        self.assertEqual(result, {"bytes": 100, "count": 50})
+        self.assertIsNone(checkpoint.load_checkpoint("s3", "bucket"))
+
+    def test_count_pages_resume_after_failure(self):
+        with self.assertRaises(RuntimeError):
+            count_pages(make_pages(10, fail_at=7), "s3", "bucket", resume=True, checkpoint_every=2)
+
+        state = checkpoint.load_checkpoint("s3", "bucket")
+        self.assertEqual(state["token"], "6")
+        self.assertEqual(state["pages"], 6)
+        self.assertEqual(state["count"], 60)
+
+        result = count_pages(make_pages(10), "s3", "bucket", resume=True, checkpoint_every=2)
+        self.assertEqual(result, {"bytes": 450, "count": 100})
+        self.assertIsNone(checkpoint.load_checkpoint("s3", "bucket"))
+
+    def test_checkpoint_of_other_breakdown_depth_is_discarded(self):
+        with self.assertRaises(RuntimeError):
+            count_pages(make_pages(10, fail_at=7), "s3", "bucket", resume=True, checkpoint_every=2)
+        self.assertEqual(checkpoint.load_checkpoint("s3", "bucket")["breakdown_depth"], 0)
+
+        result = count_pages(make_pages(10), "s3", "bucket", resume=True, breakdown_depth=1, checkpoint_every=2)
+        self.assertEqual(result["bytes"], 450)
+        self.assertEqual(sum(node["count"] for node in result["breakdown"].values()), 100)
+        self.assertIsNone(checkpoint.load_checkpoint("s3", "bucket"))
+
+    def test_checkpoint_keeps_breakdown(self):
+        with self.assertRaises(RuntimeError):
+            count_pages(make_pages(10, fail_at=7), "s3", "bucket", resume=True, breakdown_depth=1, checkpoint_every=2)
+        self.assertEqual(checkpoint.load_checkpoint("s3", "bucket")["breakdown_depth"], 1)
+
+        result = count_pages(make_pages(10), "s3", "bucket", resume=True, breakdown_depth=1, checkpoint_every=2)
+        self.assertEqual(result["count"], 100)
+        self.assertEqual(sum(node["count"] for node in result["breakdown"].values()), 100)
+
+    def test_checkpoint_is_keyed_by_prefix(self):
+        checkpoint.save_checkpoint("gs", "bucket", "a/", "token", 1, 1, 1)
+        self.assertIsNone(checkpoint.load_checkpoint("gs", "bucket", "b/"))
+        self.assertEqual(checkpoint.load_checkpoint("gs", "bucket", "a/")["token"], "token")
+
+
+if __name__ == "__main__":
+    unittest.main()
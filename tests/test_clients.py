@@ -0,0 +1,95 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+from ying.cloud_storage_size import clients
+
+
+class TestClientRegistry(unittest.TestCase):
+    def setUp(self):
+        clients.clear_clients()
+        self.addCleanup(clients.clear_clients)
+
+    def test_reuse_and_clear(self):
+        factory = mock.Mock(side_effect=lambda: object())
+        client = clients.get_or_create_client(("x", "", "1"), factory)
+        self.assertIs(clients.get_or_create_client(("x", "", "1"), factory), client)
+        self.assertEqual(factory.call_count, 1)
+
+        clients.clear_clients()
+        self.assertIsNot(clients.get_or_create_client(("x", "", "1"), factory), client)
+        self.assertEqual(factory.call_count, 2)
+
+    def test_slow_factory_does_not_block_other_keys(self):
+        release = threading.Event()
+        entered = threading.Event()
+
+        def slow():
+            entered.set()
+            release.wait(5)
+            return "slow"
+
+        thread = threading.Thread(target=clients.get_or_create_client, args=(("slow", "", ""), slow))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        self.assertTrue(entered.wait(5))
+        self.assertEqual(clients.get_or_create_client(("fast", "", ""), lambda: "fast"), "fast")
+        release.set()
+        thread.join(5)
+        self.assertEqual(clients.get_or_create_client(("slow", "", ""), lambda: "other"), "slow")
+
+    def test_racing_creations_keep_the_first_client(self):
+        barrier = threading.Barrier(4)
+        results = []
+
+        def create():
+            barrier.wait(5)
+            return object()
+
+        def get():
+            results.append(clients.get_or_create_client(("race", "", ""), create))
+
+        threads = [threading.Thread(target=get) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+
+
+class TestBoto3Clients(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(
+            os.environ, {"AWS_ACCESS_KEY_ID": "first", "AWS_SECRET_ACCESS_KEY": "test", "AWS_DEFAULT_REGION": "us-east-1"}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        clients.clear_clients()
+        self.addCleanup(clients.clear_clients)
+
+    def test_keyed_by_credentials_region_and_lean(self):
+        s3 = clients.get_boto3_client("s3")
+        self.assertIs(clients.get_boto3_client("s3"), s3)
+        self.assertIsNot(clients.get_boto3_client("s3", lean=True), s3)
+        self.assertIs(clients.get_boto3_client("s3", lean=True), clients.get_boto3_client("s3", lean=True))
+        self.assertIsNot(clients.get_boto3_client("s3", region="eu-west-1"), s3)
+        self.assertIsNot(clients.get_boto3_client("cloudwatch"), s3)
+
+        with mock.patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "rotated"}):
+            rotated = clients.get_boto3_client("s3")
+        self.assertIsNot(rotated, s3)
+        self.assertIs(clients.get_boto3_client("s3"), s3)
+
+    def test_fingerprint_hides_secrets(self):
+        digest = clients.fingerprint("profile", "secret-key-id")
+        self.assertEqual(digest, clients.fingerprint("profile", "secret-key-id"))
+        self.assertNotEqual(digest, clients.fingerprint("profile", "other-key-id"))
+        self.assertNotIn("secret", digest)
+        self.assertEqual(len(digest), 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
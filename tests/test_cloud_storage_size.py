@@ -1,5 +1,13 @@
+import time
 import unittest
-from ying.cloud_storage_size import get_bucket_objects_count_and_bytes
+import threading
+from unittest import mock
+from ying.cloud_storage_size import (
+    get_bucket_objects_count_and_bytes,
+    get_many_bucket_objects_count_and_bytes,
+    iter_object_count_and_bytes,
+)
+from ying.cloud_storage_size.list_object_count_and_bytes import PAGE_ITERATORS
 
 from dotenv import load_dotenv
 
@@ -14,6 +22,62 @@ class TestCloudStorageSize(unittest.TestCase):
         self.assertIn("bytes", result)
         self.assertIn("count", result)
 
+    def test_get_many_bucket_objects_count_and_bytes_isolates_errors(self):
+        bucket_uris = ["foo://bucket-a", "bar://bucket-b"]
+        results = list(
+            get_many_bucket_objects_count_and_bytes(bucket_uris, max_concurrency=2, engine="sdk")
+        )
+        self.assertEqual(sorted(r["bucket_uri"] for r in results), sorted(bucket_uris))
+        for r in results:
+            self.assertIsNone(r["result"])
+            self.assertIn("unsupported scheme", r["error"])
+
+    def test_get_many_bucket_objects_count_and_bytes_cancels_timed_out_buckets(self):
+        slow_pages = []
+        slow_stopped = threading.Event()
+
+        def iter_pages(bucket_name, prefix=None, page_token=None):
+            if bucket_name == "fast":
+                yield [("a", 10)], None
+                return
+            try:
+                while True:
+                    slow_pages.append(time.monotonic())
+                    time.sleep(0.01)
+                    yield [("b", 1)], "next"
+            finally:
+                slow_stopped.set()
+
+        with mock.patch("ying.cloud_storage_size.list_object_count_and_bytes.iter_pages_s3", iter_pages):
+            results = list(
+                get_many_bucket_objects_count_and_bytes(
+                    ["s3://fast", "s3://slow", "s3://fast"], per_bucket_timeout=0.2, engine="sdk"
+                )
+            )
+            self.assertTrue(slow_stopped.wait(5))
+
+        by_uri = {r["bucket_uri"]: r for r in results}
+        self.assertEqual(len(results), 2)
+        self.assertEqual(by_uri["s3://fast"]["result"], {"bytes": 10, "count": 1})
+        self.assertIsNone(by_uri["s3://slow"]["result"])
+        self.assertIn("timed out", by_uri["s3://slow"]["error"])
+        pages = len(slow_pages)
+        time.sleep(0.1)
+        self.assertEqual(len(slow_pages), pages)
+
+    def test_iter_object_count_and_bytes(self):
+        def iter_pages(bucket_name, prefix=None, page_token=None):
+            self.assertEqual((bucket_name, prefix), ("bucket", "logs/"))
+            for n in range(5):
+                yield [(f"logs/{n}", 10)] * 2, str(n + 1)
+
+        with mock.patch.dict(PAGE_ITERATORS, {"s3": iter_pages}):
+            progress = list(iter_object_count_and_bytes("s3://bucket/logs/", every_pages=2))
+
+        self.assertEqual([p["pages"] for p in progress], [2, 4, 5])
+        self.assertEqual([p["done"] for p in progress], [False, False, True])
+        self.assertEqual((progress[-1]["bytes"], progress[-1]["count"]), (100, 10))
+
 
 if __name__ == "__main__":
     unittest.main()
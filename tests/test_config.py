@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+class TestLazyImports(unittest.TestCase):
+    def run_python(self, code, home):
+        completed = subprocess.run(
+            [sys.executable, "-c", code],
+            env=dict(os.environ, PYTHONPATH=str(REPO_DIR), HOME=home),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return completed.stdout
+
+    def test_import_has_no_side_effects(self):
+        with tempfile.TemporaryDirectory() as home:
+            loaded = json.loads(
+                self.run_python(
+                    "import sys, json, ying.cli, ying.cloud_storage_size;"
+                    "print(json.dumps(sorted(m for m in ('dynaconf', 'requests', 'ying.plog', 'sqlite3')"
+                    " if m in sys.modules)))",
+                    home,
+                )
+            )
+            self.assertEqual(loaded, [])
+            self.assertEqual(os.listdir(home), [])
+
+    def test_settings_and_lazy_attributes(self):
+        with tempfile.TemporaryDirectory() as home:
+            output = self.run_python(
+                "import os; os.environ['YING_TG_CHAT_ID'] = '42';"
+                "from ying.config import settings; import ying.cloud_storage_size as csz;"
+                "print(settings.get('tg_chat_id'), csz.ResultCache.__name__, 'query_inventory' in dir(csz))",
+                home,
+            )
+            self.assertEqual(output.split(), ["42", "ResultCache", "True"])
+
+
+if __name__ == "__main__":
+    unittest.main()
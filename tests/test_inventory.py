@@ -0,0 +1,112 @@
+import os
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+from ying.cloud_storage_size.inventory import query_inventory
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+OBJECTS = [("a/b/1", 1), ("a/b%2Fc/2", 2), ("a/3", 3), ("d/4", 4), ("root", 5)]
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestQueryInventory(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_s3_csv_inventory(self):
+        # <destination>/<bucket>/<config>/<date>/manifest.json and <config>/data/*.csv.gz
+        config_dir = os.path.join(self.root, "bkt", "daily")
+        os.makedirs(os.path.join(config_dir, "data"))
+        keys = []
+        for index, objects in enumerate([OBJECTS[:2], OBJECTS[2:]]):
+            key = f"bkt/daily/data/{index}.csv.gz"
+            with gzip.open(os.path.join(config_dir, "data", f"{index}.csv.gz"), "wt", newline="") as f:
+                csv.writer(f).writerows(("bkt", name, size, "2024-01-01T00:00:00.000Z") for name, size in objects)
+            keys.append({"key": key})
+        for date in ("2024-01-01T01-00Z", "2024-01-02T01-00Z"):
+            os.makedirs(os.path.join(config_dir, date))
+            with open(os.path.join(config_dir, date, "manifest.json"), "w") as f:
+                json.dump(
+                    {
+                        "sourceBucket": "bkt",
+                        "destinationBucket": "arn:aws:s3:::inventory",
+                        "fileFormat": "CSV",
+                        "fileSchema": "Bucket, Key, Size, LastModifiedDate",
+                        "files": keys,
+                    },
+                    f,
+                )
+        return os.path.join(config_dir, "2024-01-02T01-00Z", "manifest.json")
+
+    def test_s3_csv(self):
+        manifest = self.write_s3_csv_inventory()
+        self.assertEqual(query_inventory(manifest), {"bytes": 15, "count": 5})
+
+    def test_latest_manifest_below_prefix(self):
+        self.write_s3_csv_inventory()
+        self.assertEqual(query_inventory(self.root + "/")["count"], 5)
+
+    def test_s3_csv_breakdown_unquotes_prefixes(self):
+        result = query_inventory(self.write_s3_csv_inventory(), breakdown_depth=2)
+        self.assertEqual(
+            result["breakdown"],
+            {
+                "a/": {
+                    "bytes": 6,
+                    "count": 3,
+                    "prefixes": {
+                        "a/b/": {"bytes": 3, "count": 2, "prefixes": {}},
+                    },
+                },
+                "d/": {"bytes": 4, "count": 1, "prefixes": {}},
+            },
+        )
+        self.assertFalse(result["breakdown_truncated"])
+
+    def test_gcs_parquet(self):
+        import pyarrow.parquet as pq
+
+        names = []
+        for index, objects in enumerate([OBJECTS[:3], OBJECTS[3:]]):
+            name = f"report_{index}.parquet"
+            pq.write_table(
+                pyarrow.table(
+                    {
+                        "bucket": ["bkt"] * len(objects),
+                        "name": [name for name, _ in objects],
+                        "size": [size for _, size in objects],
+                    }
+                ),
+                os.path.join(self.root, name),
+            )
+            names.append(name)
+        manifest = os.path.join(self.root, "report_manifest.json")
+        with open(manifest, "w") as f:
+            json.dump(
+                {
+                    "report_config": {"parquetOptions": {}},
+                    "records_processed": 5,
+                    "report_shards_file_names": names,
+                },
+                f,
+            )
+
+        result = query_inventory(manifest, breakdown_depth=1)
+        self.assertEqual((result["bytes"], result["count"]), (15, 5))
+        self.assertEqual(result["breakdown"]["a/"]["count"], 3)
+        self.assertEqual(result["breakdown"]["a/"]["prefixes"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
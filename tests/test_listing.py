@@ -0,0 +1,228 @@
+import io
+import os
+import json
+import unittest
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+from ying.cloud_storage_size import clients
+from ying.cloud_storage_size.list_object_count_and_bytes import (
+    iter_pages_s3,
+    iter_pages_gs,
+    iter_pages_az,
+    use_lean_listing,
+)
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+@unittest.skipIf(mock_aws is None, "moto is not installed")
+class TestLeanS3Listing(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(
+            os.environ, {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test", "AWS_DEFAULT_REGION": "us-east-1"}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        clients.clear_clients()
+        self.addCleanup(clients.clear_clients)
+
+        s3 = clients.get_boto3_client("s3")
+        s3.create_bucket(Bucket="bkt")
+        for i in range(1234):
+            s3.put_object(Bucket="bkt", Key=f"dir{i % 3}/object-{i:04d}", Body=b"x" * (i % 17))
+
+    def test_lean_matches_rich(self):
+        rich = list(iter_pages_s3("bkt", lean=False))
+        lean = list(iter_pages_s3("bkt", lean=True))
+        self.assertEqual(lean, rich)
+        self.assertEqual(len(lean), 2)
+        self.assertIsNotNone(lean[0][1])
+        self.assertIsNone(lean[1][1])
+        self.assertEqual(sum(size for page, _ in lean for _, size in page), sum(i % 17 for i in range(1234)))
+
+    def test_lean_prefix_and_resume(self):
+        pages = list(iter_pages_s3("bkt", "dir1/", lean=True))
+        self.assertEqual(sum(len(page) for page, _ in pages), 411)
+        self.assertTrue(all(key.startswith("dir1/") for page, _ in pages for key, _ in page))
+
+        first = list(iter_pages_s3("bkt", lean=True))
+        resumed = list(iter_pages_s3("bkt", page_token=first[0][1], lean=True))
+        self.assertEqual(resumed, first[1:])
+
+    def test_lean_decodes_keys(self):
+        s3 = clients.get_boto3_client("s3")
+        keys = ["my file.txt", "dir é/x", "a+b/c", "100%/d", "q?&=/e", "日本/語"]
+        for key in keys:
+            s3.put_object(Bucket="bkt", Key=key, Body=b"y" * 10)
+        rich = list(iter_pages_s3("bkt", lean=False))
+        lean = list(iter_pages_s3("bkt", lean=True))
+        self.assertEqual(lean, rich)
+        listed = {key for page, _ in lean for key, _ in page}
+        self.assertTrue(set(keys) <= listed)
+        for prefix in ("dir é/", "a+b/", "100%/"):
+            self.assertEqual(
+                list(iter_pages_s3("bkt", prefix, lean=True)), list(iter_pages_s3("bkt", prefix, lean=False))
+            )
+        response = clients.get_boto3_client("s3", lean=True).list_objects_v2(Bucket="bkt", Prefix="a+b/")
+        self.assertEqual(response["Prefix"], "a+b/")
+
+    def test_lean_seeded_tracker_applies_deletes(self):
+        import tempfile
+        from ying.cloud_storage_size import list_object_count_and_bytes
+        from ying.cloud_storage_size.tracker import SizeTracker, ObjectEvent, DELETED
+
+        s3 = clients.get_boto3_client("s3")
+        s3.create_bucket(Bucket="small")
+        s3.put_object(Bucket="small", Key="my+file.txt", Body=b"z" * 10)
+        with tempfile.TemporaryDirectory() as root, mock.patch.object(
+            list_object_count_and_bytes, "use_lean_listing", return_value=True
+        ):
+            tracker = SizeTracker("s3://small", os.path.join(root, "tracker.sqlite3"))
+            self.assertEqual(tracker.seed(keys=True), {"bytes": 10, "count": 1})
+            event = ObjectEvent("s3://small", "my+file.txt", DELETED, None, "99", None, None)
+            self.assertEqual(tracker.apply([event]), 1)
+            self.assertEqual((tracker.get()["bytes"], tracker.get()["count"]), (0, 0))
+
+    def test_lean_is_opt_in(self):
+        self.assertFalse(use_lean_listing())
+        self.assertTrue(use_lean_listing(True))
+
+    def test_lean_client_parses_other_operations(self):
+        s3 = clients.get_boto3_client("s3", lean=True)
+        self.assertIsNot(s3, clients.get_boto3_client("s3"))
+        head = s3.head_object(Bucket="bkt", Key="dir0/object-0003")
+        self.assertEqual(head["ContentLength"], 3)
+        self.assertEqual(s3.list_objects_v2(Bucket="bkt", Prefix="missing/")["KeyCount"], 0)
+
+
+class FakeHTTP(object):
+    is_mtls = False
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.queries = []
+
+    def request(self, method, url, **kwargs):
+        import requests
+
+        query = {name: values[0] for name, values in parse_qs(urlparse(url).query).items()}
+        self.queries.append(query)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(self.pages[int(query.get("pageToken", 0))]).encode()
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+
+class TestLeanGCSListing(unittest.TestCase):
+    def setUp(self):
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import storage
+
+        self.http = FakeHTTP(
+            [
+                {"items": [{"name": "a", "size": "1"}, {"name": "b/c", "size": "20"}], "nextPageToken": "1"},
+                {"items": [{"name": "d", "size": "300"}]},
+            ]
+        )
+        client = storage.Client(project="test", credentials=AnonymousCredentials(), _http=self.http)
+        patcher = mock.patch.object(clients, "get_gcs_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lean_requests_names_and_sizes(self):
+        pages = list(iter_pages_gs("bkt", "b", lean=True))
+        self.assertEqual(pages, [([("a", 1), ("b/c", 20)], "1"), ([("d", 300)], None)])
+        self.assertEqual(self.http.queries[0]["fields"], "items(name,size),nextPageToken")
+        self.assertEqual(self.http.queries[0]["prefix"], "b")
+        self.assertNotIn("pageToken", self.http.queries[0])
+        self.assertEqual(self.http.queries[1]["pageToken"], "1")
+
+    def test_lean_matches_rich(self):
+        self.assertEqual(list(iter_pages_gs("bkt", lean=True)), list(iter_pages_gs("bkt", lean=False)))
+
+
+def azure_page(blobs, next_marker):
+    blobs = "".join(
+        f"<Blob>{name if name.startswith('<Name') else f'<Name>{name}</Name>'}<Properties><Last-Modified>Mon, 01 Jan 2024 00:00:00 GMT</Last-Modified>"
+        f"<Etag>0x1</Etag><Content-Length>{size}</Content-Length><BlobType>BlockBlob</BlobType></Properties></Blob>"
+        for name, size in blobs
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><EnumerationResults ServiceEndpoint="http://127.0.0.1/acc/" '
+        f'ContainerName="bkt"><Blobs>{blobs}</Blobs><NextMarker>{next_marker}</NextMarker></EnumerationResults>'
+    ).encode()
+
+
+class FakeAzureSession(object):
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        import requests
+
+        query = {name: values[0] for name, values in parse_qs(urlparse(url).query).items()}
+        self.requests.append((query, kwargs.get("headers") or {}))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.pages[int(query.get("marker", 0))]
+        response.headers["Content-Type"] = "application/xml"
+        response.raw = io.BytesIO(response._content)
+        return response
+
+    def mount(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestLeanAzureListing(unittest.TestCase):
+    def setUp(self):
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.storage.blob import BlobServiceClient
+
+        self.session = FakeAzureSession(
+            [azure_page([("a", 1), ("b/c", 20)], "1"), azure_page([("d", 300)], "")]
+        )
+        service = BlobServiceClient.from_connection_string(
+            "DefaultEndpointsProtocol=http;AccountName=acc;AccountKey=YWNjb3VudGtleQ==;BlobEndpoint=http://127.0.0.1/acc;",
+            transport=RequestsTransport(session=self.session, session_owner=False),
+        )
+        patcher = mock.patch.object(clients, "get_azure_blob_service_client", return_value=service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lean_reads_names_and_sizes(self):
+        pages = list(iter_pages_az("bkt", "b", lean=True))
+        self.assertEqual(pages, [([("a", 1), ("b/c", 20)], "1"), ([("d", 300)], None)])
+        query, headers = self.session.requests[0]
+        self.assertEqual(query["comp"], "list")
+        self.assertEqual(query["maxresults"], "5000")
+        self.assertEqual(query["prefix"], "b")
+        self.assertIn("x-ms-version", headers)
+        self.assertTrue(headers["Authorization"].startswith("SharedKey acc:"))
+        self.assertEqual(self.session.requests[1][0]["marker"], "1")
+
+    def test_lean_matches_rich(self):
+        self.assertEqual(list(iter_pages_az("bkt", lean=True)), list(iter_pages_az("bkt", lean=False)))
+
+    def test_lean_decodes_encoded_names(self):
+        self.session.pages = [
+            azure_page([('<Name Encoded="true">bad%EF%BF%BEname%0C</Name>', 5), ("plain%20name", 6)], "")
+        ]
+        pages = list(iter_pages_az("bkt", lean=True))
+        self.assertEqual(pages, [([("bad\ufffename\x0c", 5), ("plain%20name", 6)], None)])
+        self.assertEqual(pages, list(iter_pages_az("bkt", lean=False)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import time
+import threading
+import unittest
+
+from ying.cloud_storage_size.planner import (
+    EnginePlan,
+    plan_engines,
+    run_hedged,
+    run_cancellable,
+    raise_if_cancelled,
+    ScanCancelled,
+    DEFAULT_BUDGETS,
+)
+
+
+def is_valid(answer):
+    return answer is not None and answer["count"] >= 0
+
+
+class TestPlanEngines(unittest.TestCase):
+    def test_metrics_hedged_by_listing(self):
+        plans = plan_engines(has_metrics=True, has_rclone=True, budgets=DEFAULT_BUDGETS)
+        self.assertEqual(
+            plans,
+            [
+                EnginePlan("metrics", 0, 30),
+                EnginePlan("rclone", 5, None),
+                EnginePlan("sdk", None, None),
+            ],
+        )
+
+    def test_known_bucket_size_moves_the_hedge(self):
+        small = plan_engines(True, False, known_count=10, budgets=DEFAULT_BUDGETS)
+        large = plan_engines(True, False, known_count=10**9, budgets=DEFAULT_BUDGETS)
+        self.assertEqual(small[1].start_after, 0)
+        self.assertEqual(large[1].start_after, DEFAULT_BUDGETS["hedge_after_large"])
+
+    def test_without_metrics_listing_starts_at_once(self):
+        self.assertEqual(plan_engines(False, False), [EnginePlan("sdk", 0, None)])
+
+
+class TestRunHedged(unittest.TestCase):
+    def test_hedge_answers_before_slow_metrics(self):
+        metrics_cancelled = threading.Event()
+
+        def run_engine(engine, deadline):
+            if engine == "metrics":
+                for _ in range(100):
+                    time.sleep(0.01)
+                    try:
+                        raise_if_cancelled()
+                    except ScanCancelled:
+                        metrics_cancelled.set()
+                        raise
+                return {"bytes": 1, "count": 1}
+            return {"bytes": 2, "count": 2}
+
+        plans = [EnginePlan("metrics", 0, None), EnginePlan("sdk", 0.05, None)]
+        self.assertEqual(run_hedged(plans, run_engine, is_valid), ("sdk", {"bytes": 2, "count": 2}))
+        self.assertTrue(metrics_cancelled.wait(1))
+
+    def test_metrics_miss_falls_back_immediately(self):
+        def run_engine(engine, deadline):
+            if engine == "metrics":
+                return {"bytes": -1, "count": -1}
+            return {"bytes": 3, "count": 3}
+
+        plans = [EnginePlan("metrics", 0, None), EnginePlan("sdk", 60, None)]
+        started_at = time.monotonic()
+        self.assertEqual(run_hedged(plans, run_engine, is_valid)[0], "sdk")
+        self.assertLess(time.monotonic() - started_at, 5)
+
+    def test_deadline_and_fallback(self):
+        def run_engine(engine, deadline):
+            if engine == "rclone":
+                time.sleep(1)
+                return {"bytes": 1, "count": 1}
+            return {"bytes": 4, "count": 4}
+
+        plans = [EnginePlan("rclone", 0, 0.05), EnginePlan("sdk", None, None)]
+        self.assertEqual(run_hedged(plans, run_engine, is_valid)[0], "sdk")
+
+    def test_no_answer(self):
+        def run_engine(engine, deadline):
+            raise RuntimeError("unavailable")
+
+        self.assertEqual(run_hedged([EnginePlan("sdk", 0, None)], run_engine, is_valid), (None, None))
+
+    def test_caller_cancel_reaches_the_engines(self):
+        caller_event = threading.Event()
+        engine_cancelled = threading.Event()
+
+        def run_engine(engine, deadline):
+            caller_event.set()
+            for _ in range(100):
+                time.sleep(0.01)
+                try:
+                    raise_if_cancelled()
+                except ScanCancelled:
+                    engine_cancelled.set()
+                    raise
+            return {"bytes": 1, "count": 1}
+
+        plans = [EnginePlan("sdk", 0, None)]
+        with self.assertRaises(ScanCancelled):
+            run_cancellable(caller_event, run_hedged, plans, run_engine, is_valid)
+        self.assertTrue(engine_cancelled.wait(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
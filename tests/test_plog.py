@@ -0,0 +1,86 @@
+import io
+import os
+import pty
+import time
+import threading
+import unittest
+import subprocess
+from unittest import mock
+
+import ying.plog
+from ying.plog import TelegramReporter, PrefixedWriter, relay, run_command, run_commands
+
+
+class TestPlog(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.latency = 0
+        patcher = mock.patch.object(ying.plog, "send_data_to_telegram", side_effect=self.send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ying.plog, "settings", {"tg_chat_id": 1, "plog_session_log": False})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ying.plog, "format_host_banner", return_value="me@host")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ying.plog, "get_client")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, text, message_id):
+        time.sleep(self.latency)
+        self.sent.append(text)
+        return 1
+
+    def spawn(self, command):
+        master_fd, slave_fd = pty.openpty()
+        process = subprocess.Popen(command, shell=True, stdout=slave_fd, stderr=slave_fd)
+        os.close(slave_fd)
+        self.addCleanup(os.close, master_fd)
+        return master_fd, process
+
+    def test_relay_copies_all_output(self):
+        master_fd, process = self.spawn("head -c 1000000 /dev/zero | tr '\\0' x")
+        out = io.BytesIO()
+        chunks = []
+        relay(master_fd, process, chunks.append, out)
+        process.wait()
+        self.assertEqual(out.getvalue(), b"x" * 1000000)
+        self.assertEqual(b"".join(chunks), out.getvalue())
+
+    def test_relay_does_not_wait_for_telegram(self):
+        self.latency = 1
+        reporter = TelegramReporter("cmd", "me@host", mode="r")
+        reporter.interval = 0.01
+        reporter.start()
+        self.addCleanup(reporter.close)
+        master_fd, process = self.spawn("for i in 1 2 3 4 5; do echo $i; sleep 0.05; done")
+        started = time.monotonic()
+        relay(master_fd, process, reporter.feed, io.BytesIO())
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_run_command_reports_last_output(self):
+        with mock.patch("sys.stdout", mock.Mock(buffer=io.BytesIO())):
+            self.assertEqual(run_command("echo hello; echo world", mode="a"), 0)
+        self.assertIn("hello\nworld", self.sent[-1])
+        self.assertIn("$ `echo hello; echo world`", self.sent[-1])
+
+    def test_run_commands_reports_every_command(self):
+        out = io.BytesIO()
+        with mock.patch("sys.stdout", mock.Mock(buffer=out)):
+            self.assertEqual(run_commands(["echo one", "echo two; exit 3"], mode="r"), [0, 3])
+        self.assertEqual(sorted(out.getvalue().splitlines()), [b"[0] one", b"[1] two"])
+        self.assertTrue(any("$ `echo one`" in text and "one" in text for text in self.sent))
+        self.assertTrue(any("$ `echo two; exit 3`" in text and "two" in text for text in self.sent))
+
+    def test_prefixed_writer_keeps_partial_lines(self):
+        out = io.BytesIO()
+        writer = PrefixedWriter(out, b"[0] ", threading.Lock())
+        for chunk in (b"ab", b"c\nde", b"\n\nf"):
+            writer.write(chunk)
+        self.assertEqual(out.getvalue(), b"[0] abc\n[0] de\n\n[0] f")
+
+
+if __name__ == "__main__":
+    unittest.main()
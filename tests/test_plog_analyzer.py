@@ -0,0 +1,88 @@
+import unittest
+
+from ying.plog.analyzer import OutputAnalyzer, ProgressAnalyzer, Progress, make_analyzer, parse_progress
+
+
+class TestParseProgress(unittest.TestCase):
+    def test_progress_lines(self):
+        self.assertEqual(
+            parse_progress(" 45%|████▌     | 45/100 [00:10<00:12, 4.50it/s]"), Progress(45.0, "00:12")
+        )
+        self.assertEqual(parse_progress("    123,456,789  67%   12.34MB/s    0:00:12"), Progress(67.0, None))
+        self.assertEqual(parse_progress("   ━━━━━━━━━━ 1.5/3.0 MB 5.0 MB/s eta 0:00:01"), Progress(50.0, "0:00:01"))
+        self.assertIsNone(parse_progress("Collecting requests==2.31.0"))
+        self.assertIsNone(parse_progress("released on 2024/10/18"))
+
+
+class TestProgressAnalyzer(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.analyzer = ProgressAnalyzer("a", step=5, heartbeat=60, clock=lambda: self.now[0])
+
+    def reports(self, chunks):
+        count = 0
+        for chunk in chunks:
+            self.analyzer.feed(chunk)
+            if self.analyzer.should_report():
+                self.analyzer.render(4000)
+                count += 1
+        return count
+
+    def test_carriage_return_rewrites_the_line(self):
+        self.analyzer.feed("start\r\n")
+        self.analyzer.feed("\r 10%|#")
+        self.analyzer.feed("\r 20%|##\r")
+        self.assertEqual(self.analyzer.render(4000), "start\n 20%|##")
+        self.assertEqual(self.analyzer.progress, Progress(20.0, None))
+
+    def test_progress_is_reported_by_step(self):
+        chunks = [f"\r{i / 10:5.1f}%|bar| {i}/1000" for i in range(1001)]
+        self.assertEqual(self.reports(chunks), 21)
+        self.assertEqual(self.analyzer.render(4000), "100.0%|bar| 1000/1000")
+
+        raw = OutputAnalyzer("r")
+        count = 0
+        for chunk in chunks:
+            raw.feed(chunk)
+            if raw.should_report():
+                raw.render(4000)
+                count += 1
+        self.assertEqual(count, 1001)
+
+    def test_new_lines_are_reported_and_repeats_counted(self):
+        self.assertEqual(self.reports(["epoch 1\r\n", "warning\r\n", "warning\r\n", "warning\r\n"]), 2)
+        self.assertEqual(self.analyzer.render(4000), "epoch 1\nwarning [x3]\n")
+
+    def test_progress_lines_collapse(self):
+        chunks = [f"Downloading layer {i}% of 100%\r\n" for i in range(0, 101, 2)]
+        # 0, then every 6 points (the first step of 5 or more) and 100
+        self.assertEqual(self.reports(chunks), 18)
+        self.assertEqual(self.analyzer.render(4000), "Downloading layer 100% of 100%\n")
+
+    def test_spinner_waits_for_heartbeat(self):
+        self.assertEqual(self.reports(["working |", "\rworking /", "\rworking -"]), 1)
+        self.now[0] = 61
+        self.assertEqual(self.reports(["\rworking \\"]), 1)
+
+    def test_replace_mode_keeps_last_lines(self):
+        analyzer = ProgressAnalyzer("r", step=5, heartbeat=60)
+        analyzer.feed("".join(f"line {i}\r\n" for i in range(10)) + "\r 50%")
+        self.assertEqual(analyzer.render(4000), "line 5\nline 6\nline 7\nline 8\nline 9\n 50%")
+
+    def test_capacity_bounds_the_lines(self):
+        analyzer = ProgressAnalyzer("a", capacity=100, step=5, heartbeat=60)
+        for i in range(1000):
+            analyzer.feed(f"line {i}\r\n")
+        self.assertLessEqual(len(analyzer.render(4000)), 100)
+
+
+class TestMakeAnalyzer(unittest.TestCase):
+    def test_names_and_classes(self):
+        self.assertIsInstance(make_analyzer("a", "raw"), OutputAnalyzer)
+        self.assertIsInstance(make_analyzer("a", ProgressAnalyzer), ProgressAnalyzer)
+        with self.assertRaises(ValueError):
+            make_analyzer("a", "nope")
+
+
+if __name__ == "__main__":
+    unittest.main()
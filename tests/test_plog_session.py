@@ -0,0 +1,160 @@
+import io
+import os
+import sys
+import gzip
+import threading
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from ying.plog import session
+from ying.plog.session import SessionLog, iter_session_output, prune_sessions, find_session, read_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestSessionLog(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        self.clock = [1000.0]
+        for name, value in (
+            ("FRAME_SIZE", 10),
+            ("SEGMENT_SIZE", 100),
+            ("time", SimpleNamespace(time=lambda: self.clock[0])),
+        ):
+            patcher = mock.patch.object(session, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def record(self, chunks, session_id="s1", compression="gzip", max_segments=None):
+        log = SessionLog(
+            "cmd", session_id=session_id, root=self.root, compression=compression, max_segments=max_segments
+        ).start()
+        for seconds, data in chunks:
+            self.clock[0] = seconds
+            log.feed(data)
+            # one frame per chunk, every chunk is at least FRAME_SIZE
+            with log._wake:
+                while log._pending:
+                    log._wake.wait(0.01)
+        log.close(returncode=0)
+        return log
+
+    def test_round_trip_across_segments(self):
+        chunks = [(1000.0 + i, f"line {i:04d} ".encode() * 4) for i in range(20)]
+        log = self.record(chunks, max_segments=1000)
+        self.assertGreater(len(list(log.path.glob("output.*.gz"))), 1)
+        self.assertEqual(b"".join(iter_session_output("s1", root=self.root)), b"".join(data for _, data in chunks))
+
+    def test_segments_are_plain_gzip_files(self):
+        log = self.record([(1000.0, b"0123456789" * 3)])
+        with gzip.open(log.path / "output.000000.gz") as f:
+            self.assertEqual(f.read(), b"0123456789" * 3)
+
+    def test_since_starts_at_the_matching_frame(self):
+        chunks = [(1000.0 + 60 * i, f"minute {i:02d}\n".encode()) for i in range(10)]
+        self.record(chunks)
+        self.clock[0] = 1000.0 + 600
+        output = b"".join(iter_session_output("s1", since="3m", root=self.root))
+        self.assertEqual(output, b"minute 07\nminute 08\nminute 09\n")
+
+    def test_large_chunks_are_split_in_frames(self):
+        data = bytes(range(256)) * 2
+        log = self.record([(1000.0, data)], max_segments=1000)
+        records = read_index(log.path)
+        self.assertEqual([raw_offset for *_, raw_offset in records], list(range(0, len(data), 10)))
+        self.assertEqual(b"".join(iter_session_output("s1", root=self.root)), data)
+
+    def test_old_segments_are_removed(self):
+        chunks = [(1000.0 + i, f"line {i:04d} ".encode() * 4) for i in range(40)]
+        log = self.record(chunks, max_segments=2)
+        self.assertEqual(len(list(log.path.glob("output.*.gz"))), 2)
+        output = b"".join(iter_session_output("s1", root=self.root))
+        self.assertTrue(b"".join(data for _, data in chunks).endswith(output))
+        self.assertIn(b"line 0039", output)
+        self.assertNotIn(b"line 0000", output)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        chunks = [(1000.0 + i, f"line {i:04d} ".encode() * 4) for i in range(5)]
+        log = self.record(chunks, compression="zstd")
+        self.assertTrue((log.path / "output.000000.zst").exists())
+        self.assertEqual(b"".join(iter_session_output("s1", root=self.root)), b"".join(data for _, data in chunks))
+
+    def test_unknown_compression(self):
+        with self.assertRaises(ValueError):
+            SessionLog("cmd", session_id="s1", root=self.root, compression="lz4")
+
+    def test_slow_writer_bounds_the_pending_output(self):
+        release = threading.Event()
+
+        def slow_compress(data):
+            release.wait(5)
+            return session._gzip_frame(data)
+
+        with mock.patch.object(session, "MAX_PENDING", 50), mock.patch.object(session, "FEED_TIMEOUT", 0.01):
+            log = SessionLog("cmd", session_id="s1", root=self.root, compression="gzip")
+            log._compress = slow_compress
+            log.start()
+            pending = []
+            for i in range(100):
+                log.feed(b"x" * 20)
+                pending.append(log._pending_size)
+            release.set()
+            log.feed(b"end")
+            log.close(returncode=0)
+
+        self.assertLessEqual(max(pending), 50 + 20)
+        output = b"".join(iter_session_output("s1", root=self.root))
+        self.assertRegex(output, rb"\[plog: \d+ bytes of output dropped, the session log fell behind\]\r\nend$")
+        dropped = int(output.split(b"[plog: ")[1].split(b" ")[0])
+        self.assertEqual(output.count(b"x") + dropped, 2000)
+
+    def test_find_and_prune_sessions(self):
+        for session_id in ("20240101T000000-1-0", "20240102T000000-1-0", "20240103T000000-1-0"):
+            os.makedirs(self.root / session_id)
+        self.assertEqual(find_session(None, root=self.root).name, "20240103T000000-1-0")
+        self.assertEqual(find_session("20240102", root=self.root).name, "20240102T000000-1-0")
+        prune_sessions(2, root=self.root)
+        self.assertEqual(sorted(os.listdir(self.root)), ["20240102T000000-1-0", "20240103T000000-1-0"])
+
+
+class TestRunCommandSession(unittest.TestCase):
+    def test_output_is_recorded(self):
+        import ying.plog
+
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root)
+        with mock.patch.object(ying.plog, "settings", {"tg_chat_id": 1}), mock.patch.object(
+            ying.plog, "send_data_to_telegram", return_value=1
+        ), mock.patch.object(ying.plog, "get_client"), mock.patch.object(
+            ying.plog, "format_host_banner", return_value="me@host"
+        ), mock.patch.object(session, "sessions_dir", return_value=root), mock.patch(
+            "sys.stdout", mock.Mock(buffer=io.BytesIO())
+        ), mock.patch("sys.stderr", io.StringIO()):
+            ying.plog.run_command("seq 1 3", mode="a")
+            out = io.BytesIO()
+            ying.plog.tail_session(out=out)
+        self.assertEqual(out.getvalue(), b"1\r\n2\r\n3\r\n")
+
+    def test_missing_zstandard_fails_before_the_command_starts(self):
+        import ying.plog
+
+        settings = {"tg_chat_id": 1, "plog_session_compression": "zstd"}
+        with mock.patch.object(ying.plog, "settings", settings), mock.patch(
+            "ying.config.settings", settings
+        ), mock.patch.dict(sys.modules, {"zstandard": None}), mock.patch("subprocess.Popen") as popen:
+            with self.assertRaises(ImportError):
+                ying.plog.run_command("true", host_banner="me@host")
+        popen.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
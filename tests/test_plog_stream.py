@@ -0,0 +1,53 @@
+import unittest
+
+from ying.plog.stream import RingBuffer, AnsiStripper, OutputDecoder
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_keeps_last_bytes(self):
+        ring = RingBuffer(8)
+        for chunk in (b"abc", b"defgh", b"ijk"):
+            ring.write(chunk)
+        self.assertEqual(ring.read(), (b"defghijk", 3))
+        self.assertEqual(ring.read(), (b"", 0))
+
+    def test_wraps_after_read(self):
+        ring = RingBuffer(4)
+        ring.write(b"abc")
+        ring.read()
+        ring.write(b"defg")
+        self.assertEqual(ring.read(), (b"defg", 0))
+
+    def test_chunk_larger_than_capacity(self):
+        ring = RingBuffer(4)
+        ring.write(b"ab")
+        ring.write(b"cdefgh")
+        self.assertEqual(ring.read(), (b"efgh", 4))
+
+
+class TestAnsiStripper(unittest.TestCase):
+    def test_sequence_split_across_chunks(self):
+        stripper = AnsiStripper()
+        text = "".join(
+            stripper.feed(chunk) for chunk in ("ok \x1b[3", "2;1mgreen\x1b", "[0m done\x1b]0;title", "\x07!")
+        )
+        self.assertEqual(text, "ok green done!")
+
+    def test_complete_sequences(self):
+        self.assertEqual(AnsiStripper().feed("\x1b[2K\x1b[1Gline\x1b(B"), "line")
+
+
+class TestOutputDecoder(unittest.TestCase):
+    def test_multibyte_character_split_across_chunks(self):
+        decoder = OutputDecoder()
+        data = "héllo \x1b[1m世界\x1b[0m".encode("utf-8")
+        text = "".join(decoder.decode(data[i:i + 1]) for i in range(len(data)))
+        self.assertEqual(text, "héllo 世界")
+
+    def test_skip_partial_character(self):
+        data = "世界".encode("utf-8")[1:]
+        self.assertEqual(OutputDecoder().decode(data, skip_partial_character=True), "界")
+
+
+if __name__ == "__main__":
+    unittest.main()
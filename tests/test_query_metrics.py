@@ -0,0 +1,184 @@
+import os
+import datetime
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from ying.cloud_storage_size import clients, query_metrics, get_bucket_objects_count_and_bytes
+from ying.cloud_storage_size.query_metrics import (
+    query_aws_cloudwatch,
+    query_azure_monitor,
+    query_google_cloud_minitoring_batch,
+)
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+RESOURCE_ID = "/subscriptions/sub/resourceGroups/group/providers/Microsoft.Storage/storageAccounts/account"
+
+
+class TestAzureMetricsScope(unittest.TestCase):
+    def test_container_query_refuses_account_metrics(self):
+        with mock.patch("ying.cloud_storage_size.query_metrics.query_azure_monitor") as query_azure_monitor:
+            with self.assertRaises(ValueError):
+                get_bucket_objects_count_and_bytes(
+                    "az://container", engine="metrics", storage_account_resource_id=RESOURCE_ID
+                )
+        query_azure_monitor.assert_not_called()
+
+    def test_account_level_metrics(self):
+        with mock.patch(
+            "ying.cloud_storage_size.query_metrics.query_azure_monitor", return_value={"bytes": 10, "count": 2}
+        ) as query_azure_monitor:
+            result = get_bucket_objects_count_and_bytes(
+                "az://container", engine="metrics", storage_account_resource_id=RESOURCE_ID, account_level=True
+            )
+        self.assertEqual(result, {"bytes": 10, "count": 2})
+        query_azure_monitor.assert_called_once_with(RESOURCE_ID)
+
+    def test_auto_lists_the_container(self):
+        with mock.patch("ying.cloud_storage_size.query_metrics.query_azure_monitor") as query_azure_monitor, mock.patch(
+            "ying.cloud_storage_size.rclone.find_rclone", return_value=None
+        ), mock.patch("ying.cloud_storage_size.cache.get_known_count", return_value=None), mock.patch(
+            "ying.cloud_storage_size.list_object_count_and_bytes.list_object_count_and_bytes_az",
+            return_value={"bytes": 3, "count": 1},
+        ):
+            result = get_bucket_objects_count_and_bytes(
+                "az://container", storage_account_resource_id=RESOURCE_ID, account_level=True
+            )
+        self.assertEqual(result, {"bytes": 3, "count": 1})
+        query_azure_monitor.assert_not_called()
+
+
+@unittest.skipIf(mock_aws is None, "moto is not installed")
+class TestQueryAWSCloudWatch(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(
+            os.environ, {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test", "AWS_DEFAULT_REGION": "us-east-1"}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        clients.clear_clients()
+        self.addCleanup(clients.clear_clients)
+        self.cloudwatch = clients.get_boto3_client("cloudwatch")
+
+    def put(self, metric_name, storage_type, value, bucket_name="bkt", hours_ago=12):
+        self.cloudwatch.put_metric_data(
+            Namespace="AWS/S3",
+            MetricData=[
+                {
+                    "MetricName": metric_name,
+                    "Dimensions": [
+                        {"Name": "BucketName", "Value": bucket_name},
+                        {"Name": "StorageType", "Value": storage_type},
+                    ],
+                    "Timestamp": datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours_ago),
+                    "Value": value,
+                }
+            ],
+        )
+
+    def test_sums_storage_types(self):
+        self.put("BucketSizeBytes", "StandardStorage", 1000)
+        self.put("BucketSizeBytes", "StandardIAStorage", 200)
+        self.put("BucketSizeBytes", "GlacierStorage", 30)
+        self.put("NumberOfObjects", "AllStorageTypes", 7)
+        self.put("BucketSizeBytes", "StandardStorage", 99999, bucket_name="other")
+        self.assertEqual(query_aws_cloudwatch("bkt"), {"bytes": 1230, "count": 7})
+
+    def test_no_datapoints(self):
+        self.put("BucketSizeBytes", "StandardStorage", 1000, bucket_name="other")
+        self.assertEqual(query_aws_cloudwatch("bkt"), {"bytes": -1, "count": -1})
+
+    def test_old_datapoints_are_ignored(self):
+        self.put("BucketSizeBytes", "StandardStorage", 1000, hours_ago=24 * 5)
+        self.put("NumberOfObjects", "AllStorageTypes", 7, hours_ago=24 * 5)
+        self.assertEqual(query_aws_cloudwatch("bkt"), {"bytes": -1, "count": -1})
+
+
+def series(bucket_name, storage_class, *values):
+    # points are returned newest first
+    points = [SimpleNamespace(value=SimpleNamespace(double_value=float(v), int64_value=int(v))) for v in values]
+    return SimpleNamespace(
+        resource=SimpleNamespace(labels={"bucket_name": bucket_name}),
+        metric=SimpleNamespace(labels={"storage_class": storage_class}),
+        points=points,
+    )
+
+
+class TestQueryGoogleCloudMonitoringBatch(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.list_time_series.side_effect = self.list_time_series
+        patcher = mock.patch.object(query_metrics, "get_metric_service_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def list_time_series(self, request):
+        self.assertEqual(request["name"], "projects/project")
+        if "total_bytes" in request["filter"]:
+            return [
+                series("a", "STANDARD", 1000, 900),
+                series("a", "NEARLINE", 200),
+                series("a", "COLDLINE", 30, 10),
+                series("b", "STANDARD", 5),
+                series("c", "STANDARD"),
+            ]
+        return [
+            series("a", "STANDARD", 7, 6),
+            series("a", "NEARLINE", 2),
+            series("b", "STANDARD", 1),
+        ]
+
+    def test_sums_storage_classes(self):
+        self.assertEqual(
+            query_google_cloud_minitoring_batch("project"),
+            {"a": {"bytes": 1230, "count": 9}, "b": {"bytes": 5, "count": 1}},
+        )
+        self.assertEqual(self.client.list_time_series.call_count, 2)
+
+    def test_missing_buckets(self):
+        self.assertEqual(
+            query_google_cloud_minitoring_batch("project", ["b", "c", "missing"]),
+            {
+                "b": {"bytes": 5, "count": 1},
+                "c": {"bytes": -1, "count": -1},
+                "missing": {"bytes": -1, "count": -1},
+            },
+        )
+
+
+def metric(name, *averages):
+    points = [SimpleNamespace(average=average) for average in averages]
+    return SimpleNamespace(name=name, timeseries=[SimpleNamespace(data=points)])
+
+
+class TestQueryAzureMonitor(unittest.TestCase):
+    def query(self, metrics):
+        client = mock.Mock()
+        client.query_resource.return_value = SimpleNamespace(metrics=metrics)
+        with mock.patch.object(query_metrics, "get_azure_metrics_client", return_value=client):
+            result = query_azure_monitor(RESOURCE_ID + "/")
+        return result, client
+
+    def test_latest_points(self):
+        result, client = self.query(
+            [metric("BlobCapacity", 100.0, 150.0, None), metric("BlobCount", 3.0, None, 4.0)]
+        )
+        self.assertEqual(result, {"bytes": 150, "count": 4})
+        args, kwargs = client.query_resource.call_args
+        self.assertEqual(args[0], RESOURCE_ID + "/blobServices/default")
+        self.assertEqual(kwargs["metric_names"], ["BlobCapacity", "BlobCount"])
+
+    def test_no_datapoints(self):
+        result, _ = self.query([metric("BlobCapacity", None), metric("BlobCount")])
+        self.assertEqual(result, {"bytes": -1, "count": -1})
+
+
+if __name__ == "__main__":
+    unittest.main()
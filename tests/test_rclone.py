@@ -0,0 +1,138 @@
+import threading
+import unittest
+from unittest import mock
+
+from ying.cloud_storage_size import rclone
+from ying.cloud_storage_size.planner import run_hedged, EnginePlan, ScanCancelled, _cancel_event
+from ying.cloud_storage_size.rclone import RcloneDaemon, list_object_count_and_bytes_rclone_daemon
+
+
+class FakeJobs(object):
+    """rc calls of a daemon whose size job finishes after `polls` status calls"""
+
+    def __init__(self, polls=None, success=True):
+        self.polls = polls
+        self.success = success
+        self.calls = []
+
+    def __call__(self, method, timeout=None, **params):
+        self.calls.append((method, params))
+        if method == "operations/size":
+            return {"jobid": 7}
+        if method == "job/status":
+            statuses = sum(1 for name, _ in self.calls if name == "job/status")
+            if self.polls is None or statuses < self.polls:
+                return {"finished": False}
+            return {
+                "finished": True,
+                "success": self.success,
+                "error": "" if self.success else "directory not found",
+                "output": {"bytes": 10, "count": 2},
+            }
+        return {}
+
+    def methods(self):
+        return [name for name, _ in self.calls]
+
+
+class TestRcloneDaemon(unittest.TestCase):
+    def test_credentials_are_not_on_the_command_line(self):
+        daemon = RcloneDaemon("/usr/bin/rclone")
+        with mock.patch("subprocess.Popen") as popen, mock.patch.object(RcloneDaemon, "call"):
+            popen.return_value.poll.return_value = None
+            daemon.start()
+        command = popen.call_args[0][0]
+        env = popen.call_args[1]["env"]
+        self.assertNotIn(daemon.auth[1], " ".join(command))
+        self.assertEqual((env["RCLONE_RC_USER"], env["RCLONE_RC_PASS"]), daemon.auth)
+
+    def test_failed_start_returns_none(self):
+        with mock.patch.object(rclone, "_daemon", None), mock.patch.object(
+            rclone, "find_rclone", return_value="/usr/bin/rclone"
+        ), mock.patch.object(RcloneDaemon, "start", side_effect=RuntimeError("rclone rcd exited with 1")):
+            self.assertIsNone(list_object_count_and_bytes_rclone_daemon("s3://bkt"))
+
+    def test_unreachable_daemon_returns_none(self):
+        import requests
+
+        for error in (requests.ConnectionError("connection refused"), requests.Timeout("read timed out")):
+            daemon = mock.Mock()
+            daemon.size.side_effect = error
+            with mock.patch.object(rclone, "get_rclone_daemon", return_value=daemon):
+                self.assertIsNone(list_object_count_and_bytes_rclone_daemon("s3://bkt"))
+
+    def test_missing_rclone_is_looked_up_again(self):
+        with mock.patch.object(rclone, "_rclone_path", None), mock.patch.object(
+            rclone, "RCLONE_FALLBACK_PATHS", []
+        ), mock.patch("shutil.which", return_value=None) as which:
+            self.assertIsNone(rclone.find_rclone())
+            which.return_value = "/bin/sh"
+            self.assertEqual(rclone.find_rclone(), "/bin/sh")
+            which.return_value = None
+            self.assertEqual(rclone.find_rclone(), "/bin/sh")
+
+
+class TestRcloneSizeJob(unittest.TestCase):
+    def setUp(self):
+        self.daemon = RcloneDaemon("/usr/bin/rclone")
+        patcher = mock.patch.object(rclone, "JOB_POLL_INTERVAL", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_size_job(self):
+        jobs = FakeJobs(polls=3)
+        with mock.patch.object(self.daemon, "call", jobs):
+            self.assertEqual(self.daemon.size("s3://bkt/dir"), {"bytes": 10, "count": 2})
+        self.assertEqual(
+            jobs.calls[0], ("operations/size", {"fs": "S3:bkt/dir", "_config": {"UseListR": True}, "_async": True})
+        )
+        self.assertEqual(jobs.methods().count("job/status"), 3)
+        self.assertNotIn("job/stop", jobs.methods())
+
+    def test_failed_job(self):
+        with mock.patch.object(self.daemon, "call", FakeJobs(polls=1, success=False)):
+            with self.assertRaises(RuntimeError):
+                self.daemon.size("s3://bkt")
+
+    def test_timeout_stops_the_job(self):
+        jobs = FakeJobs()
+        with mock.patch.object(self.daemon, "call", jobs):
+            with self.assertRaises(RuntimeError):
+                self.daemon.size("s3://bkt", timeout=0.05)
+        self.assertEqual(jobs.calls[-1], ("job/stop", {"jobid": 7}))
+
+    def test_cancel_stops_the_job(self):
+        jobs = FakeJobs()
+        event = threading.Event()
+        event.set()
+        token = _cancel_event.set(event)
+        self.addCleanup(_cancel_event.reset, token)
+        with mock.patch.object(self.daemon, "call", jobs):
+            with self.assertRaises(ScanCancelled):
+                self.daemon.size("s3://bkt")
+        self.assertEqual(jobs.calls[-1], ("job/stop", {"jobid": 7}))
+
+    def test_hedge_winner_stops_the_job(self):
+        jobs = FakeJobs()
+        stopped = threading.Event()
+
+        def call(method, timeout=None, **params):
+            if method == "job/stop":
+                stopped.set()
+            return jobs(method, timeout, **params)
+
+        def run_engine(engine, deadline):
+            if engine == "metrics":
+                return {"bytes": 1, "count": 1}
+            return self.daemon.size("s3://bkt", deadline)
+
+        with mock.patch.object(self.daemon, "call", call):
+            engine, _ = run_hedged(
+                [EnginePlan("rclone", 0, None), EnginePlan("metrics", 0.1, None)], run_engine, lambda answer: True
+            )
+            self.assertEqual(engine, "metrics")
+            self.assertTrue(stopped.wait(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import time
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ying.utils import runtime
+
+
+class TestHostBanner(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.lookups = 0
+        for name, value in (
+            ("host_banner_cache_path", lambda: Path(self.root) / "host_banner.json"),
+            ("get_external_ip", self.get_external_ip),
+            ("_host_info", None),
+            ("_lookup", None),
+        ):
+            patcher = mock.patch.object(runtime, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_external_ip(self, timeout):
+        self.lookups += 1
+        time.sleep(0.3)
+        return "203.0.113.7"
+
+    def restart(self):
+        runtime._host_info = None
+        runtime._lookup = None
+
+    def test_external_ip_is_resolved_in_the_background(self):
+        started = time.monotonic()
+        self.assertIn("[...]", runtime.format_host_banner())
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertIn("[203.0.113.7]", runtime.format_host_banner(wait=2))
+        self.assertEqual(self.lookups, 1)
+
+    def test_cached_on_disk_until_expired(self):
+        runtime.format_host_banner(wait=2)
+        self.restart()
+        self.assertIn("[203.0.113.7]", runtime.format_host_banner())
+        self.assertEqual(self.lookups, 1)
+
+        self.restart()
+        info = runtime.get_host_info(ttl=0)
+        self.assertEqual(info["external_ip"], "203.0.113.7")
+        runtime._lookup.join()
+        self.assertEqual(self.lookups, 2)
+
+    def test_offline_host_keeps_last_known_ip(self):
+        runtime.format_host_banner(wait=2)
+        with mock.patch.object(runtime, "get_external_ip", return_value=runtime.EXTERNAL_IP_UNKNOWN):
+            runtime.get_host_info(ttl=0, wait=2)
+        self.assertEqual(runtime.get_host_info()["external_ip"], "203.0.113.7")
+
+
+if __name__ == "__main__":
+    unittest.main()
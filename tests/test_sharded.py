@@ -0,0 +1,85 @@
+import os
+import unittest
+from unittest import mock
+
+from ying.cloud_storage_size import clients
+from ying.cloud_storage_size.list_object_count_and_bytes import (
+    list_object_count_and_bytes_s3,
+    list_object_count_and_bytes_sharded,
+    merge_count_and_bytes,
+)
+
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+KEYS = (
+    ["root-a", "root-b.txt"]
+    + [f"logs/2024/{i:03d}.log" for i in range(40)]
+    + [f"logs/2025/{i:03d}.log" for i in range(25)]
+    + [f"data/part-{i}/file-{j}" for i in range(5) for j in range(7)]
+    + ["empty-dir/", "deep/a/b/c/d/e"]
+)
+
+
+class TestMergeCountAndBytes(unittest.TestCase):
+    def test_sums_totals(self):
+        self.assertEqual(
+            merge_count_and_bytes([{"bytes": 1, "count": 1}, {"bytes": 10, "count": 2}]), {"bytes": 11, "count": 3}
+        )
+        self.assertEqual(merge_count_and_bytes([]), {"bytes": 0, "count": 0})
+
+    def test_merges_breakdowns(self):
+        merged = merge_count_and_bytes(
+            [
+                {"bytes": 5, "count": 1},
+                {"bytes": 2, "count": 2, "breakdown": {"a/": {"bytes": 2, "count": 2}}, "breakdown_truncated": False},
+                {"bytes": 3, "count": 1, "breakdown": {"b/": {"bytes": 3, "count": 1}}, "breakdown_truncated": True},
+            ]
+        )
+        self.assertEqual(merged["bytes"], 10)
+        self.assertEqual(merged["count"], 4)
+        self.assertEqual(sorted(merged["breakdown"]), ["a/", "b/"])
+        self.assertTrue(merged["breakdown_truncated"])
+
+
+@unittest.skipIf(mock_aws is None, "moto is not installed")
+class TestShardedListing(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(
+            os.environ, {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test", "AWS_DEFAULT_REGION": "us-east-1"}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.aws = mock_aws()
+        self.aws.start()
+        self.addCleanup(self.aws.stop)
+        clients.clear_clients()
+        self.addCleanup(clients.clear_clients)
+
+        s3 = clients.get_boto3_client("s3")
+        s3.create_bucket(Bucket="bkt")
+        for i, key in enumerate(KEYS):
+            s3.put_object(Bucket="bkt", Key=key, Body=b"x" * (i * 7 % 101))
+
+    def test_matches_single_pass(self):
+        expected = list_object_count_and_bytes_s3("bkt")
+        self.assertEqual(expected["count"], len(KEYS))
+        self.assertEqual(list_object_count_and_bytes_sharded("s3", "bkt", parallelism=3), expected)
+
+    def test_matches_single_pass_with_breakdown(self):
+        for depth in (1, 2, 3):
+            expected = list_object_count_and_bytes_s3("bkt", breakdown_depth=depth)
+            sharded = list_object_count_and_bytes_sharded("s3", "bkt", parallelism=3, breakdown_depth=depth)
+            self.assertEqual(sharded, expected, depth)
+
+    def test_rejects_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            list_object_count_and_bytes_sharded("ftp", "bkt")
+        with self.assertRaises(ValueError):
+            list_object_count_and_bytes_sharded("s3", "bkt", parallelism=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+
+from ying.utils.formatter import human_readable_bytes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+RESULTS = [
+    {"bucket_uri": "gs://a", "result": {"bytes": 1536, "count": 2}, "error": None},
+    {"bucket_uri": "s3://b", "result": None, "error": "TimeoutError()"},
+    {"bucket_uri": "az://c", "result": {"bytes": 0, "count": 0}, "error": None},
+    {"bucket_uri": "s3://d", "result": {"bytes": -1, "count": -1}, "error": None},
+]
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestByteFormatting(unittest.TestCase):
+    def test_matches_scalar_formatting(self):
+        from ying.utils.formatter import human_readable_bytes_array
+
+        sizes = [0, 1, 1023, 1024, 1536, 10**9, 123456789012345, 2**80]
+        for decimal_places in (0, 2, 4):
+            self.assertEqual(
+                human_readable_bytes_array(sizes, decimal_places).tolist(),
+                [human_readable_bytes(size, decimal_places) for size in sizes],
+            )
+        self.assertEqual(human_readable_bytes_array([-1]).tolist(), [""])
+
+    def test_parse(self):
+        from ying.utils.formatter import parse_human_readable_bytes_array
+
+        self.assertEqual(
+            parse_human_readable_bytes_array(["1.50 GB", "1024", "0 B", "", " 3 kb"]).tolist(),
+            [1610612736, 1024, 0, -1, 3072],
+        )
+        self.assertEqual(parse_human_readable_bytes_array(np.array([["1 KB", "2 MB"]])).tolist(), [[1024, 2097152]])
+        with self.assertRaises(ValueError):
+            parse_human_readable_bytes_array(["1 XB"])
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestSinks(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_table(self):
+        from ying.cloud_storage_size import ResultTable
+
+        table = ResultTable.from_results(RESULTS)
+        self.assertEqual(table["valid"].tolist(), [True, False, True, False])
+        self.assertEqual(table["bytes_human"].tolist(), ["1.50 KB", "", "0 B", ""])
+        self.assertEqual(
+            table.rows()[1],
+            {"bucket_uri": "s3://b", "bytes": None, "count": None, "bytes_human": None, "error": "TimeoutError()"},
+        )
+        self.assertEqual(table.rows()[3]["error"], "no value")
+
+    def test_csv_and_jsonl(self):
+        from ying.cloud_storage_size import export_results
+
+        export_results(RESULTS, os.path.join(self.root, "sizes.csv"))
+        with open(os.path.join(self.root, "sizes.csv"), newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(rows[0], {"bucket_uri": "gs://a", "bytes": "1536", "count": "2", "bytes_human": "1.50 KB", "error": ""})
+
+        export_results(RESULTS, os.path.join(self.root, "sizes.jsonl"))
+        with open(os.path.join(self.root, "sizes.jsonl")) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["bytes"] for row in rows], [1536, None, 0, None])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+        from ying.cloud_storage_size import export_results
+
+        export_results(RESULTS, os.path.join(self.root, "sizes.parquet"))
+        table = pq.read_table(os.path.join(self.root, "sizes.parquet"))
+        self.assertEqual(table.column("bytes").to_pylist(), [1536, None, 0, None])
+        self.assertEqual(table.column("bytes_human").to_pylist(), ["1.50 KB", None, "0 B", None])
+
+    def test_callback_gets_one_call(self):
+        from ying.cloud_storage_size import export_results
+
+        calls = []
+        export_results(iter(RESULTS), calls.append)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(calls[0]), 4)
+        with self.assertRaises(ValueError):
+            export_results(RESULTS, os.path.join(self.root, "sizes.xlsx"))
+
+
+if __name__ == "__main__":
+    unittest.main()
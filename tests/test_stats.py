@@ -0,0 +1,97 @@
+import unittest
+from unittest import mock
+
+from ying.cloud_storage_size import get_bucket_objects_count_and_bytes
+from ying.cloud_storage_size.list_object_count_and_bytes import count_pages
+from ying.cloud_storage_size.stats import (
+    collect_stats,
+    record_http_response,
+    add_stats_hook,
+    remove_stats_hook,
+    PrometheusExporter,
+)
+
+
+def iter_pages(page_token):
+    for n in range(3):
+        record_http_response(response_bytes=100)
+        yield [(f"{n}/a", 1), (f"{n}/b", 2)], str(n + 1)
+
+
+class TestStats(unittest.TestCase):
+    def test_count_pages_records_stats(self):
+        with collect_stats("s3://bucket", "sdk") as stats:
+            count_pages(iter_pages, "s3", "bucket")
+
+        result = stats.to_dict()
+        self.assertEqual(result["pages"], 3)
+        self.assertEqual(result["api_calls"], 3)
+        self.assertEqual(result["response_bytes"], 300)
+        self.assertEqual((result["objects"], result["bytes"]), (6, 9))
+        self.assertIsNotNone(result["finished_at"])
+        self.assertIsNone(result["error"])
+
+    def test_no_stats_outside_collect(self):
+        record_http_response(response_bytes=100)
+        self.assertEqual(count_pages(iter_pages, "s3", "bucket"), {"bytes": 9, "count": 6})
+
+    def test_prometheus_exporter(self):
+        exporter = PrometheusExporter()
+        events = []
+
+        def record_event(event, stats):
+            events.append(event)
+
+        add_stats_hook(exporter)
+        add_stats_hook(record_event)
+        try:
+            with collect_stats('s3://bucket"x', "sdk"):
+                count_pages(iter_pages, "s3", "bucket")
+        finally:
+            remove_stats_hook(exporter)
+            remove_stats_hook(record_event)
+
+        self.assertEqual(events, ["page", "page", "page", "finish"])
+        text = exporter.render()
+        self.assertIn("# TYPE ying_scan_pages_total counter", text)
+        self.assertIn('ying_scan_pages_total{bucket_uri="s3://bucket\\"x",engine="sdk"} 3', text)
+        self.assertIn('ying_scan_in_progress{bucket_uri="s3://bucket\\"x",engine="sdk"} 0', text)
+
+    def test_prometheus_exporter_keeps_the_latest_scan_per_label_set(self):
+        exporter = PrometheusExporter()
+        add_stats_hook(exporter)
+        try:
+            for _ in range(3):
+                with collect_stats("s3://bucket", "sdk"):
+                    count_pages(iter_pages, "s3", "bucket")
+            with collect_stats("s3://bucket", "rclone"):
+                pass
+        finally:
+            remove_stats_hook(exporter)
+
+        lines = [line for line in exporter.render().splitlines() if line.startswith("ying_scan_pages_total")]
+        self.assertEqual(
+            lines,
+            [
+                'ying_scan_pages_total{bucket_uri="s3://bucket",engine="sdk"} 3',
+                'ying_scan_pages_total{bucket_uri="s3://bucket",engine="rclone"} 0',
+            ],
+        )
+
+    def test_engines_without_pages_record_their_answer(self):
+        with mock.patch(
+            "ying.cloud_storage_size.query_metrics.query_aws_cloudwatch", return_value={"bytes": 1230, "count": 7}
+        ):
+            result = get_bucket_objects_count_and_bytes("s3://bucket", engine="metrics", stats=True)
+        self.assertEqual((result["stats"]["objects"], result["stats"]["bytes"]), (7, 1230))
+        self.assertEqual(result["stats"]["pages"], 0)
+
+        with mock.patch(
+            "ying.cloud_storage_size.query_metrics.query_aws_cloudwatch", return_value={"bytes": -1, "count": -1}
+        ):
+            result = get_bucket_objects_count_and_bytes("s3://bucket", engine="metrics", stats=True)
+        self.assertEqual((result["stats"]["objects"], result["stats"]["bytes"]), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
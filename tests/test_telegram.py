@@ -0,0 +1,126 @@
+import json
+import time
+import threading
+import unittest
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ying.thirdparty.telegram import TelegramClient, TelegramError, TokenBucket
+
+
+class StubBotApi(object):
+    """local Bot API answering from a list of (status, body) per method"""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                length = int(self.headers["Content-Length"])
+                params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+                stub.requests.append((method, params, time.monotonic()))
+                queued = stub.responses.get(method)
+                status, body = queued.pop(0) if queued else (200, {"ok": True, "result": {"message_id": 7}})
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def methods(self):
+        return [method for method, _, _ in self.requests]
+
+
+class TestTelegramClient(unittest.TestCase):
+    def setUp(self):
+        self.api = StubBotApi()
+        self.addCleanup(self.api.server.shutdown)
+        self.client = TelegramClient("token", api_url=self.api.url, backoff=0.01)
+
+    def test_send_message(self):
+        self.assertEqual(self.client.send_message(1, "hi"), 7)
+        method, params, _ = self.api.requests[0]
+        self.assertEqual((method, params["chat_id"], params["text"]), ("sendMessage", "1", "hi"))
+
+    def test_retry_after_429(self):
+        self.api.responses["sendMessage"] = [
+            (429, {"ok": False, "description": "Too Many Requests", "parameters": {"retry_after": 1}})
+        ]
+        started = time.monotonic()
+        self.assertEqual(self.client.send_message(1, "hi"), 7)
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+        self.assertEqual(self.api.methods(), ["sendMessage", "sendMessage"])
+
+    def test_retry_server_errors_then_fail(self):
+        self.api.responses["sendMessage"] = [(502, {"ok": False, "description": "Bad Gateway"})] * 4
+        with self.assertRaises(TelegramError):
+            self.client.send_message(1, "hi")
+        self.assertEqual(len(self.api.requests), 4)
+
+    def test_client_errors_are_not_retried(self):
+        self.api.responses["sendMessage"] = [(400, {"ok": False, "description": "Bad Request"})]
+        with self.assertRaises(TelegramError):
+            self.client.send_message(1, "hi")
+        self.assertEqual(len(self.api.requests), 1)
+
+    def test_unchanged_edit_is_skipped(self):
+        message_id = self.client.send_message(1, "same")
+        self.assertFalse(self.client.edit_message_text(1, message_id, "same"))
+        self.assertEqual(self.api.methods(), ["sendMessage"])
+
+    def test_scheduled_edits_are_coalesced(self):
+        message_id = self.client.send_message(1, "0")
+        for i in range(1, 20):
+            self.client.schedule_edit(1, message_id, str(i))
+        self.assertTrue(self.client.flush(timeout=5))
+        edits = [params["text"] for method, params, _ in self.api.requests if method == "editMessageText"]
+        self.assertEqual(edits[-1], "19")
+        self.assertLessEqual(len(edits), 2)
+
+    def test_edits_of_many_messages_share_the_chat_budget(self):
+        self.client.chat_bucket(-1).rate = 10
+        message_ids = []
+        self.api.responses["sendMessage"] = [
+            (200, {"ok": True, "result": {"message_id": message_id}}) for message_id in (1, 2, 3)
+        ]
+        for message_id in (1, 2, 3):
+            message_ids.append(self.client.send_message(-1, "start"))
+        for i in range(5):
+            for message_id in message_ids:
+                self.client.schedule_edit(-1, message_id, f"{message_id}:{i}")
+        self.assertTrue(self.client.flush(timeout=5))
+        last_texts = {}
+        for method, params, _ in self.api.requests:
+            if method == "editMessageText":
+                last_texts[params["message_id"]] = params["text"]
+        self.assertEqual(last_texts, {"1": "1:4", "2": "2:4", "3": "3:4"})
+
+    def test_chat_rate_limit(self):
+        for i in range(3):
+            self.client.send_message(1, str(i))
+        times = [sent for _, _, sent in self.api.requests]
+        self.assertGreaterEqual(times[-1] - times[0], 1.9)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_pause(self):
+        bucket = TokenBucket(100)
+        bucket.pause(0.2)
+        self.assertGreater(bucket.try_acquire(), 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
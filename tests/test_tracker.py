@@ -0,0 +1,233 @@
+import os
+import json
+import queue
+import base64
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ying.cloud_storage_size import get_bucket_objects_count_and_bytes
+from ying.cloud_storage_size import list_object_count_and_bytes
+from ying.cloud_storage_size.tracker import (
+    SizeTracker,
+    ObjectEvent,
+    CREATED,
+    DELETED,
+    parse_events,
+    FileSource,
+    DirectorySource,
+    QueueSource,
+)
+
+LATER = "2030-01-01T00:00:00.000Z"
+
+
+def s3_record(name, key, size=None, sequencer="10", time=LATER):
+    obj = {"key": key, "sequencer": sequencer}
+    if size is not None:
+        obj["size"] = size
+    return {"eventSource": "aws:s3", "eventName": name, "eventTime": time, "s3": {"bucket": {"name": "bkt"}, "object": obj}}
+
+
+def gcs_message(event_type, name, size, generation, **attributes):
+    resource = {"bucket": "bkt", "name": name, "size": str(size), "generation": str(generation)}
+    attributes = dict(
+        attributes, eventType=event_type, bucketId="bkt", objectId=name, objectGeneration=str(generation), eventTime=LATER
+    )
+    return {"message": {"attributes": attributes, "data": base64.b64encode(json.dumps(resource).encode()).decode()}}
+
+
+class TestParseEvents(unittest.TestCase):
+    def test_s3(self):
+        document = {"Records": [s3_record("ObjectCreated:Put", "a+b%2Bc.txt", 5, "0055AED6DCD90281E5")]}
+        sns = {"Type": "Notification", "Message": json.dumps(document)}
+        for payload in (document, json.dumps(document), sns):
+            (event,) = parse_events(payload)
+            self.assertEqual(event.bucket_uri, "s3://bkt")
+            self.assertEqual(event.key, "a b+c.txt")
+            self.assertEqual((event.kind, event.size), (CREATED, 5))
+        self.assertEqual(parse_events({"Event": "s3:TestEvent"}), [])
+
+    def test_gcs(self):
+        (event,) = parse_events(gcs_message("OBJECT_FINALIZE", "a/b", 7, 1700000000000001, overwroteGeneration="1700000000000000"))
+        self.assertEqual((event.bucket_uri, event.key, event.kind, event.size), ("gs://bkt", "a/b", CREATED, 7))
+        self.assertGreater(event.sequencer, event.overwrote)
+        self.assertEqual(parse_events(gcs_message("OBJECT_METADATA_UPDATE", "a/b", 7, 1)), [])
+
+    def test_azure(self):
+        event = {
+            "eventType": "Microsoft.Storage.BlobDeleted",
+            "subject": "/blobServices/default/containers/ctr/blobs/dir/file.bin",
+            "eventTime": "2017-11-07T20:09:22.5674003Z",
+            "data": {"sequencer": "0000000000000281000000000002F5CA"},
+        }
+        (parsed,) = parse_events([event])
+        self.assertEqual((parsed.bucket_uri, parsed.key, parsed.kind, parsed.size), ("az://ctr", "dir/file.bin", DELETED, None))
+        self.assertAlmostEqual(parsed.event_time, 1510085362.567400, places=5)
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            parse_events({"hello": "world"})
+
+
+class TestSizeTracker(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.path = os.path.join(self.root, "tracker.sqlite3")
+        self.objects = {"a": 10, "b": 20, "c/d": 30}
+
+        def iter_pages(bucket_name, prefix=None, page_token=None):
+            items = sorted((key, size) for key, size in self.objects.items() if key.startswith(prefix or ""))
+            yield items[:2], "next"
+            yield items[2:], None
+
+        patcher = mock.patch.dict(list_object_count_and_bytes.PAGE_ITERATORS, {"s3": iter_pages, "gs": iter_pages})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def event(self, kind, key, size=None, sequencer="1", overwrote=None, uri="s3://bkt"):
+        return ObjectEvent(uri, key, kind, size, sequencer, None, overwrote)
+
+    def test_totals_seed_from_a_full_run(self):
+        tracker = SizeTracker("s3://bkt", self.path)
+        with mock.patch(
+            "ying.cloud_storage_size.get_bucket_objects_count_and_bytes", return_value={"bytes": 60, "count": 3}
+        ) as get:
+            tracker.seed()
+        self.assertEqual(get.call_args.kwargs["engine"], "sdk")
+        tracker.apply([self.event(CREATED, "new", 5, "2"), self.event(DELETED, "a", None, "3")])
+        self.assertEqual(tracker.get()["count"], 3)
+        self.assertEqual(tracker.get()["bytes"], 65)
+        self.assertFalse(tracker.get()["exact"])
+
+        self.objects = {"b": 20, "c/d": 30, "new": 5}
+        with mock.patch(
+            "ying.cloud_storage_size.get_bucket_objects_count_and_bytes", return_value={"bytes": 55, "count": 3}
+        ):
+            self.assertEqual(tracker.reconcile(), {"bytes": -10, "count": 0})
+        self.assertTrue(tracker.get()["exact"])
+
+    def test_keys_seed_is_exact(self):
+        tracker = SizeTracker("s3://bkt", self.path)
+        self.assertEqual(tracker.seed(keys=True), {"bytes": 60, "count": 3})
+        events = [
+            self.event(CREATED, "a", 15, "05"),  # overwrite
+            self.event(DELETED, "b", None, "06"),
+            self.event(DELETED, "b", None, "06"),  # duplicate
+            self.event(CREATED, "b", 99, "04"),  # older than the delete
+            self.event(DELETED, "missing", None, "07"),
+            self.event(CREATED, "x", 1, "01", uri="s3://other"),
+        ]
+        self.assertEqual(tracker.apply(events), 2)
+        self.assertEqual(get_bucket_objects_count_and_bytes("s3://bkt", engine="tracker", tracker_path=self.path), {"bytes": 45, "count": 2})
+        self.assertTrue(tracker.get()["exact"])
+        self.assertEqual(tracker.reconcile(), {"bytes": 15, "count": 1})
+
+    def test_gcs_overwrite_of_unknown_object(self):
+        tracker = SizeTracker("gs://bkt", self.path)
+        with mock.patch(
+            "ying.cloud_storage_size.get_bucket_objects_count_and_bytes", return_value={"bytes": 60, "count": 3}
+        ):
+            tracker.seed()
+        events = parse_events(gcs_message("OBJECT_FINALIZE", "a", 12, 2, overwroteGeneration="1"))
+        events += parse_events(gcs_message("OBJECT_DELETE", "a", 10, 1, overwrittenByGeneration="2"))
+        events += parse_events(gcs_message("OBJECT_DELETE", "c/d", 30, 5))
+        self.assertEqual(tracker.apply(events), 3)
+        self.assertEqual((tracker.get()["bytes"], tracker.get()["count"]), (32, 2))
+        self.assertTrue(tracker.get()["exact"])
+
+    def test_events_before_the_seed_are_skipped(self):
+        tracker = SizeTracker("s3://bkt", self.path)
+        tracker.seed(keys=True)
+        old = ObjectEvent("s3://bkt", "new", CREATED, 5, "1", 0.0, None)
+        self.assertEqual(tracker.apply([old]), 0)
+
+    def test_prefix(self):
+        tracker = SizeTracker("s3://bkt/c/", self.path)
+        self.assertEqual(tracker.seed(keys=True), {"bytes": 30, "count": 1})
+        tracker.apply([self.event(CREATED, "a2", 5, "2"), self.event(CREATED, "c/e", 5, "2")])
+        self.assertEqual(tracker.get()["bytes"], 35)
+
+    def test_prefix_totals(self):
+        self.objects = {"a": 10, "b": 20, "c/d": 30, "c/e": 40, "cc": 50}
+        tracker = SizeTracker("s3://bkt/c/", self.path)
+        self.assertEqual(tracker.seed(), {"bytes": 70, "count": 2})
+        tracker.apply([self.event(CREATED, "a2", 5, "2"), self.event(CREATED, "c/f", 5, "2")])
+        self.assertEqual((tracker.get()["bytes"], tracker.get()["count"]), (75, 3))
+
+        self.objects["c/g"] = 1
+        self.assertEqual(tracker.reconcile(), {"bytes": -4, "count": 0})
+        self.assertEqual((tracker.get()["bytes"], tracker.get()["count"]), (71, 3))
+        with self.assertRaises(ValueError):
+            tracker.seed(engine="metrics")
+
+    def test_unseeded(self):
+        with self.assertRaises(ValueError):
+            SizeTracker("s3://bkt", self.path).apply([])
+        with self.assertRaises(ValueError):
+            get_bucket_objects_count_and_bytes("s3://bkt", engine="tracker", tracker_path=self.path)
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.tracker = SizeTracker("s3://bkt", os.path.join(self.root, "tracker.sqlite3"))
+        with mock.patch(
+            "ying.cloud_storage_size.get_bucket_objects_count_and_bytes", return_value={"bytes": 0, "count": 0}
+        ):
+            self.tracker.seed()
+
+    def document(self, key, size, sequencer):
+        return json.dumps({"Records": [s3_record("ObjectCreated:Put", key, size, sequencer)]})
+
+    def test_file_source_resumes_from_the_committed_offset(self):
+        path = os.path.join(self.root, "events.jsonl")
+        with open(path, "w") as f:
+            f.write(self.document("a", 1, "1") + "\n" + self.document("b", 2, "1") + "\n" + self.document("c", 4, "1"))
+        self.assertEqual(self.tracker.consume(FileSource(path)), 2)
+        with open(path, "a") as f:
+            f.write("\n")
+        self.assertEqual(self.tracker.consume(FileSource(path)), 1)
+        self.assertEqual(self.tracker.get()["bytes"], 7)
+
+    def test_directory_source_moves_processed_files(self):
+        for index in range(3):
+            with open(os.path.join(self.root, f"{index}.json"), "w") as f:
+                f.write(self.document(f"k{index}", 1, "1"))
+        with open(os.path.join(self.root, "bad.json"), "w") as f:
+            f.write("{}")
+        source = DirectorySource(self.root)
+        self.assertEqual(self.tracker.consume(source), 3)
+        self.assertEqual(self.tracker.consume(source), 0)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, "processed"))), ["0.json", "1.json", "2.json", "bad.json"])
+
+    def test_queue_source(self):
+        events = queue.Queue()
+        for index in range(5):
+            events.put(self.document(f"k{index}", 2, "1"))
+        self.assertEqual(self.tracker.consume(QueueSource(events, batch_size=3)), 3)
+        self.assertEqual(self.tracker.consume(QueueSource(events)), 2)
+        self.assertEqual(self.tracker.get()["bytes"], 10)
+
+    def test_run_reconciles(self):
+        import threading
+
+        stop = threading.Event()
+        events = queue.Queue()
+        events.put(self.document("a", 3, "1"))
+        source = QueueSource(events)
+        receive = source.receive
+        source.receive = lambda timeout: (stop.set(), receive(timeout))[1]
+        with mock.patch(
+            "ying.cloud_storage_size.get_bucket_objects_count_and_bytes", return_value={"bytes": 4, "count": 1}
+        ) as get:
+            self.tracker.run(source, reconcile_every=1e-9, poll_timeout=0, stop=stop)
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(self.tracker.get()["bytes"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,21 @@
 import fire
-from ying.plog import run_command
 
 
 class ProgressLog(object):
-    def plog(self, cmd, mode):
-        run_command(cmd, mode)
+    def plog(self, cmd, mode, analyzer):
+        from ying.plog import run_command
+
+        run_command(cmd, mode, analyzer=analyzer)
+
+    def plog_batch(self, cmds, mode, max_parallel, analyzer):
+        from ying.plog import run_commands
+
+        run_commands(cmds, mode, max_parallel, analyzer)
+
+    def plog_tail(self, session, since):
+        from ying.plog import tail_session
+
+        tail_session(session, since)
 
 
 class Command(object):
@@ -12,8 +23,17 @@ class Command(object):
     def __init__(self):
         self.progress = ProgressLog()
 
-    def plog(self, cmd, mode='r'):
-        self.progress.plog(cmd, mode)
+    def plog(self, cmd, mode='r', analyzer=None):
+        """report the output of a command to Telegram, `--analyzer=raw` sends every output change"""
+        self.progress.plog(cmd, mode, analyzer)
+
+    def plog_batch(self, *cmds, mode='r', max_parallel=None, analyzer=None):
+        """run every command concurrently, e.g. `ying plog-batch "make a" "make b" --mode=a`"""
+        self.progress.plog_batch(list(cmds), mode, max_parallel, analyzer)
+
+    def plog_tail(self, session=None, since=None):
+        """recorded output of a plog session (the latest by default), e.g. `ying plog-tail --since 10m`"""
+        self.progress.plog_tail(session, since)
 
 
 def main():
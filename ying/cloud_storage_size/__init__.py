@@ -1,13 +1,58 @@
+import logging
+import importlib
 from urllib.parse import urlparse
-from ying.cloud_storage_size.list_object_count_and_bytes import (
-    list_object_count_and_bytes_rclone_by_env,
-    list_object_count_and_bytes_az,
-    list_object_count_and_bytes_s3,
-    list_object_count_and_bytes_oss,
-    list_object_count_and_bytes_minio,
-    list_object_count_and_bytes_gs,
-)
-from ying.cloud_storage_size.query_metrics import query_google_cloud_minitoring
+
+logger = logging.getLogger(__name__)
+
+# public names of the submodules, imported on first access (PEP 562) so that
+# importing the package does not load every engine
+_LAZY_ATTRIBUTES = {
+    "list_object_count_and_bytes": (
+        "list_object_count_and_bytes_az",
+        "list_object_count_and_bytes_s3",
+        "list_object_count_and_bytes_oss",
+        "list_object_count_and_bytes_minio",
+        "list_object_count_and_bytes_gs",
+        "list_object_count_and_bytes_sharded",
+        "iter_object_count_and_bytes",
+    ),
+    "query_metrics": (
+        "query_google_cloud_minitoring",
+        "query_google_cloud_minitoring_batch",
+        "query_aws_cloudwatch",
+        "query_azure_monitor",
+    ),
+    "cache": ("ResultCache", "get_default_cache", "get_known_count", "cache_key"),
+    "rclone": ("list_object_count_and_bytes_rclone_daemon", "find_rclone", "RCLONE_REMOTES"),
+    "inventory": ("query_inventory",),
+    "tracker": ("SizeTracker", "parse_events", "FileSource", "DirectorySource", "QueueSource"),
+    "sinks": ("ResultTable", "CSVSink", "JSONLSink", "ParquetSink", "CallbackSink", "open_sink", "export_results"),
+    "planner": ("plan_engines", "run_hedged", "get_budgets"),
+    "stats": (
+        "collect_stats",
+        "current_stats",
+        "has_stats_hooks",
+        "add_stats_hook",
+        "remove_stats_hook",
+        "PrometheusExporter",
+    ),
+}
+_LAZY_MODULES = {
+    name: module for module, names in _LAZY_ATTRIBUTES.items() for name in names
+}
+
+
+def __getattr__(name):
+    module = _LAZY_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_MODULES))
 
 
 def get_bucket_objects_count_and_bytes(bucket_uri, engine="auto", **kwargs):
@@ -17,55 +62,262 @@ def get_bucket_objects_count_and_bytes(bucket_uri, engine="auto", **kwargs):
         bucket_uri (cloud storage bucket uri):
             cloud storage bucket uri, e.g. "gs://bucket_name", "s3://bucket_name", "oss://bucket_name"
         engine (str, optional):
-            cloud storage engine, ["auto", "rclone", "metrics", "sdk"]. Defaults to "rclone",
-            metrics only support google cloud storage.
+            cloud storage engine, ["auto", "rclone", "metrics", "sdk", "inventory", "tracker"]. Defaults to "auto",
+            auto runs metrics first and hedges them with a listing engine under per-engine
+            deadlines, see `ying.cloud_storage_size.planner`; its latency budgets can be
+            overridden by keyword, e.g. `hedge_after=2, metrics_deadline=10`.
+            metrics support gs (`project_id` required) and s3 (CloudWatch, optional `region`).
+            Azure Monitor only reports whole storage accounts, az metrics need
+            `storage_account_resource_id` and `account_level=True` and return the totals of
+            every container of the account; auto never uses them.
+            inventory reads an S3 Inventory or GCS Storage Insights report (`inventory_manifest`
+            required: manifest path or uri, or a prefix ending with "/" to use the latest one),
+            with no listing at all, see `ying.cloud_storage_size.inventory`.
+            tracker reads the running totals of a bucket tracked from object notifications
+            (`tracker_path` optional), see `ying.cloud_storage_size.tracker`.
+        parallelism (int, optional):
+            sdk engine only, when greater than 1 the bucket is listed as one shard per
+            top-level prefix on `parallelism` worker threads. Defaults to 1.
+        resume (bool, optional):
+            sdk engine only (gs, s3, az, oss), checkpoint the listing progress under
+            `~/.config/ying/checkpoints` and continue an interrupted listing. Defaults to False.
+        breakdown_depth (int, optional):
+            sdk and inventory engines only, also return a nested per-prefix "breakdown" of bytes and
+            count up to this many "/" levels, computed in the same listing pass. Defaults to 0.
+        cache (bool or ResultCache, optional):
+            serve results from the on-disk cache under `~/.config/ying`, keyed by engine,
+            bucket uri and the arguments changing the result (`breakdown_depth`, `project_id`,
+            `region`, ...), see `ying.cloud_storage_size.cache`. Defaults to False.
+        stats (bool, optional):
+            add a "stats" dict of scan metrics (pages, api calls, retries, response
+            bytes, network and aggregation seconds, objects per second) to the result,
+            see `ying.cloud_storage_size.stats`. Defaults to False.
 
     Returns:
         dict: { "bytes": storage_bytes_value, "count": storage_count_value }
     """
+    from ying.cloud_storage_size.list_object_count_and_bytes import (
+        list_object_count_and_bytes_az,
+        list_object_count_and_bytes_s3,
+        list_object_count_and_bytes_oss,
+        list_object_count_and_bytes_minio,
+        list_object_count_and_bytes_gs,
+        list_object_count_and_bytes_sharded,
+    )
+    from ying.cloud_storage_size.query_metrics import (
+        query_google_cloud_minitoring,
+        query_aws_cloudwatch,
+        query_azure_monitor,
+    )
+    from ying.cloud_storage_size.cache import get_default_cache, get_known_count, cache_key
+    from ying.cloud_storage_size.rclone import (
+        list_object_count_and_bytes_rclone_daemon,
+        find_rclone,
+        RCLONE_REMOTES,
+    )
+    from ying.cloud_storage_size.inventory import query_inventory
+    from ying.cloud_storage_size.tracker import SizeTracker
+    from ying.cloud_storage_size.planner import plan_engines, run_hedged, get_budgets
+    from ying.cloud_storage_size.stats import collect_stats, current_stats, has_stats_hooks
+
+    collect = kwargs.pop("stats", False)
+    if current_stats() is None and (collect or has_stats_hooks()):
+        with collect_stats(bucket_uri, engine) as stats:
+            result = get_bucket_objects_count_and_bytes(bucket_uri, engine=engine, **kwargs)
+            stats.record_result(result)
+        if collect and isinstance(result, dict):
+            result = dict(result, stats=stats.to_dict())
+        return result
+
+    cache = kwargs.pop("cache", None)
+    if cache:
+        if cache is True:
+            cache = get_default_cache()
+        return cache.get_or_compute(
+            cache_key(engine, bucket_uri, **kwargs),
+            lambda: get_bucket_objects_count_and_bytes(bucket_uri, engine=engine, _known_count_cache=cache, **kwargs),
+        )
+    # the cache of the caller, read for the size hint of the planner
+    known_count_cache = kwargs.pop("_known_count_cache", None)
+
     parsed_url = urlparse(bucket_uri)
     scheme = parsed_url.scheme
     bucket_name = parsed_url.netloc
 
     def process_by_metrics():
-        if scheme != "gs":
-            raise ValueError("metrics only support google cloud storage")
-        if kwargs.get("project_id", None) is None:
-            raise ValueError("project_id is required")
-        project_id = kwargs.get("project_id")
-        return query_google_cloud_minitoring(project_id, bucket_name)
+        if scheme == "gs":
+            if kwargs.get("project_id", None) is None:
+                raise ValueError("project_id is required")
+            project_id = kwargs.get("project_id")
+            return query_google_cloud_minitoring(project_id, bucket_name)
+        elif scheme == "s3":
+            return query_aws_cloudwatch(bucket_name, kwargs.get("region", None))
+        elif scheme == "az":
+            if not kwargs.get("account_level", False):
+                raise ValueError(
+                    "azure metrics cover the whole storage account, not one container, pass account_level=True"
+                )
+            if kwargs.get("storage_account_resource_id", None) is None:
+                raise ValueError("storage_account_resource_id is required")
+            return query_azure_monitor(kwargs.get("storage_account_resource_id"))
+        else:
+            raise ValueError("metrics only support gs, s3 and az")
+
+    def is_metrics_miss(value):
+        return value is None or value["bytes"] < 0 or value["count"] < 0
 
-    def process_by_rclone():
-        return list_object_count_and_bytes_rclone_by_env(bucket_uri)
+    def process_by_rclone(timeout=None):
+        return list_object_count_and_bytes_rclone_daemon(bucket_uri, timeout)
 
     def process_by_sdk():
+        parallelism = kwargs.get("parallelism", 1)
+        lister_kwargs = {}
+        if kwargs.get("resume", False):
+            if scheme not in ("gs", "s3", "az", "oss"):
+                raise ValueError("resume only support gs, s3, az and oss")
+            lister_kwargs["resume"] = True
+        if kwargs.get("breakdown_depth", 0) > 0:
+            lister_kwargs["breakdown_depth"] = kwargs["breakdown_depth"]
+        if parallelism > 1:
+            return list_object_count_and_bytes_sharded(
+                scheme, bucket_name, parallelism, **lister_kwargs
+            )
+
         if scheme == "gs":
-            return list_object_count_and_bytes_gs(bucket_uri)
+            return list_object_count_and_bytes_gs(bucket_name, **lister_kwargs)
         elif scheme == "s3":
-            return list_object_count_and_bytes_s3(bucket_uri)
+            return list_object_count_and_bytes_s3(bucket_name, **lister_kwargs)
         elif scheme == "oss":
-            return list_object_count_and_bytes_oss(bucket_uri)
+            return list_object_count_and_bytes_oss(bucket_name, **lister_kwargs)
         elif scheme == "minio":
-            return list_object_count_and_bytes_minio(bucket_uri)
+            return list_object_count_and_bytes_minio(bucket_name, **lister_kwargs)
         elif scheme == "az":
-            return list_object_count_and_bytes_az(bucket_uri)
+            return list_object_count_and_bytes_az(bucket_name, **lister_kwargs)
         else:
             raise ValueError("unsupported scheme")
 
-    return_value = None
-    if engine == "auto":
-        if scheme == "gs":
-            return_value = process_by_metrics()
+    def process_by_inventory():
+        if kwargs.get("inventory_manifest", None) is None:
+            raise ValueError("inventory_manifest is required")
+        return query_inventory(kwargs["inventory_manifest"], kwargs.get("breakdown_depth", 0))
 
-        if return_value is None:
-            return_value = process_by_rclone()
+    def process_by_tracker():
+        value = SizeTracker(bucket_uri, kwargs.get("tracker_path", None)).get()
+        if value is None:
+            raise ValueError(f"{bucket_uri} is not tracked, seed a SizeTracker first")
+        return {"bytes": value["bytes"], "count": value["count"]}
 
-        if return_value is None:
-            return_value = process_by_sdk()
+    def process_by_planner():
+        # azure metrics are per storage account, never the answer for one container
+        has_metrics = (scheme == "gs" and kwargs.get("project_id", None) is not None) or scheme == "s3"
+        has_rclone = scheme in RCLONE_REMOTES and find_rclone() is not None
+        plans = plan_engines(
+            has_metrics, has_rclone, get_known_count(bucket_uri, known_count_cache), get_budgets(**kwargs)
+        )
+
+        def run_engine(name, deadline):
+            if name == "metrics":
+                return process_by_metrics()
+            elif name == "rclone":
+                return process_by_rclone(deadline)
+            return process_by_sdk()
+
+        _, value = run_hedged(plans, run_engine, lambda value: not is_metrics_miss(value))
+        return value
+
+    return_value = None
+    if engine == "auto":
+        return_value = process_by_planner()
     elif engine == "metrics":
         return_value = process_by_metrics()
     elif engine == "rclone":
         return_value = process_by_rclone()
     elif engine == "sdk":
         return_value = process_by_sdk()
+    elif engine == "inventory":
+        return_value = process_by_inventory()
+    elif engine == "tracker":
+        return_value = process_by_tracker()
     return return_value
+
+
+def get_many_bucket_objects_count_and_bytes(
+    bucket_uris, max_concurrency=8, per_bucket_timeout=None, engine="auto", **kwargs
+):
+    """get objects count and bytes of many buckets concurrently
+
+    Buckets are queried on a pool of `max_concurrency` threads and results are
+    yielded as soon as each bucket completes, a bucket listed twice is queried once. A failing or timed out bucket only
+    yields an error entry, the rest of the batch keeps running.
+
+    Args:
+        bucket_uris (list): cloud storage bucket uris
+        max_concurrency (int, optional): max buckets queried at once. Defaults to 8.
+        per_bucket_timeout (float, optional):
+            seconds a single bucket may run before it is reported as timed out.
+            The bucket is then cancelled: the sdk listers stop at their next page
+            and the rclone job at its next poll, a metrics call in flight still
+            runs to completion. Defaults to None (no limit).
+        engine (str, optional): passed to `get_bucket_objects_count_and_bytes`
+        **kwargs: passed to `get_bucket_objects_count_and_bytes`
+
+    Yields:
+        dict: { "bucket_uri": bucket_uri, "result": dict or None, "error": str or None }
+    """
+    import time
+    import threading
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from ying.cloud_storage_size.planner import run_cancellable
+
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be a positive integer")
+
+    started_at = {}
+    cancel_events = {}
+
+    def process(bucket_uri):
+        started_at[bucket_uri] = time.monotonic()
+        return run_cancellable(
+            cancel_events[bucket_uri], get_bucket_objects_count_and_bytes, bucket_uri, engine=engine, **kwargs
+        )
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    pending = {}
+    for uri in dict.fromkeys(bucket_uris):
+        cancel_events[uri] = threading.Event()
+        pending[executor.submit(contextvars.copy_context().run, process, uri)] = uri
+    try:
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=None if per_bucket_timeout is None else min(per_bucket_timeout, 1),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                bucket_uri = pending.pop(future)
+                try:
+                    yield {"bucket_uri": bucket_uri, "result": future.result(), "error": None}
+                except Exception as e:
+                    logger.error("[bucket_uri: %s] query failed: %s", bucket_uri, e)
+                    yield {"bucket_uri": bucket_uri, "result": None, "error": repr(e)}
+
+            if per_bucket_timeout is None:
+                continue
+            now = time.monotonic()
+            for future, bucket_uri in list(pending.items()):
+                start = started_at.get(bucket_uri)
+                if start is not None and now - start > per_bucket_timeout:
+                    pending.pop(future)
+                    cancel_events[bucket_uri].set()
+                    logger.error("[bucket_uri: %s] timed out after %ss", bucket_uri, per_bucket_timeout)
+                    yield {
+                        "bucket_uri": bucket_uri,
+                        "result": None,
+                        "error": f"timed out after {per_bucket_timeout}s",
+                    }
+    finally:
+        for future, bucket_uri in pending.items():
+            future.cancel()
+            cancel_events[bucket_uri].set()
+        executor.shutdown(wait=False)
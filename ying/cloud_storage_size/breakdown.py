@@ -0,0 +1,91 @@
+DEFAULT_MAX_PREFIXES = 100000
+
+
+class PrefixBreakdown(object):
+    """aggregate object bytes and count per "/" prefix, up to `depth` levels
+
+    Counters are kept in one flat dict of `prefix -> [bytes, count]`, so memory
+    depends on the number of distinct prefixes within `depth` levels, not on the
+    number of objects. Once `max_prefixes` prefixes are tracked, new prefixes are
+    no longer added and the breakdown is marked as truncated.
+    """
+
+    def __init__(self, depth=1, max_prefixes=DEFAULT_MAX_PREFIXES, counters=None, truncated=False):
+        if depth < 1:
+            raise ValueError("depth must be a positive integer")
+        self.depth = depth
+        self.max_prefixes = max_prefixes
+        self.counters = counters if counters is not None else {}
+        self.truncated = truncated
+
+    def add(self, key, size):
+        parts = key.split("/", self.depth)
+        counters = self.counters
+        prefix = ""
+        for part in parts[:-1]:
+            prefix += part + "/"
+            counter = counters.get(prefix)
+            if counter is None:
+                if len(counters) >= self.max_prefixes:
+                    self.truncated = True
+                    return
+                counter = counters[prefix] = [0, 0]
+            counter[0] += size
+            counter[1] += 1
+
+    def add_items(self, items):
+        for key, size in items:
+            self.add(key, size)
+
+    def add_counts(self, prefix, total_bytes, total_count):
+        """add pre-aggregated totals of a "/" terminated prefix, e.g. from a columnar group by"""
+        counter = self.counters.get(prefix)
+        if counter is None:
+            if len(self.counters) >= self.max_prefixes:
+                self.truncated = True
+                return
+            counter = self.counters[prefix] = [0, 0]
+        counter[0] += total_bytes
+        counter[1] += total_count
+
+    def state(self):
+        """json serializable state, see `from_state`"""
+        return {
+            "depth": self.depth,
+            "max_prefixes": self.max_prefixes,
+            "counters": self.counters,
+            "truncated": self.truncated,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(**state)
+
+    def to_dict(self):
+        """nested breakdown
+
+        Returns:
+            dict: { prefix: { "bytes": bytes, "count": count, "prefixes": { sub_prefix: {...} } } }
+        """
+        tree = {}
+        for prefix in sorted(self.counters):
+            total_bytes, total_count = self.counters[prefix]
+            node = {"bytes": total_bytes, "count": total_count, "prefixes": {}}
+            parent = prefix[: prefix.rfind("/", 0, len(prefix) - 1) + 1]
+            siblings = tree
+            if parent:
+                siblings = self._find(tree, parent)["prefixes"]
+            siblings[prefix] = node
+        return tree
+
+    @staticmethod
+    def _find(tree, prefix):
+        node = None
+        level = tree
+        end = 0
+        while True:
+            end = prefix.index("/", end) + 1
+            node = level[prefix[:end]]
+            if end == len(prefix):
+                return node
+            level = node["prefixes"]
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from ying.config import config_dir, settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = config_dir / "cache.sqlite3"
+DEFAULT_TTL = 3600
+DEFAULT_STALE_TTL = 86400
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class ResultCache(object):
+    """on-disk cache of bucket size results
+
+    An entry younger than `ttl` seconds is fresh and returned as is. An entry
+    younger than `ttl + stale_ttl` is stale, it's returned immediately while a
+    background thread recomputes it (stale-while-revalidate). Older entries are
+    recomputed in the foreground. At most `max_entries` are kept, the least
+    recently used ones are evicted first.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, stale_ttl=DEFAULT_STALE_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    def get(self, key):
+        """get a cached value
+
+        Returns:
+            tuple: (value, age_seconds) or None
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), now - row[1]
+
+    def set(self, key, value):
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            conn.execute(
+                "DELETE FROM results WHERE key NOT IN "
+                "(SELECT key FROM results ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def get_latest(self, key_prefix):
+        """the most recent value whose key is `key_prefix`, optionally followed by arguments
+
+        Returns:
+            tuple: (value, age_seconds) or None
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ? OR substr(key, 1, ?) = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key_prefix, len(key_prefix) + 1, key_prefix + "?"),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), time.time() - row[1]
+
+    def delete(self, key):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def _compute_and_set(self, key, compute):
+        value = compute()
+        if is_cacheable(value):
+            self.set(key, value)
+        return value
+
+    def _refresh_in_background(self, key, compute):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._compute_and_set(key, compute)
+            except Exception as e:
+                logger.error("[%s] background refresh failed: %s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_or_compute(self, key, compute):
+        """return the cached value of `key`, calling `compute()` when missing or expired"""
+        cached = self.get(key)
+        if cached is not None:
+            value, age = cached
+            if age < self.ttl:
+                return value
+            if age < self.ttl + self.stale_ttl:
+                logger.info("[%s] serve stale result, age %.0fs", key, age)
+                self._refresh_in_background(key, compute)
+                return value
+        return self._compute_and_set(key, compute)
+
+
+# engines of `get_bucket_objects_count_and_bytes` whose results are cached
+ENGINES = ("auto", "metrics", "sdk", "rclone", "inventory", "tracker")
+
+# keyword arguments of `get_bucket_objects_count_and_bytes` that change its result
+CACHE_KEY_ARGUMENTS = (
+    "account_level",
+    "breakdown_depth",
+    "inventory_manifest",
+    "project_id",
+    "region",
+    "storage_account_resource_id",
+    "tracker_path",
+)
+
+
+def cache_key(engine, bucket_uri, **kwargs):
+    """cache key of a query, "engine:bucket_uri" followed by its result-affecting arguments
+
+    e.g. "sdk:s3://bucket?breakdown_depth=2", unset arguments are left out.
+    """
+    from urllib.parse import urlencode
+
+    key = f"{engine}:{bucket_uri}"
+    arguments = [(name, kwargs[name]) for name in CACHE_KEY_ARGUMENTS if kwargs.get(name) not in (None, 0)]
+    if arguments:
+        key += "?" + urlencode([(name, str(value)) for name, value in arguments])
+    return key
+
+
+def is_cacheable(value):
+    """metrics misses (-1) and failed engines (None) are never cached"""
+    return isinstance(value, dict) and value.get("bytes", -1) >= 0 and value.get("count", -1) >= 0
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """process-wide cache configured by `cache_ttl`, `cache_stale_ttl` and `cache_max_entries` settings"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache(
+            ttl=settings.get("cache_ttl", DEFAULT_TTL),
+            stale_ttl=settings.get("cache_stale_ttl", DEFAULT_STALE_TTL),
+            max_entries=settings.get("cache_max_entries", DEFAULT_MAX_ENTRIES),
+        )
+    return _default_cache
+
+
+def get_known_count(bucket_uri, cache=None):
+    """last cached object count of a bucket by any engine
+
+    Args:
+        bucket_uri (str): bucket uri
+        cache (ResultCache, optional):
+            cache to read, defaults to the default cache, which is not created
+            when it doesn't exist yet
+
+    Returns:
+        int: object count of the most recent cached result, or None
+    """
+    if cache is None:
+        if not DEFAULT_CACHE_PATH.exists():
+            return None
+        cache = get_default_cache()
+    latest = None
+    for engine in ENGINES:
+        cached = cache.get_latest(f"{engine}:{bucket_uri}")
+        if cached is not None and (latest is None or cached[1] < latest[1]):
+            latest = cached
+    return None if latest is None else latest[0]["count"]
@@ -0,0 +1,71 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from ying.config import config_dir
+
+logger = logging.getLogger(__name__)
+
+checkpoint_dir = config_dir / "checkpoints"
+
+
+def checkpoint_path(scheme, bucket_name, prefix=None):
+    """path of the checkpoint file for one bucket (and optional prefix) listing"""
+    key = f"{scheme}://{bucket_name}/{prefix or ''}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return checkpoint_dir / f"{scheme}-{bucket_name}-{digest}.json"
+
+
+def load_checkpoint(scheme, bucket_name, prefix=None):
+    """load a listing checkpoint
+
+    Returns:
+        dict: { "token": next_page_token, "bytes": bytes_so_far, "count": count_so_far,
+                "pages": pages_so_far, "breakdown": breakdown_state, "breakdown_depth": depth,
+                "updated_at": unix_time } or None
+    """
+    path = checkpoint_path(scheme, bucket_name, prefix)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error("[%s] ignore unreadable checkpoint: %s", path, e)
+        return None
+    logger.info("[%s] resume from checkpoint: %s", path, state)
+    return state
+
+
+def save_checkpoint(
+    scheme, bucket_name, prefix, token, total_bytes, total_count, pages, breakdown=None, breakdown_depth=0
+):
+    """atomically save a listing checkpoint, `token` is the token of the next page to list
+
+    `breakdown` is the optional `PrefixBreakdown.state()` of the listing and
+    `breakdown_depth` its depth, 0 without breakdown.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = checkpoint_path(scheme, bucket_name, prefix)
+    state = {
+        "uri": f"{scheme}://{bucket_name}/{prefix or ''}",
+        "token": token,
+        "bytes": total_bytes,
+        "count": total_count,
+        "pages": pages,
+        "breakdown": breakdown,
+        "breakdown_depth": breakdown_depth,
+        "updated_at": time.time(),
+    }
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(scheme, bucket_name, prefix=None):
+    """remove a listing checkpoint once the listing completed"""
+    path = checkpoint_path(scheme, bucket_name, prefix)
+    if path.exists():
+        os.remove(path)
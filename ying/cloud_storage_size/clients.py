@@ -0,0 +1,285 @@
+"""process-wide registry of storage clients
+
+Clients are keyed by provider, endpoint and a fingerprint of the credentials,
+so repeated and concurrent listings reuse warm HTTP connection pools, and a
+rotated credential gets a new client. Pool sizes follow the `http_pool_size`
+setting. Provider API responses are recorded in the stats of the running scan.
+"""
+import os
+import hashlib
+import logging
+import threading
+from ying.config import settings
+from ying.cloud_storage_size.stats import record_requests_response, record_boto3_response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_POOL_SIZE = 32
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def http_pool_size():
+    return settings.get("http_pool_size", DEFAULT_HTTP_POOL_SIZE)
+
+
+def fingerprint(*values):
+    """short digest of credential values, secrets never end up in registry keys"""
+    digest = hashlib.sha256("\0".join(str(value) for value in values).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def get_or_create_client(key, factory):
+    """return the client registered under `key`, creating it with `factory()` when missing
+
+    `factory()` runs outside the registry lock, so a slow credential lookup
+    doesn't hold up the other clients. Threads racing on a missing key may
+    each create a client, the first one registered is kept and returned.
+    """
+    with _clients_lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+    logger.info("create storage client: %s", key[:2])
+    created = factory()
+    with _clients_lock:
+        return _clients.setdefault(key, created)
+
+
+def clear_clients():
+    """drop every registered client, e.g. after fork or credential rotation"""
+    with _clients_lock:
+        _clients.clear()
+
+
+def get_gcs_client():
+    """google cloud storage client, `GOOGLE_APPLICATION_CREDENTIALS` must be set
+
+    When `STORAGE_EMULATOR_HOST` is set (e.g. fake-gcs-server), an anonymous
+    client talking to the emulator is returned instead.
+    """
+    emulator_host = os.environ.get("STORAGE_EMULATOR_HOST", None)
+
+    def create_emulator():
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import storage
+
+        return storage.Client(project="emulator", credentials=AnonymousCredentials())
+
+    if emulator_host:
+        return get_or_create_client(("gs", emulator_host, ""), create_emulator)
+
+    def create():
+        import google.auth
+        import requests.adapters
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import storage
+
+        credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+        session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=http_pool_size(), pool_maxsize=http_pool_size()
+        )
+        session.mount("https://", adapter)
+        session.hooks["response"].append(record_requests_response)
+        return storage.Client(project=project, credentials=credentials, _http=session)
+
+    key = ("gs", "", fingerprint(os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")))
+    return get_or_create_client(key, create)
+
+
+def get_metric_service_client():
+    """google cloud monitoring client, `GOOGLE_APPLICATION_CREDENTIALS` must be set"""
+
+    def create():
+        from google.cloud import monitoring_v3
+
+        return monitoring_v3.MetricServiceClient()
+
+    key = ("gcm", "", fingerprint(os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")))
+    return get_or_create_client(key, create)
+
+
+def get_azure_metrics_client():
+    """azure monitor metrics client, credentials for `DefaultAzureCredential` must be set"""
+
+    def create():
+        from azure.identity import DefaultAzureCredential
+        from azure.monitor.query import MetricsQueryClient
+
+        return MetricsQueryClient(DefaultAzureCredential())
+
+    key = ("azmon", "", fingerprint(os.environ.get("AZURE_CLIENT_ID"), os.environ.get("AZURE_TENANT_ID")))
+    return get_or_create_client(key, create)
+
+
+def lean_response_parser_factory():
+    """botocore parser factory reading only the keys, sizes and pagination of ListObjectsV2 pages
+
+    botocore parses every field of every listed object into a dict, timestamps
+    included, which takes several times the CPU of reading the page itself.
+    Other operations are parsed as usual.
+    """
+    import xml.etree.ElementTree as ElementTree
+    from botocore.parsers import ResponseParserFactory, RestXMLParser
+
+    class LeanListObjectsParser(RestXMLParser):
+        def parse(self, response, shape):
+            if (
+                shape is None
+                or shape.name != "ListObjectsV2Output"
+                or response["status_code"] >= 300
+                or not response["body"]
+            ):
+                return super().parse(response, shape)
+
+            root = ElementTree.fromstring(response["body"])
+            namespace = root.tag[: root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            key_tag, size_tag = namespace + "Key", namespace + "Size"
+            headers = response["headers"]
+            parsed = {
+                "IsTruncated": root.findtext(namespace + "IsTruncated") == "true",
+                "ResponseMetadata": {
+                    "RequestId": headers.get("x-amz-request-id"),
+                    "HostId": headers.get("x-amz-id-2"),
+                    "HTTPStatusCode": response["status_code"],
+                    "HTTPHeaders": headers,
+                },
+            }
+            contents = [
+                {"Key": element.findtext(key_tag), "Size": int(element.findtext(size_tag))}
+                for element in root.iter(namespace + "Contents")
+            ]
+            if contents:
+                parsed["Contents"] = contents
+            prefixes = [
+                {"Prefix": element.findtext(namespace + "Prefix")}
+                for element in root.iter(namespace + "CommonPrefixes")
+            ]
+            if prefixes:
+                parsed["CommonPrefixes"] = prefixes
+            # with EncodingType "url", which boto3 asks for, botocore's after-call
+            # handler URL-decodes the keys and prefixes
+            for name in ("NextContinuationToken", "KeyCount", "EncodingType", "Prefix", "Delimiter", "StartAfter"):
+                value = root.findtext(namespace + name)
+                if value is not None:
+                    parsed[name] = int(value) if name == "KeyCount" else value
+            return parsed
+
+    class LeanResponseParserFactory(ResponseParserFactory):
+        def create_parser(self, protocol_name):
+            if protocol_name == "rest-xml":
+                return LeanListObjectsParser()
+            return super().create_parser(protocol_name)
+
+    return LeanResponseParserFactory()
+
+
+def get_boto3_client(service_name, region=None, lean=False):
+    """boto3 client, e.g. "s3" or "cloudwatch", boto3 clients are thread safe
+
+    A `lean` s3 client parses ListObjectsV2 pages into keys and sizes only,
+    see `lean_response_parser_factory`.
+    """
+
+    def create():
+        import boto3
+        import botocore.session
+        from botocore.config import Config
+
+        botocore_session = botocore.session.get_session()
+        if lean:
+            botocore_session.register_component("response_parser_factory", lean_response_parser_factory())
+        client = boto3.session.Session(botocore_session=botocore_session).client(
+            service_name,
+            region_name=region,
+            config=Config(max_pool_connections=http_pool_size()),
+        )
+        client.meta.events.register("after-call", record_boto3_response)
+        return client
+
+    key = (
+        service_name,
+        region or os.environ.get("AWS_DEFAULT_REGION", ""),
+        fingerprint(os.environ.get("AWS_PROFILE"), os.environ.get("AWS_ACCESS_KEY_ID")),
+        "lean" if lean else "",
+    )
+    return get_or_create_client(key, create)
+
+
+def get_azure_blob_service_client():
+    """azure blob service client, `AZURE_STORAGE_CONNECTION_STRING` must be set"""
+    conn_str = os.environ["AZURE_STORAGE_CONNECTION_STRING"]
+
+    def create():
+        import requests
+        import requests.adapters
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.storage.blob import BlobServiceClient
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=http_pool_size(), pool_maxsize=http_pool_size()
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].append(record_requests_response)
+        return BlobServiceClient.from_connection_string(
+            conn_str, transport=RequestsTransport(session=session, session_owner=False)
+        )
+
+    return get_or_create_client(("az", "", fingerprint(conn_str)), create)
+
+
+def get_oss_bucket(bucket_name):
+    """oss bucket, `OSS_ACCESS_KEY_ID`, `OSS_ACCESS_KEY_SECRET` must be set
+
+    Every bucket of the same endpoint and credentials shares one pooled session.
+    """
+    import oss2
+
+    access_key_id = os.environ["OSS_ACCESS_KEY_ID"]
+    access_key_secret = os.environ["OSS_ACCESS_KEY_SECRET"]
+    endpoint = os.environ['OSS_ENDPOINT'] or "oss-cn-hangzhou.aliyuncs.com"
+    credentials = fingerprint(access_key_id, access_key_secret)
+
+    def create_session():
+        session = oss2.Session(pool_size=http_pool_size())
+        session.session.hooks["response"].append(record_requests_response)
+        return session
+
+    session = get_or_create_client(("oss", endpoint, credentials), create_session)
+    return get_or_create_client(
+        ("oss", endpoint, credentials, bucket_name),
+        lambda: oss2.Bucket(
+            oss2.Auth(access_key_id, access_key_secret), endpoint, bucket_name, session=session
+        ),
+    )
+
+
+def get_minio_client():
+    """minio client, `MINIO_ENDPOINT`, `MINIO_ACCESS_KEY`, `MINIO_SECRET_KEY` must be set"""
+    endpoint = os.environ["MINIO_ENDPOINT"]
+    access_key = os.environ["MINIO_ACCESS_KEY"]
+    secret_key = os.environ["MINIO_SECRET_KEY"]
+
+    def create():
+        import urllib3
+        import minio
+
+        # same timeout and retries as the minio default pool, with our pool size
+        http_client = urllib3.PoolManager(
+            maxsize=http_pool_size(),
+            timeout=urllib3.util.Timeout(connect=300, read=300),
+            retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
+        return minio.Minio(
+            endpoint,
+            access_key=access_key,
+            secret_key=secret_key,
+            secure=False,
+            http_client=http_client,
+        )
+
+    return get_or_create_client(("minio", endpoint, fingerprint(access_key, secret_key)), create)
@@ -0,0 +1,263 @@
+import io
+import os
+import gzip
+import json
+import logging
+import posixpath
+from urllib.parse import urlparse, unquote_plus
+
+logger = logging.getLogger(__name__)
+
+# column names of the object key and size, per inventory flavour and format
+S3_COLUMNS = {"csv": ("Key", "Size"), "parquet": ("key", "size"), "orc": ("key", "size")}
+GCS_COLUMNS = ("name", "size")
+
+
+def open_uri(uri):
+    """open a local path, `s3://bucket/key` or `gs://bucket/name` for binary reading"""
+    from ying.cloud_storage_size.clients import get_boto3_client, get_gcs_client
+
+    parsed_url = urlparse(uri)
+    key = parsed_url.path.lstrip("/")
+    if parsed_url.scheme == "s3":
+        return get_boto3_client("s3").get_object(Bucket=parsed_url.netloc, Key=key)["Body"]
+    elif parsed_url.scheme == "gs":
+        return get_gcs_client().bucket(parsed_url.netloc).blob(key).open("rb")
+    elif parsed_url.scheme in ("", "file"):
+        return open(parsed_url.path if parsed_url.scheme else uri, "rb")
+    raise ValueError("inventory only support local, s3 and gs files")
+
+
+def find_latest_manifest(prefix_uri):
+    """latest `manifest.json` (S3 Inventory) or `*_manifest.json` (GCS) below a prefix
+
+    Inventory manifests live in dated folders, so the latest one sorts last.
+    """
+    from ying.cloud_storage_size.list_object_count_and_bytes import PAGE_ITERATORS
+
+    parsed_url = urlparse(prefix_uri)
+    if parsed_url.scheme in ("", "file"):
+        root = parsed_url.path if parsed_url.scheme else prefix_uri
+        manifests = [
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(root)
+            for name in names
+            if name.endswith("manifest.json")
+        ]
+    elif parsed_url.scheme in ("s3", "gs"):
+        pages = PAGE_ITERATORS[parsed_url.scheme](parsed_url.netloc, parsed_url.path.lstrip("/"))
+        manifests = [
+            f"{parsed_url.scheme}://{parsed_url.netloc}/{key}"
+            for items, _ in pages
+            for key, _ in items
+            if key.endswith("manifest.json")
+        ]
+    else:
+        raise ValueError("inventory only support local, s3 and gs files")
+    if not manifests:
+        raise ValueError(f"no inventory manifest below {prefix_uri}")
+    return max(manifests)
+
+
+def parse_manifest(manifest, manifest_uri):
+    """normalize an S3 Inventory or GCS Storage Insights manifest
+
+    Returns:
+        dict: { "format": "csv" | "parquet" | "orc", "files": [uri, ...],
+                "key_column": name, "size_column": name, "delimiter": str,
+                "column_names": [...] or None when the CSV has a header row,
+                "quoted_keys": bool }
+    """
+    manifest_dir = posixpath.dirname(manifest_uri)
+    is_local = urlparse(manifest_uri).scheme in ("", "file")
+
+    if "files" in manifest and "fileFormat" in manifest:
+        # S3 Inventory, data files are keys of the destination bucket
+        file_format = manifest["fileFormat"].lower()
+        destination_bucket = manifest["destinationBucket"].split(":::")[-1]
+        files = []
+        for entry in manifest["files"]:
+            if is_local:
+                # same layout as the bucket: <config>/<date>/manifest.json and <config>/data/
+                name = posixpath.basename(entry["key"])
+                candidates = [
+                    posixpath.join(manifest_dir, "..", "data", name),
+                    posixpath.join(manifest_dir, name),
+                ]
+                files.append(next((path for path in candidates if os.path.exists(path)), candidates[0]))
+            else:
+                files.append(f"s3://{destination_bucket}/{entry['key']}")
+        key_column, size_column = S3_COLUMNS[file_format]
+        column_names = None
+        if file_format == "csv":
+            column_names = [name.strip() for name in manifest["fileSchema"].split(",")]
+        return {
+            "format": file_format,
+            "files": files,
+            "key_column": key_column,
+            "size_column": size_column,
+            "column_names": column_names,
+            "delimiter": ",",
+            # S3 Inventory CSV keys are URL encoded
+            "quoted_keys": file_format == "csv",
+        }
+
+    if "report_shards_file_names" in manifest:
+        # GCS Storage Insights, shards are next to the manifest
+        report_config = manifest.get("report_config", {})
+        csv_options = report_config.get("csvOptions") or report_config.get("csv_options") or {}
+        file_format = "parquet" if (
+            report_config.get("parquetOptions") is not None
+            or report_config.get("parquet_options") is not None
+        ) else "csv"
+        return {
+            "format": file_format,
+            "files": [
+                posixpath.join(manifest_dir, name) for name in manifest["report_shards_file_names"]
+            ],
+            "key_column": GCS_COLUMNS[0],
+            "size_column": GCS_COLUMNS[1],
+            "column_names": None,
+            "delimiter": csv_options.get("delimiter", ","),
+            "quoted_keys": False,
+        }
+
+    raise ValueError(f"unknown inventory manifest format: {manifest_uri}")
+
+
+def iter_batches(uri, spec, with_keys):
+    """yield pyarrow record batches holding only the size (and key) columns of one data file"""
+    import pyarrow as pa
+
+    columns = [spec["size_column"]] + ([spec["key_column"]] if with_keys else [])
+    f = open_uri(uri)
+    try:
+        if spec["format"] in ("parquet", "orc") and not f.seekable():
+            # footers are read first, S3 bodies are plain streams
+            f = io.BytesIO(f.read())
+        if spec["format"] == "parquet":
+            import pyarrow.parquet as pq
+
+            yield from pq.ParquetFile(f).iter_batches(columns=columns)
+        elif spec["format"] == "orc":
+            import pyarrow.orc as orc
+
+            orc_file = orc.ORCFile(f)
+            for stripe in range(orc_file.nstripes):
+                yield orc_file.read_stripe(stripe, columns=columns)
+        else:
+            import pyarrow.csv as csv
+
+            if uri.endswith(".gz"):
+                f = gzip.GzipFile(fileobj=f)
+            reader = csv.open_csv(
+                f,
+                read_options=csv.ReadOptions(
+                    column_names=spec["column_names"],
+                    autogenerate_column_names=False,
+                    block_size=16 << 20,
+                ),
+                parse_options=csv.ParseOptions(delimiter=spec["delimiter"]),
+                convert_options=csv.ConvertOptions(
+                    include_columns=columns,
+                    column_types={spec["size_column"]: pa.int64(), spec["key_column"]: pa.string()},
+                ),
+            )
+            yield from reader
+    finally:
+        f.close()
+
+
+def aggregate_file(uri, spec, breakdown_depth=0):
+    """bytes, count and per-prefix counters of one data file, vectorized with pyarrow
+
+    Returns:
+        tuple: (bytes, count, { prefix: [bytes, count] })
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    total_bytes = 0
+    total_count = 0
+    counters = {}
+    for batch in iter_batches(uri, spec, breakdown_depth > 0):
+        sizes = pc.fill_null(batch.column(spec["size_column"]), 0)
+        total_bytes += pc.sum(sizes).as_py() or 0
+        total_count += batch.num_rows
+        if breakdown_depth <= 0:
+            continue
+
+        keys = batch.column(spec["key_column"])
+        if spec["quoted_keys"]:
+            # split on encoded separators too, prefixes are unquoted once aggregated
+            keys = pc.replace_substring(pc.replace_substring(keys, "%2F", "/"), "%2f", "/")
+        for depth in range(1, breakdown_depth + 1):
+            prefixes = pc.struct_field(
+                pc.extract_regex(keys, f"^(?P<prefix>(?:[^/]*/){{{depth}}})"), [0]
+            )
+            grouped = (
+                pa.table({"prefix": prefixes, "size": sizes})
+                .filter(pc.is_valid(prefixes))
+                .group_by("prefix")
+                .aggregate([("size", "sum"), ("size", "count")])
+            )
+            for prefix, prefix_bytes, prefix_count in zip(
+                grouped.column("prefix").to_pylist(),
+                grouped.column("size_sum").to_pylist(),
+                grouped.column("size_count").to_pylist(),
+            ):
+                counter = counters.setdefault(prefix, [0, 0])
+                counter[0] += prefix_bytes
+                counter[1] += prefix_count
+    return total_bytes, total_count, counters
+
+
+def query_inventory(manifest_uri, breakdown_depth=0, parallelism=4):
+    """bucket objects size and count from an inventory report
+
+    1. `pip install pyarrow`
+    2. an S3 Inventory or GCS Storage Insights report (CSV, ORC or Parquet)
+
+    Data files are streamed, only the size (and, for a breakdown, key) columns
+    are read and summed with pyarrow compute kernels, on `parallelism` threads.
+    Inventories of versioned buckets count every listed version.
+
+    Args:
+        manifest_uri (string):
+            local path, `s3://` or `gs://` uri of the manifest. A uri ending with "/"
+            is a prefix, the latest manifest below it is used.
+        breakdown_depth (int, optional): per-prefix breakdown depth, see `count_pages`
+        parallelism (int, optional): data files aggregated at once. Defaults to 4.
+
+    Returns:
+        dict: { "bytes": storage_bytes_value, "count": storage_count_value },
+            with a nested "breakdown" when `breakdown_depth` is positive
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from ying.cloud_storage_size.breakdown import PrefixBreakdown
+
+    if manifest_uri.endswith("/"):
+        manifest_uri = find_latest_manifest(manifest_uri)
+    with open_uri(manifest_uri) as f:
+        spec = parse_manifest(json.load(f), manifest_uri)
+    logger.info("[%s] %d %s inventory files", manifest_uri, len(spec["files"]), spec["format"])
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        results = list(
+            executor.map(lambda uri: aggregate_file(uri, spec, breakdown_depth), spec["files"])
+        )
+
+    result = {
+        "bytes": sum(file_bytes for file_bytes, _, _ in results),
+        "count": sum(file_count for _, file_count, _ in results),
+    }
+    if breakdown_depth > 0:
+        breakdown = PrefixBreakdown(breakdown_depth)
+        for _, _, counters in results:
+            for prefix, (prefix_bytes, prefix_count) in sorted(counters.items()):
+                if spec["quoted_keys"]:
+                    prefix = unquote_plus(prefix)
+                breakdown.add_counts(prefix, prefix_bytes, prefix_count)
+        result["breakdown"] = breakdown.to_dict()
+        result["breakdown_truncated"] = breakdown.truncated
+    return result
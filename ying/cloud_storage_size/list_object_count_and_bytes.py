@@ -4,7 +4,256 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def list_object_count_and_bytes_gs(bucket_name):
+def count_pages(
+    iter_pages, scheme, bucket_name, prefix=None, resume=False, breakdown_depth=0, checkpoint_every=100
+):
+    """sum the object sizes of a paged listing, optionally checkpointed
+
+    Args:
+        iter_pages (callable):
+            `iter_pages(page_token)` yields `([(key, size), ...], next_page_token)`
+            for every page, starting at `page_token` (None for the first page)
+        scheme (string): storage scheme, part of the checkpoint key
+        bucket_name (string): bucket name, part of the checkpoint key
+        prefix (string, optional): listed prefix, part of the checkpoint key
+        resume (bool, optional):
+            save the next page token and running totals every `checkpoint_every`
+            pages and continue from a previous checkpoint if one exists. The
+            checkpoint is removed once the listing completes. Defaults to False.
+        breakdown_depth (int, optional):
+            when positive, also aggregate bytes and count per prefix up to this many
+            "/" levels, see `PrefixBreakdown`. Defaults to 0 (no breakdown).
+        checkpoint_every (int, optional): pages between checkpoints. Defaults to 100.
+
+    Returns:
+        dict: { "bytes": storage_bytes_value, "count": storage_count_value },
+            with a nested "breakdown" when `breakdown_depth` is positive
+    """
+    import time
+    from ying.cloud_storage_size.breakdown import PrefixBreakdown
+    from ying.cloud_storage_size.stats import current_stats
+    from ying.cloud_storage_size.planner import raise_if_cancelled
+    from ying.cloud_storage_size.checkpoint import (
+        load_checkpoint,
+        save_checkpoint,
+        clear_checkpoint,
+    )
+
+    page_token = None
+    total_bytes = 0
+    total_count = 0
+    pages = 0
+    breakdown = PrefixBreakdown(breakdown_depth) if breakdown_depth > 0 else None
+    if resume:
+        state = load_checkpoint(scheme, bucket_name, prefix)
+        if state is not None and state.get("breakdown_depth", 0) != breakdown_depth:
+            # the breakdown would only cover the pages listed after the checkpoint
+            logger.warning(
+                "[%s://%s] discard checkpoint of breakdown depth %s, listing with depth %s",
+                scheme, bucket_name, state.get("breakdown_depth", 0), breakdown_depth,
+            )
+            clear_checkpoint(scheme, bucket_name, prefix)
+            state = None
+        if state is not None:
+            page_token = state["token"]
+            total_bytes = state["bytes"]
+            total_count = state["count"]
+            pages = state["pages"]
+            if breakdown is not None:
+                breakdown = PrefixBreakdown.from_state(state["breakdown"])
+
+    stats = current_stats()
+    page_iterator = iter(iter_pages(page_token))
+    while True:
+        raise_if_cancelled()
+        fetch_started_at = time.perf_counter()
+        try:
+            items, next_page_token = next(page_iterator)
+        except StopIteration:
+            break
+        fetched_at = time.perf_counter()
+        page_bytes = sum(size for _, size in items)
+        total_bytes += page_bytes
+        total_count += len(items)
+        if breakdown is not None:
+            breakdown.add_items(items)
+        if stats is not None:
+            stats.record_page(
+                len(items), page_bytes, fetched_at - fetch_started_at, time.perf_counter() - fetched_at
+            )
+        pages += 1
+        if resume and next_page_token and pages % checkpoint_every == 0:
+            save_checkpoint(
+                scheme, bucket_name, prefix, next_page_token, total_bytes, total_count, pages,
+                breakdown=breakdown.state() if breakdown is not None else None,
+                breakdown_depth=breakdown_depth,
+            )
+
+    if resume:
+        clear_checkpoint(scheme, bucket_name, prefix)
+
+    result = {"bytes": total_bytes, "count": total_count}
+    if breakdown is not None:
+        result["breakdown"] = breakdown.to_dict()
+        result["breakdown_truncated"] = breakdown.truncated
+    return result
+
+
+def use_lean_listing(lean=None):
+    """whether listings read only keys and sizes from raw pages, setting `lean_listing` (False) when None
+
+    The lean gcs and azure listings go through SDK internals, checked against
+    google-cloud-storage 3.17 and azure-storage-blob 12.31, so they are opt-in.
+    """
+    if lean is None:
+        from ying.config import settings
+
+        lean = settings.get("lean_listing", False)
+    return lean
+
+
+def iter_pages_gs(bucket_name, prefix=None, page_token=None, lean=None):
+    """yield `([(key, size), ...], next_page_token)` for every page of a gcs listing
+
+    The lean listing asks the JSON API for the name and size of 1000 objects
+    per page (`fields=items(name,size),nextPageToken`) and reads them from the
+    response, instead of building a `Blob` from every object resource.
+    """
+    from ying.cloud_storage_size.clients import get_gcs_client
+
+    client = get_gcs_client()
+    if not use_lean_listing(lean):
+        blobs = client.bucket(bucket_name).list_blobs(prefix=prefix, page_token=page_token)
+        for page in blobs.pages:
+            items = [(blob.name, blob.size) for blob in page]
+            yield items, blobs.next_page_token
+        return
+
+    from google.cloud.storage.retry import DEFAULT_RETRY
+
+    query_params = {"fields": "items(name,size),nextPageToken", "maxResults": 1000, "projection": "noAcl"}
+    if prefix:
+        query_params["prefix"] = prefix
+    while True:
+        if page_token:
+            query_params["pageToken"] = page_token
+        response = client._connection.api_request(
+            method="GET", path=f"/b/{bucket_name}/o", query_params=query_params, retry=DEFAULT_RETRY
+        )
+        items = [(item["name"], int(item["size"])) for item in response.get("items", ())]
+        page_token = response.get("nextPageToken")
+        yield items, page_token
+        if not page_token:
+            break
+
+
+def iter_pages_az(bucket_name, prefix=None, page_token=None, lean=None):
+    """yield `([(key, size), ...], next_page_token)` for every page of an azure listing
+
+    The SDK has no field selection and deserializes every blob into generated
+    models and then a `BlobProperties`. The lean listing sends the List Blobs
+    request of 5000 blobs (the service maximum) through the container client
+    pipeline, authentication and retries included, and reads the names and
+    sizes from the XML page.
+    """
+    from ying.cloud_storage_size.clients import get_azure_blob_service_client
+
+    container_client = get_azure_blob_service_client().get_container_client(bucket_name)
+    if not use_lean_listing(lean):
+        pager = container_client.list_blobs(name_starts_with=prefix).by_page(
+            continuation_token=page_token
+        )
+        for page in pager:
+            items = [(blob.name, blob.size) for blob in page]
+            yield items, pager.continuation_token
+        return
+
+    import xml.etree.ElementTree as ElementTree
+    from urllib.parse import unquote
+    from azure.core.rest import HttpRequest
+
+    params = {"restype": "container", "comp": "list", "maxresults": 5000}
+    if prefix:
+        params["prefix"] = prefix
+    while True:
+        if page_token:
+            params["marker"] = page_token
+        request = HttpRequest(
+            "GET",
+            container_client.url,
+            params=params,
+            headers={"x-ms-version": container_client.api_version, "Accept": "application/xml"},
+        )
+        # streamed, or the pipeline parses the XML body a second time
+        response = container_client._client._client.send_request(request, stream=True)
+        response.raise_for_status()
+        root = ElementTree.fromstring(response.read())
+        items = []
+        for blob in root.iter("Blob"):
+            name = blob.find("Name")
+            # names with characters invalid in XML are sent URL-encoded
+            key = unquote(name.text) if name.get("Encoded") == "true" else name.text
+            items.append((key, int(blob.findtext("Properties/Content-Length"))))
+        page_token = root.findtext("NextMarker") or None
+        yield items, page_token
+        if not page_token:
+            break
+
+
+def iter_pages_s3(bucket_name, prefix=None, page_token=None, lean=None):
+    """yield `([(key, size), ...], next_page_token)` for every page of an s3 listing
+
+    The lean listing parses the pages into keys and sizes only, see
+    `ying.cloud_storage_size.clients.lean_response_parser_factory`.
+    """
+    from ying.cloud_storage_size.clients import get_boto3_client
+
+    client = get_boto3_client("s3", lean=use_lean_listing(lean))
+    while True:
+        request = {"Bucket": bucket_name, "Prefix": prefix or "", "MaxKeys": 1000}
+        if page_token:
+            request["ContinuationToken"] = page_token
+        response = client.list_objects_v2(**request)
+        items = [(obj["Key"], obj["Size"]) for obj in response.get("Contents", [])]
+        page_token = response.get("NextContinuationToken")
+        yield items, page_token
+        if not response.get("IsTruncated") or not page_token:
+            break
+
+
+def iter_pages_oss(bucket_name, prefix=None, page_token=None):
+    """yield `([(key, size), ...], next_marker)` for every page of an oss listing"""
+    from ying.cloud_storage_size.clients import get_oss_bucket
+
+    bucket = get_oss_bucket(bucket_name)
+    marker = page_token or ""
+    while True:
+        result = bucket.list_objects(prefix=prefix or "", marker=marker, max_keys=1000)
+        items = [(obj.key, obj.size) for obj in result.object_list]
+        marker = result.next_marker if result.is_truncated else None
+        yield items, marker
+        if not marker:
+            break
+
+
+def iter_pages_minio(bucket_name, prefix=None, page_token=None):
+    """yield `([(key, size), ...], None)` for every 1000 objects of a minio listing
+
+    The minio client hides its pagination, so its listing can't be resumed and
+    `page_token` is ignored.
+    """
+    import itertools
+    from ying.cloud_storage_size.clients import get_minio_client
+
+    objects = get_minio_client().list_objects(bucket_name, prefix=prefix, recursive=True)
+    while True:
+        items = [(obj.object_name, obj.size) for obj in itertools.islice(objects, 1000)]
+        if not items:
+            break
+        yield items, None
+
+
+def list_object_count_and_bytes_gs(bucket_name, prefix=None, resume=False, breakdown_depth=0):
     """list gcs bucket objects size and count
 
     1. `pip install google-cloud-storage`
@@ -12,26 +261,20 @@ def list_object_count_and_bytes_gs(bucket_name):
 
     Args:
         bucket_name (string): bucket name
+        prefix (string, optional): only count objects under this prefix
+        resume (bool, optional): checkpoint progress and resume, see `count_pages`
+        breakdown_depth (int, optional): per-prefix breakdown depth, see `count_pages`
 
     Returns:
         dict: { "bytes": storage_bytes_value, "count": storage_count_value }
     """
-    import time
-    from google.cloud import storage
-
-    client = storage.Client()
-    bucket = client.get_bucket(bucket_name)
-
-    total_bytes = 0
-    total_count = 0
-    for blob in bucket.list_blobs():
-        total_bytes += blob.size
-        total_count += 1
-
-    return {"bytes": total_bytes, "count": total_count}
+    return count_pages(
+        lambda page_token: iter_pages_gs(bucket_name, prefix, page_token),
+        "gs", bucket_name, prefix, resume, breakdown_depth,
+    )
 
 
-def list_object_count_and_bytes_az(bucket_name):
+def list_object_count_and_bytes_az(bucket_name, prefix=None, resume=False, breakdown_depth=0):
     """list azure blob storage objects size and count
 
     1. `pip install azure-storage-blob`
@@ -39,29 +282,20 @@ def list_object_count_and_bytes_az(bucket_name):
 
     Args:
         bucket_name (string): bucket name
+        prefix (string, optional): only count objects under this prefix
+        resume (bool, optional): checkpoint progress and resume, see `count_pages`
+        breakdown_depth (int, optional): per-prefix breakdown depth, see `count_pages`
 
     Returns:
         dict: { "bytes": storage_bytes_value, "count": storage_count_value }
     """
-    import os
-    from azure.storage.blob import BlobServiceClient
-
-    blob_service_client = BlobServiceClient.from_connection_string(
-        os.environ["AZURE_STORAGE_CONNECTION_STRING"]
+    return count_pages(
+        lambda page_token: iter_pages_az(bucket_name, prefix, page_token),
+        "az", bucket_name, prefix, resume, breakdown_depth,
     )
 
-    container_client = blob_service_client.get_container_client(bucket_name)
 
-    total_size = 0
-    total_count = 0
-    for blob in container_client.list_blobs():
-        total_size += blob.size
-        total_count += 1
-
-    return {"bytes": total_size, "count": total_count}
-
-
-def list_object_count_and_bytes_s3(bucket_name):
+def list_object_count_and_bytes_s3(bucket_name, prefix=None, resume=False, breakdown_depth=0):
     """list s3 bucket objects size and count
 
     1. `pip install boto3`
@@ -69,26 +303,20 @@ def list_object_count_and_bytes_s3(bucket_name):
 
     Args:
         bucket_name (string): bucket name
+        prefix (string, optional): only count objects under this prefix
+        resume (bool, optional): checkpoint progress and resume, see `count_pages`
+        breakdown_depth (int, optional): per-prefix breakdown depth, see `count_pages`
 
     Returns:
         dict: { "bytes": storage_bytes_value, "count": storage_count_value }
     """
-    import boto3
-
-    s3 = boto3.resource("s3")
-
-    bucket = s3.Bucket(bucket_name)
-
-    total_size = 0
-    total_count = 0
-    for obj in bucket.objects.all():
-        total_size += obj.size
-        total_count += 1
-
-    return {"bytes": total_size, "count": total_count}
+    return count_pages(
+        lambda page_token: iter_pages_s3(bucket_name, prefix, page_token),
+        "s3", bucket_name, prefix, resume, breakdown_depth,
+    )
 
 
-def list_object_count_and_bytes_oss(bucket_name):
+def list_object_count_and_bytes_oss(bucket_name, prefix=None, resume=False, breakdown_depth=0):
     """list oss bucket objects size and count
 
     1. `pip install oss2`
@@ -96,27 +324,20 @@ def list_object_count_and_bytes_oss(bucket_name):
 
     Args:
         bucket_name (string): bucket name
+        prefix (string, optional): only count objects under this prefix
+        resume (bool, optional): checkpoint progress and resume, see `count_pages`
+        breakdown_depth (int, optional): per-prefix breakdown depth, see `count_pages`
 
     Returns:
         dict: { "bytes": storage_bytes_value, "count": storage_count_value }
     """
-    import oss2
-
-    auth = oss2.Auth(
-        os.environ["OSS_ACCESS_KEY_ID"], os.environ["OSS_ACCESS_KEY_SECRET"]
+    return count_pages(
+        lambda page_token: iter_pages_oss(bucket_name, prefix, page_token),
+        "oss", bucket_name, prefix, resume, breakdown_depth,
     )
-    bucket = oss2.Bucket(auth, os.environ['OSS_ENDPOINT'] or "oss-cn-hangzhou.aliyuncs.com", bucket_name)
-
-    total_size = 0
-    total_count = 0
-    for obj in oss2.ObjectIterator(bucket):
-        total_size += obj.size
-        total_count += 1
 
-    return {"bytes": total_size, "count": total_count}
 
-
-def list_object_count_and_bytes_minio(bucket_name):
+def list_object_count_and_bytes_minio(bucket_name, prefix=None, breakdown_depth=0):
     """list minio bucket objects size and count
 
     1. `pip install minio`
@@ -124,27 +345,279 @@ def list_object_count_and_bytes_minio(bucket_name):
 
     Args:
         bucket_name (string): bucket name
+        prefix (string, optional): only count objects under this prefix
+        breakdown_depth (int, optional): per-prefix breakdown depth, see `count_pages`
 
     Returns:
         dict: { "bytes": storage_bytes_value, "count": storage_count_value }
     """
-    import os
-    import minio
-
-    client = minio.Minio(
-        os.environ["MINIO_ENDPOINT"],
-        access_key=os.environ["MINIO_ACCESS_KEY"],
-        secret_key=os.environ["MINIO_SECRET_KEY"],
-        secure=False,
+    return count_pages(
+        lambda page_token: iter_pages_minio(bucket_name, prefix, page_token),
+        "minio", bucket_name, prefix, breakdown_depth=breakdown_depth,
     )
 
-    total_size = 0
+
+def list_top_level_gs(bucket_name):
+    """list gcs bucket root objects and top-level prefixes with a "/" delimiter
+
+    Returns:
+        tuple: ({ "bytes": root_bytes, "count": root_count }, [prefix, ...])
+    """
+    from ying.cloud_storage_size.clients import get_gcs_client
+
+    bucket = get_gcs_client().bucket(bucket_name)
+
+    total_bytes = 0
     total_count = 0
-    for obj in client.list_objects(bucket_name, recursive=True):
-        total_size += obj.size
+    iterator = bucket.list_blobs(delimiter="/")
+    for blob in iterator:
+        total_bytes += blob.size
         total_count += 1
 
-    return {"bytes": total_size, "count": total_count}
+    return {"bytes": total_bytes, "count": total_count}, sorted(iterator.prefixes)
+
+
+def list_top_level_az(bucket_name):
+    """list azure container root blobs and top-level prefixes with a "/" delimiter
+
+    Returns:
+        tuple: ({ "bytes": root_bytes, "count": root_count }, [prefix, ...])
+    """
+    from azure.storage.blob import BlobPrefix
+    from ying.cloud_storage_size.clients import get_azure_blob_service_client
+
+    container_client = get_azure_blob_service_client().get_container_client(bucket_name)
+
+    total_size = 0
+    total_count = 0
+    prefixes = []
+    for item in container_client.walk_blobs(delimiter="/"):
+        if isinstance(item, BlobPrefix):
+            prefixes.append(item.name)
+        else:
+            total_size += item.size
+            total_count += 1
+
+    return {"bytes": total_size, "count": total_count}, prefixes
+
+
+def list_top_level_s3(bucket_name):
+    """list s3 bucket root objects and top-level prefixes with a "/" delimiter
+
+    Returns:
+        tuple: ({ "bytes": root_bytes, "count": root_count }, [prefix, ...])
+    """
+    from ying.cloud_storage_size.clients import get_boto3_client
+
+    client = get_boto3_client("s3")
+    paginator = client.get_paginator("list_objects_v2")
+
+    total_size = 0
+    total_count = 0
+    prefixes = []
+    for page in paginator.paginate(Bucket=bucket_name, Delimiter="/"):
+        for obj in page.get("Contents", []):
+            total_size += obj["Size"]
+            total_count += 1
+        for common_prefix in page.get("CommonPrefixes", []):
+            prefixes.append(common_prefix["Prefix"])
+
+    return {"bytes": total_size, "count": total_count}, prefixes
+
+
+def list_top_level_oss(bucket_name):
+    """list oss bucket root objects and top-level prefixes with a "/" delimiter
+
+    Returns:
+        tuple: ({ "bytes": root_bytes, "count": root_count }, [prefix, ...])
+    """
+    import oss2
+    from ying.cloud_storage_size.clients import get_oss_bucket
+
+    bucket = get_oss_bucket(bucket_name)
+
+    total_size = 0
+    total_count = 0
+    prefixes = []
+    for obj in oss2.ObjectIterator(bucket, delimiter="/"):
+        if obj.is_prefix():
+            prefixes.append(obj.key)
+        else:
+            total_size += obj.size
+            total_count += 1
+
+    return {"bytes": total_size, "count": total_count}, prefixes
+
+
+def list_top_level_minio(bucket_name):
+    """list minio bucket root objects and top-level prefixes
+
+    Returns:
+        tuple: ({ "bytes": root_bytes, "count": root_count }, [prefix, ...])
+    """
+    from ying.cloud_storage_size.clients import get_minio_client
+
+    client = get_minio_client()
+
+    total_size = 0
+    total_count = 0
+    prefixes = []
+    for obj in client.list_objects(bucket_name, recursive=False):
+        if obj.is_dir:
+            prefixes.append(obj.object_name)
+        else:
+            total_size += obj.size
+            total_count += 1
+
+    return {"bytes": total_size, "count": total_count}, prefixes
+
+
+PAGE_ITERATORS = {
+    "gs": iter_pages_gs,
+    "s3": iter_pages_s3,
+    "az": iter_pages_az,
+    "oss": iter_pages_oss,
+    "minio": iter_pages_minio,
+}
+
+
+def iter_object_count_and_bytes(bucket_uri, every_pages=10, every_seconds=None):
+    """list bucket objects and yield the running totals while listing
+
+    Args:
+        bucket_uri (string): e.g. "gs://bucket_name", "s3://bucket_name/prefix/"
+        every_pages (int, optional): yield every this many pages. Defaults to 10.
+        every_seconds (float, optional):
+            also yield when this many seconds passed since the last yield. Defaults to None.
+
+    Yields:
+        dict: { "bytes": bytes_so_far, "count": count_so_far, "pages": pages_so_far,
+                "elapsed": seconds, "objects_per_second": throughput, "done": bool },
+            the last one has "done" set and holds the final totals
+
+    Example:
+        for progress in iter_object_count_and_bytes("s3://bucket_name", every_seconds=30):
+            print(progress["count"], progress["objects_per_second"])
+            if progress["elapsed"] > deadline:
+                break
+    """
+    import time
+    from urllib.parse import urlparse
+
+    parsed_url = urlparse(bucket_uri)
+    if parsed_url.scheme not in PAGE_ITERATORS:
+        raise ValueError("unsupported scheme")
+    prefix = parsed_url.path.lstrip("/") or None
+    pages = PAGE_ITERATORS[parsed_url.scheme](parsed_url.netloc, prefix)
+
+    started_at = time.monotonic()
+    last_yield_at = started_at
+    total_bytes = 0
+    total_count = 0
+    page_count = 0
+
+    def progress(done):
+        elapsed = time.monotonic() - started_at
+        return {
+            "bytes": total_bytes,
+            "count": total_count,
+            "pages": page_count,
+            "elapsed": elapsed,
+            "objects_per_second": total_count / elapsed if elapsed > 0 else 0.0,
+            "done": done,
+        }
+
+    for items, _ in pages:
+        for _, size in items:
+            total_bytes += size
+            total_count += 1
+        page_count += 1
+        now = time.monotonic()
+        if (every_pages and page_count % every_pages == 0) or (
+            every_seconds is not None and now - last_yield_at >= every_seconds
+        ):
+            last_yield_at = now
+            yield progress(False)
+
+    yield progress(True)
+
+
+SDK_LISTERS = {
+    "gs": (list_object_count_and_bytes_gs, list_top_level_gs),
+    "s3": (list_object_count_and_bytes_s3, list_top_level_s3),
+    "az": (list_object_count_and_bytes_az, list_top_level_az),
+    "oss": (list_object_count_and_bytes_oss, list_top_level_oss),
+    "minio": (list_object_count_and_bytes_minio, list_top_level_minio),
+}
+
+
+def merge_count_and_bytes(results):
+    """merge partial { "bytes", "count" } results into one total
+
+    Breakdowns are merged by prefix, shards are expected to list disjoint prefixes.
+    """
+    total_bytes = 0
+    total_count = 0
+    breakdown = None
+    breakdown_truncated = False
+    for result in results:
+        total_bytes += result["bytes"]
+        total_count += result["count"]
+        if "breakdown" in result:
+            breakdown = breakdown or {}
+            breakdown.update(result["breakdown"])
+            breakdown_truncated = breakdown_truncated or result["breakdown_truncated"]
+    merged = {"bytes": total_bytes, "count": total_count}
+    if breakdown is not None:
+        merged["breakdown"] = breakdown
+        merged["breakdown_truncated"] = breakdown_truncated
+    return merged
+
+
+def list_object_count_and_bytes_sharded(scheme, bucket_name, parallelism=8, **kwargs):
+    """list bucket objects size and count, one shard per top-level prefix
+
+    The root of the bucket is listed once with a "/" delimiter to count the
+    root objects and discover the top-level prefixes, then every prefix is
+    listed recursively on a pool of `parallelism` worker threads.
+
+    Args:
+        scheme (string): storage scheme, one of `SDK_LISTERS`
+        bucket_name (string): bucket name
+        parallelism (int, optional): max concurrent shard listings. Defaults to 8.
+        **kwargs: passed to every shard lister, e.g. `resume=True`
+
+    Returns:
+        dict: { "bytes": storage_bytes_value, "count": storage_count_value }
+    """
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+    from ying.cloud_storage_size.stats import current_stats
+
+    if scheme not in SDK_LISTERS:
+        raise ValueError("unsupported scheme")
+    if parallelism < 1:
+        raise ValueError("parallelism must be a positive integer")
+
+    lister, list_top_level = SDK_LISTERS[scheme]
+    root, prefixes = list_top_level(bucket_name)
+    stats = current_stats()
+    if stats is not None:
+        stats.add(objects=root["count"], bytes=root["bytes"])
+    logger.info("%s://%s: %d top-level prefixes", scheme, bucket_name, len(prefixes))
+
+    results = [root]
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        # every shard runs in a copy of the caller context, so it reports to the caller's stats
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, lister, bucket_name, prefix=prefix, **kwargs
+            )
+            for prefix in prefixes
+        ]
+        results.extend(future.result() for future in futures)
+
+    return merge_count_and_bytes(results)
 
 
 def list_object_count_and_bytes_rclone_by_env(bucket_uri):
@@ -153,8 +626,8 @@ def list_object_count_and_bytes_rclone_by_env(bucket_uri):
     """
     import subprocess
     import json
-    import os
     from urllib.parse import urlparse
+    from ying.cloud_storage_size.rclone import find_rclone, rclone_config_args, rclone_remote_env
 
     def parse_path_uri(storage_bucket):
         parsed_url = urlparse(storage_bucket)
@@ -164,9 +637,7 @@ def list_object_count_and_bytes_rclone_by_env(bucket_uri):
         return scheme, bucket_name, blob_path
 
     def check_rclone_installed():
-        command = ["/opt/homebrew/bin/rclone", "version"]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        return result.returncode == 0
+        return find_rclone() is not None
 
     is_rclone_installed = check_rclone_installed()
     logger.info("is_rclone_installed: %s", is_rclone_installed)
@@ -174,74 +645,9 @@ def list_object_count_and_bytes_rclone_by_env(bucket_uri):
         return None
 
     scheme, bucket_name, blob_path = parse_path_uri(bucket_uri)
-    env = {}
-    if scheme == "gs" or scheme == "gcs":
-        env = {
-            "RCLONE_CONFIG_MYREMOTE_TYPE": "google cloud storage",
-            "RCLONE_CONFIG_MYREMOTE_SERVICE_ACCOUNT_FILE": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_SERVICE_ACCOUNT_FILE", None
-            ),
-            "RCLONE_CONFIG_MYREMOTE_PROJECT_NUMBER": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_PROJECT_NUMBER", None
-            ),
-            "RCLONE_CONFIG_MYREMOTE_LOCATION": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_LOCATION", "us-central1"
-            ),
-            "RCLONE_CONFIG_MYREMOTE_OBJECT_ACL": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_OBJECT_ACL", "private"
-            ),
-            "RCLONE_CONFIG_MYREMOTE_BUCKET_ACL": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_BUCKET_ACL", "private"
-            ),
-        }
-    elif scheme == "s3":
-        env = {
-            "RCLONE_CONFIG_MYREMOTE_TYPE": "s3",
-            "RCLONE_CONFIG_MYREMOTE_PROVIDER": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_PROVIDER", "AWS"
-            ),
-            "RCLONE_CONFIG_MYREMOTE_ACCESS_KEY_ID": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_ACCESS_KEY_ID", None
-            ),
-            "RCLONE_CONFIG_MYREMOTE_SECRET_ACCESS_KEY": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_SECRET_ACCESS_KEY", None
-            ),
-            "RCLONE_CONFIG_MYREMOTE_REGION": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_REGION", "us-east-1"
-            ),
-            "RCLONE_CONFIG_MYREMOTE_ACL": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_ACL", "private"
-            ),
-        }
-    elif scheme == "azure" or scheme == "az":
-        env = {
-            "RCLONE_CONFIG_MYREMOTE_TYPE": "azureblob",
-            "RCLONE_CONFIG_MYREMOTE_ACCOUNT": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_ACCOUNT", None
-            ),
-            "RCLONE_CONFIG_MYREMOTE_KEY": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_KEY", None
-            ),
-        }
-    elif scheme == "oss":
-        env = {
-            "RCLONE_CONFIG_MYREMOTE_TYPE": "s3",
-            "RCLONE_CONFIG_MYREMOTE_PROVIDER": "Alibaba",
-            "RCLONE_CONFIG_MYREMOTE_ACCESS_KEY_ID": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_ACCESS_KEY_ID", None
-            ),
-            "RCLONE_CONFIG_MYREMOTE_SECRET_ACCESS_KEY": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_SECRET_ACCESS_KEY", None
-            ),
-            "RCLONE_CONFIG_MYREMOTE_ENDPOINT": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_ENDPOINT", "oss-cn-hongkong.aliyuncs.com"
-            ),
-            "RCLONE_CONFIG_MYREMOTE_ACL": os.environ.get(
-                "RCLONE_CONFIG_MYREMOTE_ACL", "private"
-            ),
-        }
+    env = dict(os.environ, **rclone_remote_env(scheme))
 
-    command = ["/opt/homebrew/bin/rclone", "--config", "/Users/caiying/.config/rclone/rclone.conf", "size", f"myremote:{bucket_name}", "--fast-list", "--json"]
+    command = [find_rclone(), *rclone_config_args(), "size", f"myremote:{bucket_name}", "--fast-list", "--json"]
     result = subprocess.run(command, capture_output=True, text=True, env=env)
 
     if result.returncode != 0:
@@ -260,6 +666,7 @@ def list_object_count_and_bytes_rclone_by_conn_str(bucket_uri, conn_str):
     import subprocess
     import json
     from urllib.parse import urlparse
+    from ying.cloud_storage_size.rclone import find_rclone, rclone_config_args
 
     def parse_path_uri(storage_bucket):
         parsed_url = urlparse(storage_bucket)
@@ -269,9 +676,7 @@ def list_object_count_and_bytes_rclone_by_conn_str(bucket_uri, conn_str):
         return scheme, bucket_name, blob_path
 
     def check_rclone_installed():
-        command = ["/opt/homebrew/bin/rclone", "version"]
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        return result.returncode == 0
+        return find_rclone() is not None
 
     is_rclone_installed = check_rclone_installed()
     if not is_rclone_installed:
@@ -279,7 +684,7 @@ def list_object_count_and_bytes_rclone_by_conn_str(bucket_uri, conn_str):
 
     scheme, bucket_name, blob_path = parse_path_uri(bucket_uri)
 
-    command = ["/opt/homebrew/bin/rclone", "--config", "/Users/caiying/.config/rclone/rclone.conf", "size", f"{conn_str}{bucket_name}", "--fast-list", "--json"]
+    command = [find_rclone(), *rclone_config_args(), "size", f"{conn_str}{bucket_name}", "--fast-list", "--json"]
     result = subprocess.run(command, capture_output=True, text=True, check=True)
 
     if result.returncode != 0:
@@ -0,0 +1,196 @@
+import time
+import logging
+import threading
+import contextvars
+from collections import namedtuple
+from ying.config import settings
+
+logger = logging.getLogger(__name__)
+
+# start_after: seconds after the start of the query, None to only start once
+#   every running engine has failed
+# deadline: seconds the engine may run, None for no limit
+EnginePlan = namedtuple("EnginePlan", ["engine", "start_after", "deadline"])
+
+DEFAULT_BUDGETS = {
+    "metrics_deadline": 30,
+    "rclone_deadline": None,
+    "sdk_deadline": None,
+    "hedge_after": 5,
+    "hedge_after_large": 120,
+    "small_bucket_objects": 10000,
+    "large_bucket_objects": 10000000,
+}
+
+_cancel_event = contextvars.ContextVar("ying_cancel_event", default=None)
+
+
+class ScanCancelled(Exception):
+    """raised inside an engine once the planner no longer needs its answer"""
+
+
+class _ChildEvent(threading.Event):
+    """cancel event of one engine, also set once the cancel event of its caller is"""
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self.parent = parent
+
+    def is_set(self):
+        return super().is_set() or (self.parent is not None and self.parent.is_set())
+
+
+def raise_if_cancelled():
+    """called by long running engines between pages"""
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise ScanCancelled()
+
+
+def run_cancellable(event, function, *args, **kwargs):
+    """run `function` with `event` as its cancel event
+
+    Engines called by `function` stop at their next `raise_if_cancelled` check
+    once `event` is set, including the engines of a nested `run_hedged`.
+    """
+    token = _cancel_event.set(event)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        _cancel_event.reset(token)
+
+
+def get_budgets(**overrides):
+    """latency budgets from the `planner_<name>` settings, overridden by `overrides`"""
+    budgets = {
+        name: settings.get(f"planner_{name}", default)
+        for name, default in DEFAULT_BUDGETS.items()
+    }
+    budgets.update({name: value for name, value in overrides.items() if name in DEFAULT_BUDGETS})
+    return budgets
+
+
+def plan_engines(has_metrics, has_rclone, known_count=None, budgets=None):
+    """pick the engines of an "auto" query and when to start them
+
+    Metrics cost one API call, so they always go first. The listing engine
+    (rclone when installed, sdk otherwise) hedges them: it starts right away
+    for small buckets, after `hedge_after` seconds for unknown or average ones
+    and after `hedge_after_large` for buckets known to be large, where listing
+    is slow and expensive. The sdk engine is the last resort behind rclone.
+
+    Args:
+        has_metrics (bool): the metrics engine can serve this bucket
+        has_rclone (bool): rclone is installed
+        known_count (int, optional): last known object count of the bucket
+        budgets (dict, optional): see `get_budgets`
+
+    Returns:
+        list: [EnginePlan, ...]
+    """
+    budgets = budgets or get_budgets()
+    listing_start = 0
+    if has_metrics:
+        listing_start = budgets["hedge_after"]
+        if known_count is not None and known_count <= budgets["small_bucket_objects"]:
+            listing_start = 0
+        elif known_count is not None and known_count >= budgets["large_bucket_objects"]:
+            listing_start = budgets["hedge_after_large"]
+
+    plans = []
+    if has_metrics:
+        plans.append(EnginePlan("metrics", 0, budgets["metrics_deadline"]))
+    if has_rclone:
+        plans.append(EnginePlan("rclone", listing_start, budgets["rclone_deadline"]))
+        plans.append(EnginePlan("sdk", None, budgets["sdk_deadline"]))
+    else:
+        plans.append(EnginePlan("sdk", listing_start, budgets["sdk_deadline"]))
+    return plans
+
+
+def run_hedged(plans, run_engine, is_valid):
+    """run the planned engines, hedged, and return the first valid answer
+
+    Engines run on their own threads in a copy of the caller context. An engine
+    passing its deadline is cancelled and counts as failed, the other engines
+    keep running. Once an answer is accepted every engine still running is
+    cancelled. Cancelling sets the cancel event of the engine, which stops the
+    sdk listers at the next page and the rclone job at its next poll, and its
+    result is ignored. Cancelling the caller (see `run_cancellable`) cancels
+    every engine and raises `ScanCancelled`.
+
+    Args:
+        plans (list): [EnginePlan, ...], see `plan_engines`
+        run_engine (callable): `run_engine(engine, deadline)` returns the engine answer
+        is_valid (callable): `is_valid(answer)` tells whether an answer is usable
+
+    Returns:
+        tuple: (engine, answer), or (None, None) when no engine answered
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    parent_event = _cancel_event.get()
+    started_at = time.monotonic()
+    waiting = sorted(
+        plans, key=lambda plan: float("inf") if plan.start_after is None else plan.start_after
+    )
+    pending = {}
+    errors = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, len(plans)))
+    try:
+        while waiting or pending:
+            if parent_event is not None and parent_event.is_set():
+                raise ScanCancelled()
+            elapsed = time.monotonic() - started_at
+            while waiting and (
+                not pending or (waiting[0].start_after is not None and waiting[0].start_after <= elapsed)
+            ):
+                plan = waiting.pop(0)
+                event = _ChildEvent(parent_event)
+                future = executor.submit(
+                    contextvars.copy_context().run,
+                    run_cancellable, event, run_engine, plan.engine, plan.deadline,
+                )
+                pending[future] = (plan, time.monotonic(), event)
+                logger.info("start %s engine after %.1fs", plan.engine, elapsed)
+
+            wake_ups = [
+                started + plan.deadline
+                for plan, started, _ in pending.values()
+                if plan.deadline is not None
+            ]
+            if waiting and waiting[0].start_after is not None:
+                wake_ups.append(started_at + waiting[0].start_after)
+            timeout = max(0, min(wake_ups) - time.monotonic()) if wake_ups else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                plan, _, _ = pending.pop(future)
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    errors[plan.engine] = repr(e)
+                    logger.error("%s engine failed: %s", plan.engine, e)
+                    continue
+                if is_valid(answer):
+                    logger.info("%s engine answered after %.1fs", plan.engine, time.monotonic() - started_at)
+                    return plan.engine, answer
+                errors[plan.engine] = f"invalid answer: {answer}"
+                logger.info("%s engine gave no usable answer: %s", plan.engine, answer)
+
+            now = time.monotonic()
+            for future, (plan, started, event) in list(pending.items()):
+                if plan.deadline is not None and now - started >= plan.deadline:
+                    event.set()
+                    pending.pop(future)
+                    errors[plan.engine] = f"deadline of {plan.deadline}s exceeded"
+                    logger.error("%s engine exceeded its %ss deadline", plan.engine, plan.deadline)
+    finally:
+        for _, _, event in pending.values():
+            event.set()
+        executor.shutdown(wait=False)
+
+    if parent_event is not None and parent_event.is_set():
+        raise ScanCancelled()
+    logger.error("no engine answered: %s", errors)
+    return None, None
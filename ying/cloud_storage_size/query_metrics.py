@@ -1,8 +1,24 @@
 import logging
+from ying.cloud_storage_size.clients import get_metric_service_client, get_boto3_client, get_azure_metrics_client
 
 logger = logging.getLogger(__name__)
 
 
+def _last_minutes_interval(minutes=20):
+    import time
+    from google.cloud import monitoring_v3
+
+    now = time.time()
+    seconds = int(now)
+    nanos = int((now - seconds) * 10**9)
+    return monitoring_v3.TimeInterval(
+        {
+            "end_time": {"seconds": seconds, "nanos": nanos},
+            "start_time": {"seconds": (seconds - minutes * 60), "nanos": nanos},
+        }
+    )
+
+
 def query_google_cloud_minitoring(project_id, bucket_name):
     """query gcs bucket objects size and count
 
@@ -16,21 +32,9 @@ def query_google_cloud_minitoring(project_id, bucket_name):
     Returns:
         dict: { "bytes": storage_bytes_value, "count": storage_count_value }
     """
-    import time
-    from google.cloud import monitoring_v3
-
-    client = monitoring_v3.MetricServiceClient()
+    client = get_metric_service_client()
     project_name = f"projects/{project_id}"
-
-    now = time.time()
-    seconds = int(now)
-    nanos = int((now - seconds) * 10**9)
-    interval = monitoring_v3.TimeInterval(
-        {
-            "end_time": {"seconds": seconds, "nanos": nanos},
-            "start_time": {"seconds": (seconds - 1200), "nanos": nanos},
-        }
-    )
+    interval = _last_minutes_interval()
     # https://cloud.google.com/monitoring/custom-metrics/reading-metrics
     storage_bytes = client.list_time_series(
         request={
@@ -63,3 +67,182 @@ def query_google_cloud_minitoring(project_id, bucket_name):
         )
         storage_count_value = -1
     return {"bytes": storage_bytes_value, "count": storage_count_value}
+
+
+def query_google_cloud_minitoring_batch(project_id, bucket_names=None):
+    """query objects size and count of every gcs bucket of a project at once
+
+    1. `pip install google-cloud-monitoring`
+    2. `GOOGLE_APPLICATION_CREDENTIALS` must be set
+
+    `total_bytes` and `object_count` are fetched for the whole project with one
+    filter each, concurrently, on the shared client. Series of the same bucket
+    (one per storage class) are summed.
+
+    Args:
+        project_id (string): project id
+        bucket_names (list, optional):
+            only return these buckets, buckets without datapoints get -1 values.
+            Defaults to None (every bucket with datapoints).
+
+    Returns:
+        dict: { bucket_name: { "bytes": storage_bytes_value, "count": storage_count_value } }
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = get_metric_service_client()
+    project_name = f"projects/{project_id}"
+    interval = _last_minutes_interval()
+
+    def query(metric_type, value_field):
+        totals = {}
+        time_series = client.list_time_series(
+            request={
+                "name": project_name,
+                "filter": f'metric.type="storage.googleapis.com/storage/{metric_type}"',
+                "interval": interval,
+            }
+        )
+        for series in time_series:
+            if not series.points:
+                continue
+            bucket_name = series.resource.labels["bucket_name"]
+            # points are returned newest first
+            value = getattr(series.points[0].value, value_field)
+            totals[bucket_name] = totals.get(bucket_name, 0) + value
+        return totals
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        bytes_future = executor.submit(query, "total_bytes", "double_value")
+        count_future = executor.submit(query, "object_count", "int64_value")
+        storage_bytes, storage_count = bytes_future.result(), count_future.result()
+
+    if bucket_names is None:
+        bucket_names = sorted(set(storage_bytes) | set(storage_count))
+    missing = [name for name in bucket_names if name not in storage_bytes or name not in storage_count]
+    if missing:
+        logger.error(f"[project_id: {project_id}] no metrics datapoints for buckets: {missing}")
+    return {
+        name: {"bytes": storage_bytes.get(name, -1), "count": storage_count.get(name, -1)}
+        for name in bucket_names
+    }
+
+
+def query_aws_cloudwatch(bucket_name, region=None):
+    """query s3 bucket objects size and count from CloudWatch daily storage metrics
+
+    1. `pip install boto3`
+    2.  `AWS_ACCESS_KEY_ID`, `AWS_SECRET_ACCESS_KEY` must be set
+
+    S3 reports `BucketSizeBytes` (one metric per storage type) and
+    `NumberOfObjects` once a day, in the region of the bucket.
+
+    Args:
+        bucket_name (string): bucket name
+        region (string, optional): bucket region, defaults to the boto3 default region
+
+    Returns:
+        dict: { "bytes": storage_bytes_value, "count": storage_count_value }
+    """
+    import datetime
+
+    client = get_boto3_client("cloudwatch", region)
+    bucket_dimension = {"Name": "BucketName", "Value": bucket_name}
+
+    # one BucketSizeBytes metric per storage type, e.g. StandardStorage, GlacierStorage
+    size_metrics = client.list_metrics(
+        Namespace="AWS/S3", MetricName="BucketSizeBytes", Dimensions=[bucket_dimension]
+    )["Metrics"]
+    queries = [
+        {"Id": f"bytes{i}", "MetricStat": {"Metric": metric, "Period": 86400, "Stat": "Average"}}
+        for i, metric in enumerate(size_metrics)
+    ]
+    queries.append(
+        {
+            "Id": "count",
+            "MetricStat": {
+                "Metric": {
+                    "Namespace": "AWS/S3",
+                    "MetricName": "NumberOfObjects",
+                    "Dimensions": [
+                        bucket_dimension,
+                        {"Name": "StorageType", "Value": "AllStorageTypes"},
+                    ],
+                },
+                "Period": 86400,
+                "Stat": "Average",
+            },
+        }
+    )
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    response = client.get_metric_data(
+        MetricDataQueries=queries,
+        StartTime=now - datetime.timedelta(days=3),
+        EndTime=now,
+        ScanBy="TimestampDescending",
+    )
+    latest = {
+        result["Id"]: result["Values"][0]
+        for result in response["MetricDataResults"]
+        if result["Values"]
+    }
+
+    size_values = [value for key, value in latest.items() if key.startswith("bytes")]
+    if size_values:
+        storage_bytes_value = int(sum(size_values))
+    else:
+        logger.error(f"[bucket_name: {bucket_name}] get storage_bytes_value failed: no datapoints")
+        storage_bytes_value = -1
+    if "count" in latest:
+        storage_count_value = int(latest["count"])
+    else:
+        logger.error(f"[bucket_name: {bucket_name}] get storage_count_value failed: no datapoints")
+        storage_count_value = -1
+    return {"bytes": storage_bytes_value, "count": storage_count_value}
+
+
+def query_azure_monitor(storage_account_resource_id):
+    """query azure storage account blob size and count from Azure Monitor
+
+    1. `pip install azure-monitor-query azure-identity`
+    2. credentials for `DefaultAzureCredential` must be set, e.g.
+       `AZURE_CLIENT_ID`, `AZURE_TENANT_ID`, `AZURE_CLIENT_SECRET`
+
+    Azure Monitor reports `BlobCapacity` and `BlobCount` once a day per storage
+    account, there is no per-container metric, so the values cover every
+    container of the account and are never the size of one container.
+
+    Args:
+        storage_account_resource_id (string):
+            e.g. "/subscriptions/<id>/resourceGroups/<group>/providers/Microsoft.Storage/storageAccounts/<account>"
+
+    Returns:
+        dict: { "bytes": storage_bytes_value, "count": storage_count_value }
+    """
+    import datetime
+    from azure.monitor.query import MetricAggregationType
+
+    client = get_azure_metrics_client()
+    response = client.query_resource(
+        f"{storage_account_resource_id.rstrip('/')}/blobServices/default",
+        metric_names=["BlobCapacity", "BlobCount"],
+        timespan=datetime.timedelta(days=2),
+        granularity=datetime.timedelta(hours=1),
+        aggregations=[MetricAggregationType.AVERAGE],
+    )
+
+    latest = {}
+    for metric in response.metrics:
+        for time_series in metric.timeseries:
+            for point in time_series.data:
+                if point.average is not None:
+                    latest[metric.name] = point.average
+
+    storage_bytes_value = int(latest.get("BlobCapacity", -1))
+    storage_count_value = int(latest.get("BlobCount", -1))
+    if storage_bytes_value < 0 or storage_count_value < 0:
+        logger.error(
+            f"[resource_id: {storage_account_resource_id}] get blob metrics failed: {latest}"
+        )
+    return {"bytes": storage_bytes_value, "count": storage_count_value}
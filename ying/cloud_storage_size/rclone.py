@@ -0,0 +1,276 @@
+import os
+import time
+import atexit
+import shutil
+import socket
+import secrets
+import logging
+import threading
+import subprocess
+from urllib.parse import urlparse
+from ying.config import settings
+
+logger = logging.getLogger(__name__)
+
+RCLONE_FALLBACK_PATHS = ["/opt/homebrew/bin/rclone", "/usr/local/bin/rclone", "/usr/bin/rclone"]
+
+# scheme -> name of the remote configured in the daemon environment
+RCLONE_REMOTES = {"gs": "GS", "gcs": "GS", "s3": "S3", "az": "AZ", "azure": "AZ", "oss": "OSS"}
+
+# seconds between job/status polls of an async job, doubling up to the max
+JOB_POLL_INTERVAL = 0.1
+JOB_POLL_MAX_INTERVAL = 2
+# seconds the daemon may take to answer one rc call
+JOB_CALL_TIMEOUT = 30
+
+_rclone_path = None
+
+
+def find_rclone():
+    """locate the rclone binary, `rclone_path` setting, then PATH, then common paths
+
+    The path is remembered once found, a missing rclone is looked up again on
+    the next call, so installing it doesn't need a restart.
+
+    Returns:
+        string: path of the rclone binary, or None if it is not installed
+    """
+    global _rclone_path
+    if _rclone_path is None:
+        candidates = [settings.get("rclone_path", None), shutil.which("rclone")]
+        candidates += RCLONE_FALLBACK_PATHS
+        _rclone_path = next(
+            (path for path in candidates if path and os.access(path, os.X_OK)), None
+        )
+        if _rclone_path is not None:
+            logger.info("rclone path: %s", _rclone_path)
+    return _rclone_path
+
+
+def rclone_config_args():
+    """`--config` arguments when the `rclone_config` setting is configured"""
+    config_path = settings.get("rclone_config", None)
+    return ["--config", config_path] if config_path else []
+
+
+def rclone_remote_env(scheme, remote_name="MYREMOTE"):
+    """rclone environment variables configuring `remote_name` for a storage scheme
+
+    The values are read from the `RCLONE_CONFIG_MYREMOTE_*` variables, see
+    `cloud_storage_size_template.env`, unset values are left out.
+
+    https://rclone.org/docs/#environment-variables
+    """
+    env = {}
+    if scheme == "gs" or scheme == "gcs":
+        env = {
+            "TYPE": "google cloud storage",
+            "SERVICE_ACCOUNT_FILE": os.environ.get("RCLONE_CONFIG_MYREMOTE_SERVICE_ACCOUNT_FILE", None),
+            "PROJECT_NUMBER": os.environ.get("RCLONE_CONFIG_MYREMOTE_PROJECT_NUMBER", None),
+            "LOCATION": os.environ.get("RCLONE_CONFIG_MYREMOTE_LOCATION", "us-central1"),
+            "OBJECT_ACL": os.environ.get("RCLONE_CONFIG_MYREMOTE_OBJECT_ACL", "private"),
+            "BUCKET_ACL": os.environ.get("RCLONE_CONFIG_MYREMOTE_BUCKET_ACL", "private"),
+        }
+    elif scheme == "s3":
+        env = {
+            "TYPE": "s3",
+            "PROVIDER": os.environ.get("RCLONE_CONFIG_MYREMOTE_PROVIDER", "AWS"),
+            "ACCESS_KEY_ID": os.environ.get("RCLONE_CONFIG_MYREMOTE_ACCESS_KEY_ID", None),
+            "SECRET_ACCESS_KEY": os.environ.get("RCLONE_CONFIG_MYREMOTE_SECRET_ACCESS_KEY", None),
+            "REGION": os.environ.get("RCLONE_CONFIG_MYREMOTE_REGION", "us-east-1"),
+            "ACL": os.environ.get("RCLONE_CONFIG_MYREMOTE_ACL", "private"),
+        }
+    elif scheme == "azure" or scheme == "az":
+        env = {
+            "TYPE": "azureblob",
+            "ACCOUNT": os.environ.get("RCLONE_CONFIG_MYREMOTE_ACCOUNT", None),
+            "KEY": os.environ.get("RCLONE_CONFIG_MYREMOTE_KEY", None),
+        }
+    elif scheme == "oss":
+        env = {
+            "TYPE": "s3",
+            "PROVIDER": "Alibaba",
+            "ACCESS_KEY_ID": os.environ.get("RCLONE_CONFIG_MYREMOTE_ACCESS_KEY_ID", None),
+            "SECRET_ACCESS_KEY": os.environ.get("RCLONE_CONFIG_MYREMOTE_SECRET_ACCESS_KEY", None),
+            "ENDPOINT": os.environ.get("RCLONE_CONFIG_MYREMOTE_ENDPOINT", "oss-cn-hongkong.aliyuncs.com"),
+            "ACL": os.environ.get("RCLONE_CONFIG_MYREMOTE_ACL", "private"),
+        }
+    return {
+        f"RCLONE_CONFIG_{remote_name}_{key}": value
+        for key, value in env.items()
+        if value is not None
+    }
+
+
+def _free_local_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class RcloneDaemon(object):
+    """one long-lived `rclone rcd` process serving size requests over its local HTTP API
+
+    Every storage scheme gets its own remote (see `RCLONE_REMOTES`) in the
+    daemon environment, so one process serves all buckets and keeps its
+    backends and connections warm between requests. Requests may be sent
+    concurrently from many threads.
+
+    https://rclone.org/rc/
+    """
+
+    def __init__(self, rclone_path, startup_timeout=10):
+        import requests
+
+        self.rclone_path = rclone_path
+        self.startup_timeout = startup_timeout
+        self.port = _free_local_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.auth = ("ying", secrets.token_urlsafe(16))
+        self.process = None
+        self.session = requests.Session()
+        self.session.auth = self.auth
+
+    def start(self):
+        env = dict(os.environ)
+        for scheme, remote_name in RCLONE_REMOTES.items():
+            env.update(rclone_remote_env(scheme, remote_name))
+        # credentials go through the environment, command lines are visible to every user in `ps`
+        env["RCLONE_RC_USER"], env["RCLONE_RC_PASS"] = self.auth
+        command = [
+            self.rclone_path,
+            *rclone_config_args(),
+            "rcd",
+            "--rc-addr", f"127.0.0.1:{self.port}",
+        ]
+        self.process = subprocess.Popen(
+            command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                self.call("rc/noop")
+                break
+            except Exception as e:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"rclone rcd exited with {self.process.returncode}")
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"rclone rcd did not start: {e}")
+                time.sleep(0.1)
+        logger.info("rclone rcd started on %s, pid %s", self.url, self.process.pid)
+        return self
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def call(self, method, timeout=None, **params):
+        response = self.session.post(f"{self.url}/{method}", json=params, timeout=timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"rclone {method} failed: {response.text}")
+        return response.json()
+
+    def size(self, bucket_uri, timeout=None):
+        """bucket objects size and count through `operations/size`
+
+        The size runs as an async job of the daemon, polled until it finishes.
+        When `timeout` passes or the planner cancels the query (see
+        `ying.cloud_storage_size.planner.raise_if_cancelled`), the job is
+        stopped with `job/stop`, so the daemon stops listing the bucket too.
+
+        Returns:
+            dict: { "bytes": storage_bytes_value, "count": storage_count_value }
+        """
+        from ying.cloud_storage_size.planner import raise_if_cancelled
+
+        parsed_url = urlparse(bucket_uri)
+        if parsed_url.scheme not in RCLONE_REMOTES:
+            raise ValueError("unsupported scheme")
+        fs = f"{RCLONE_REMOTES[parsed_url.scheme]}:{parsed_url.netloc}{parsed_url.path}"
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # UseListR is the `--fast-list` option
+        job_id = self.call(
+            "operations/size", timeout=JOB_CALL_TIMEOUT, fs=fs, _config={"UseListR": True}, _async=True
+        )["jobid"]
+        finished = False
+        interval = JOB_POLL_INTERVAL
+        try:
+            while True:
+                status = self.call("job/status", timeout=JOB_CALL_TIMEOUT, jobid=job_id)
+                if status["finished"]:
+                    finished = True
+                    if not status["success"]:
+                        raise RuntimeError(f"rclone operations/size of {fs} failed: {status['error']}")
+                    return {"bytes": status["output"]["bytes"], "count": status["output"]["count"]}
+                raise_if_cancelled()
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    raise RuntimeError(f"rclone operations/size of {fs} did not finish in {timeout}s")
+                time.sleep(interval if deadline is None else min(interval, deadline - now))
+                interval = min(interval * 2, JOB_POLL_MAX_INTERVAL)
+        finally:
+            if not finished:
+                self.stop_job(job_id)
+
+    def stop_job(self, job_id):
+        """stop a running job, e.g. a size nobody waits for anymore"""
+        try:
+            self.call("job/stop", timeout=JOB_CALL_TIMEOUT, jobid=job_id)
+            logger.info("stopped rclone job %s", job_id)
+        except Exception as e:
+            logger.error("failed to stop rclone job %s: %s", job_id, e)
+
+
+_daemon = None
+_daemon_lock = threading.Lock()
+
+
+def get_rclone_daemon():
+    """process-wide rclone daemon, started on first use and stopped at exit
+
+    Returns:
+        RcloneDaemon: the running daemon, or None if rclone is not installed
+    """
+    global _daemon
+    with _daemon_lock:
+        if _daemon is None or not _daemon.is_running():
+            rclone_path = find_rclone()
+            if rclone_path is None:
+                return None
+            _daemon = RcloneDaemon(rclone_path).start()
+            atexit.register(_daemon.stop)
+    return _daemon
+
+
+def list_object_count_and_bytes_rclone_daemon(bucket_uri, timeout=None):
+    """list bucket objects size and count through the shared rclone daemon
+
+    Args:
+        bucket_uri (string): e.g. "s3://bucket_name"
+        timeout (float, optional): seconds to wait for the answer. Defaults to None.
+
+    Returns:
+        dict: { "bytes": storage_bytes_value, "count": storage_count_value },
+            or None if rclone is not installed or the request failed
+    """
+    import requests
+
+    try:
+        daemon = get_rclone_daemon()
+        if daemon is None:
+            logger.info("rclone is not installed")
+            return None
+        return daemon.size(bucket_uri, timeout)
+    except (RuntimeError, requests.RequestException) as e:
+        logger.error("rclone command failed: %s", e)
+        return None
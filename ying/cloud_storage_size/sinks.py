@@ -0,0 +1,166 @@
+import os
+import csv
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("bucket_uri", "bytes", "count", "bytes_human", "error")
+
+
+class ResultTable(object):
+    """bucket size results in columnar form, one NumPy array per column
+
+    "bytes" and "count" are int64 arrays holding -1 for the buckets that
+    failed, "valid" tells them apart. "bytes_human" is the formatted size,
+    an empty string for failed buckets.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_results(cls, results, decimal_places=2):
+        """collect `get_many_bucket_objects_count_and_bytes` results
+
+        Args:
+            results (iterable): dicts of bucket_uri, result and error
+            decimal_places (int, optional): decimals of "bytes_human". Defaults to 2.
+        """
+        import numpy as np
+        from ying.utils.formatter import human_readable_bytes_array
+
+        results = list(results)
+        valid = np.fromiter(
+            (item["error"] is None and item["result"] is not None for item in results), dtype=bool, count=len(results)
+        )
+        sizes = np.fromiter(
+            (item["result"]["bytes"] if ok else -1 for item, ok in zip(results, valid)), dtype=np.int64, count=len(results)
+        )
+        counts = np.fromiter(
+            (item["result"]["count"] if ok else -1 for item, ok in zip(results, valid)), dtype=np.int64, count=len(results)
+        )
+        # metrics report a miss as negative values
+        valid &= (sizes >= 0) & (counts >= 0)
+        errors = np.array(
+            [item["error"] or (None if ok else "no value") for item, ok in zip(results, valid)], dtype=object
+        )
+        return cls(
+            {
+                "bucket_uri": np.array([item["bucket_uri"] for item in results], dtype=object),
+                "bytes": np.where(valid, sizes, -1),
+                "count": np.where(valid, counts, -1),
+                "bytes_human": human_readable_bytes_array(np.where(valid, sizes, -1), decimal_places),
+                "error": errors,
+                "valid": valid,
+            }
+        )
+
+    def __len__(self):
+        return len(self.columns["bucket_uri"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def to_pylist(self, columns=COLUMNS):
+        """the columns as python lists, None for the values of failed buckets"""
+        valid = self.columns["valid"].tolist()
+        lists = {}
+        for name in columns:
+            values = self.columns[name].tolist()
+            if name in ("bytes", "count", "bytes_human"):
+                values = [value if ok else None for value, ok in zip(values, valid)]
+            lists[name] = values
+        return lists
+
+    def rows(self, columns=COLUMNS):
+        """one dict per bucket"""
+        lists = self.to_pylist(columns)
+        return [dict(zip(columns, values)) for values in zip(*(lists[name] for name in columns))]
+
+
+class CSVSink(object):
+    def __init__(self, path, columns=COLUMNS):
+        self.path = path
+        self.columns = columns
+
+    def write(self, table):
+        lists = table.to_pylist(self.columns)
+        with open(self.path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            writer.writerows(zip(*(lists[name] for name in self.columns)))
+
+
+class JSONLSink(object):
+    def __init__(self, path, columns=COLUMNS):
+        self.path = path
+        self.columns = columns
+
+    def write(self, table):
+        with open(self.path, "w") as f:
+            f.write("".join(json.dumps(row) + "\n" for row in table.rows(self.columns)))
+
+
+class ParquetSink(object):
+    def __init__(self, path, columns=COLUMNS):
+        self.path = path
+        self.columns = columns
+
+    def write(self, table):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        missing = ~table["valid"]
+        arrays = {}
+        for name in self.columns:
+            if name in ("bytes", "count"):
+                arrays[name] = pa.array(table[name], type=pa.int64(), mask=missing)
+            elif name == "bytes_human":
+                arrays[name] = pa.array(table[name].astype(object), type=pa.string(), mask=missing)
+            else:
+                arrays[name] = pa.array(table[name], type=pa.string())
+        pq.write_table(pa.table(arrays), self.path)
+
+
+class CallbackSink(object):
+    """hands the whole table to `callback` in one call, e.g. one spreadsheet update"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, table):
+        self.callback(table)
+
+
+SINKS = {".csv": CSVSink, ".jsonl": JSONLSink, ".parquet": ParquetSink}
+
+
+def open_sink(target):
+    """sink from a path ending with .csv, .jsonl or .parquet, a callable or a sink"""
+    if hasattr(target, "write"):
+        return target
+    if callable(target):
+        return CallbackSink(target)
+    extension = os.path.splitext(str(target))[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"unsupported results file {target}, expected one of {sorted(SINKS)}")
+    return SINKS[extension](target)
+
+
+def export_results(results, target, decimal_places=2):
+    """collect bucket size results and write them to `target` at once
+
+    Args:
+        results (iterable): `get_many_bucket_objects_count_and_bytes` results
+        target: results file path (.csv, .jsonl, .parquet), a callable taking
+            the ResultTable, or an object with a `write(table)` method
+        decimal_places (int, optional): decimals of "bytes_human". Defaults to 2.
+
+    Returns:
+        ResultTable: the written table
+    """
+    table = ResultTable.from_results(results, decimal_places)
+    open_sink(target).write(table)
+    logger.info("exported %s bucket results to %s", len(table), target)
+    return table
@@ -0,0 +1,262 @@
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_stats = contextvars.ContextVar("ying_scan_stats", default=None)
+_hooks = []
+
+
+class ScanStats(object):
+    """metrics of one bucket scan, shared by every thread working on the scan
+
+    `network_seconds` is the time spent waiting for the next listing page
+    (request, transfer and SDK parsing), `aggregate_seconds` the time spent
+    summing it. `retries` is only reported by boto3, the other SDKs retry
+    internally without telling. `objects` and `bytes` grow with the listed
+    pages and end at the answer of the engine, metrics, rclone and inventory
+    included.
+    """
+
+    FIELDS = (
+        "pages",
+        "api_calls",
+        "retries",
+        "response_bytes",
+        "network_seconds",
+        "aggregate_seconds",
+        "objects",
+        "bytes",
+    )
+
+    def __init__(self, bucket_uri, engine):
+        self.bucket_uri = bucket_uri
+        self.engine = engine
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self._started = time.perf_counter()
+        self._elapsed = None
+        self._lock = threading.Lock()
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def add(self, **values):
+        with self._lock:
+            for field, value in values.items():
+                setattr(self, field, getattr(self, field) + value)
+
+    def record_page(self, objects, page_bytes, network_seconds, aggregate_seconds):
+        self.add(
+            pages=1,
+            objects=objects,
+            bytes=page_bytes,
+            network_seconds=network_seconds,
+            aggregate_seconds=aggregate_seconds,
+        )
+        _call_hooks("page", self)
+
+    def record_result(self, value):
+        """set `objects` and `bytes` to the answer of the engine, which may not list pages"""
+        if isinstance(value, dict) and value.get("count", -1) >= 0 and value.get("bytes", -1) >= 0:
+            with self._lock:
+                self.objects = value["count"]
+                self.bytes = value["bytes"]
+
+    def finish(self, error=None):
+        self.finished_at = time.time()
+        self._elapsed = time.perf_counter() - self._started
+        self.error = error
+
+    @property
+    def elapsed(self):
+        if self._elapsed is not None:
+            return self._elapsed
+        return time.perf_counter() - self._started
+
+    @property
+    def objects_per_second(self):
+        elapsed = self.elapsed
+        return self.objects / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        with self._lock:
+            values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(
+            {
+                "bucket_uri": self.bucket_uri,
+                "engine": self.engine,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed": self.elapsed,
+                "objects_per_second": self.objects_per_second,
+                "error": self.error,
+            }
+        )
+        return values
+
+
+def add_stats_hook(hook):
+    """register `hook(event, stats)`, called with "page" after every listed page and
+    "finish" once a scan completed, for every scan of the process"""
+    _hooks.append(hook)
+
+
+def remove_stats_hook(hook):
+    _hooks.remove(hook)
+
+
+def has_stats_hooks():
+    return bool(_hooks)
+
+
+def _call_hooks(event, stats):
+    for hook in list(_hooks):
+        try:
+            hook(event, stats)
+        except Exception as e:
+            logger.error("stats hook %r failed: %s", hook, e)
+
+
+def current_stats():
+    """stats of the scan running in this context, None when not collecting"""
+    return _current_stats.get()
+
+
+@contextmanager
+def collect_stats(bucket_uri, engine):
+    """collect the stats of the scan run inside the block
+
+    Threads started by the scan must run in a copy of this context, see
+    `contextvars.copy_context`.
+    """
+    stats = ScanStats(bucket_uri, engine)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    except Exception as e:
+        stats.finish(error=repr(e))
+        _call_hooks("finish", stats)
+        raise
+    else:
+        stats.finish()
+        _call_hooks("finish", stats)
+    finally:
+        _current_stats.reset(token)
+
+
+def record_http_response(response_bytes=0, retries=0):
+    """record one provider API response in the current scan, if any"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(api_calls=1, response_bytes=response_bytes, retries=retries)
+
+
+def record_requests_response(response, *args, **kwargs):
+    """`requests` response hook, the body is not read so streamed responses stay streamed"""
+    record_http_response(int(response.headers.get("Content-Length", 0) or 0))
+
+
+def record_boto3_response(http_response=None, parsed=None, model=None, **kwargs):
+    """botocore `after-call` event handler, streamed bodies (get_object) are left unread"""
+    retries = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    if model is not None and model.has_streaming_output:
+        headers = getattr(http_response, "headers", None) or {}
+        response_bytes = int(headers.get("Content-Length", 0) or 0)
+    else:
+        response_bytes = len(getattr(http_response, "content", None) or b"")
+    record_http_response(response_bytes, retries)
+
+
+class PrometheusExporter(object):
+    """stats hook keeping the latest scan of every bucket and engine as Prometheus metrics
+
+    Scans are labelled by bucket uri and engine, a new scan of the same bucket
+    with the same engine replaces the previous one, so every label set is
+    exported once.
+
+        exporter = PrometheusExporter()
+        add_stats_hook(exporter)
+        exporter.serve(9464)
+    """
+
+    COUNTERS = (
+        ("pages", "listing pages fetched"),
+        ("api_calls", "provider API responses"),
+        ("retries", "provider API retries"),
+        ("response_bytes", "bytes of provider API responses"),
+        ("network_seconds", "seconds spent waiting for listing pages"),
+        ("aggregate_seconds", "seconds spent aggregating listing pages"),
+        ("objects", "objects counted"),
+        ("bytes", "object bytes counted"),
+    )
+
+    def __init__(self, max_finished=100):
+        self.max_finished = max_finished
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event, stats):
+        key = (stats.bucket_uri, stats.engine)
+        with self._lock:
+            latest = self._scans.get(key)
+            if latest is not None and latest is not stats and latest.started_at > stats.started_at:
+                return
+            # move the key to the end, the oldest finished scans are evicted first
+            self._scans.pop(key, None)
+            self._scans[key] = stats
+            finished = [key for key, scan in self._scans.items() if scan.finished_at is not None]
+            for key in finished[: max(0, len(finished) - self.max_finished)]:
+                del self._scans[key]
+
+    def render(self):
+        """metrics in the Prometheus text exposition format"""
+        with self._lock:
+            scans = [scan.to_dict() for scan in self._scans.values()]
+
+        def labels(scan):
+            bucket_uri = scan["bucket_uri"].replace("\\", "\\\\").replace('"', '\\"')
+            return f'{{bucket_uri="{bucket_uri}",engine="{scan["engine"]}"}}'
+
+        lines = []
+        for field, help_text in self.COUNTERS:
+            name = f"ying_scan_{field}_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{labels(scan)} {scan[field]}" for scan in scans)
+        gauges = (
+            ("objects_per_second", "objects counted per second", lambda scan: scan["objects_per_second"]),
+            ("in_progress", "1 while the scan is running", lambda scan: int(scan["finished_at"] is None)),
+            ("failed", "1 if the scan failed", lambda scan: int(scan["error"] is not None)),
+        )
+        for field, help_text, value in gauges:
+            name = f"ying_scan_{field}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(f"{name}{labels(scan)} {value(scan)}" for scan in scans)
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9464, addr="127.0.0.1"):
+        """serve `render()` on http://addr:port/metrics from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,601 @@
+"""incremental bucket size tracking from object notifications
+
+A `SizeTracker` is seeded from one full scan of a bucket, then applies
+object created and deleted notifications to running totals kept in a
+sqlite store under `~/.config/ying`, so reading the size of a bucket is one
+row lookup instead of a listing. `reconcile` rescans the bucket and replaces
+the totals, correcting whatever drift the notifications missed.
+
+Supported notifications:
+
+- S3 event notifications (`{"Records": [...]}`), also wrapped in SNS or
+  delivered by EventBridge
+- GCS Pub/Sub notifications, push (`{"message": {...}}`) or pulled messages
+  (`{"attributes": {...}, "data": "<base64 object resource>"}`)
+- Azure Event Grid records, in the Event Grid or the CloudEvents schema
+
+Notifications come from a source with `receive(timeout)` returning raw
+documents and `commit()` acknowledging them once applied, see `FileSource`,
+`DirectorySource` and `QueueSource`. Every object remembers the sequencer
+of its last notification, so duplicated and reordered notifications are
+applied once, in order.
+
+A tracker seeded with `keys=True` also stores the size of every object, so
+deletes (S3 and Azure notifications carry no size) and overwrites are exact.
+Seeded from totals only, the size of an object first seen in a delete is not
+known: the count is decremented, the delete is counted in
+"unknown_deletes", and the bytes are only right again after `reconcile`.
+"""
+import os
+import re
+import json
+import time
+import base64
+import sqlite3
+import logging
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlparse, unquote_plus
+
+from ying.config import config_dir, settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACKER_PATH = config_dir / "tracker.sqlite3"
+DEFAULT_RECONCILE_EVERY = 86400
+
+CREATED = "created"
+DELETED = "deleted"
+
+# kind is CREATED or DELETED, size is None when the notification has none,
+# overwrote is the sequencer of the object a GCS upload replaced
+ObjectEvent = namedtuple(
+    "ObjectEvent", ["bucket_uri", "key", "kind", "size", "sequencer", "event_time", "overwrote"]
+)
+
+_fraction = re.compile(r"(\.\d{1,6})\d*")
+
+
+def parse_time(value):
+    """unix time of an RFC 3339 timestamp, None when missing"""
+    if not value:
+        return None
+    # python < 3.11 only parses "+00:00" and up to 6 fraction digits
+    value = _fraction.sub(r"\1", value.replace("Z", "+00:00"), count=1)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _s3_sequencer(value):
+    # s3 sequencers of one key compare as hex strings once right padded to the same length
+    return value.upper().ljust(32, "0") if value else None
+
+
+def _gcs_sequencer(value):
+    return str(value).zfill(20) if value not in (None, "") else None
+
+
+def _parse_s3_record(record):
+    name = record.get("eventName", "")
+    if name.startswith("ObjectCreated:"):
+        kind = CREATED
+    elif name.startswith("ObjectRemoved:"):
+        kind = DELETED
+    else:
+        return None
+    s3 = record["s3"]
+    obj = s3["object"]
+    return ObjectEvent(
+        f"s3://{s3['bucket']['name']}",
+        unquote_plus(obj["key"]),
+        kind,
+        obj.get("size") if kind == CREATED else None,
+        _s3_sequencer(obj.get("sequencer")),
+        parse_time(record.get("eventTime")),
+        None,
+    )
+
+
+def _parse_s3_eventbridge(document):
+    detail_type = document.get("detail-type")
+    if detail_type == "Object Created":
+        kind = CREATED
+    elif detail_type == "Object Deleted":
+        kind = DELETED
+    else:
+        return None
+    detail = document["detail"]
+    obj = detail["object"]
+    return ObjectEvent(
+        f"s3://{detail['bucket']['name']}",
+        obj["key"],
+        kind,
+        obj.get("size") if kind == CREATED else None,
+        _s3_sequencer(obj.get("sequencer")),
+        parse_time(document.get("time")),
+        None,
+    )
+
+
+def _parse_gcs_message(message):
+    attributes = message.get("attributes", {})
+    event_type = attributes.get("eventType")
+    if event_type == "OBJECT_FINALIZE":
+        kind = CREATED
+    elif event_type in ("OBJECT_DELETE", "OBJECT_ARCHIVE"):
+        # an archived object is no longer live, listings don't count it
+        kind = DELETED
+    else:
+        return None
+    resource = {}
+    if message.get("data"):
+        resource = json.loads(base64.b64decode(message["data"]))
+    size = resource.get("size")
+    return ObjectEvent(
+        f"gs://{attributes.get('bucketId') or resource['bucket']}",
+        attributes.get("objectId") or resource["name"],
+        kind,
+        int(size) if size is not None else None,
+        _gcs_sequencer(attributes.get("objectGeneration") or resource.get("generation")),
+        parse_time(attributes.get("eventTime") or resource.get("updated")),
+        _gcs_sequencer(attributes.get("overwroteGeneration")),
+    )
+
+
+def _parse_azure_event(event):
+    # Event Grid schema has "eventType", CloudEvents has "type"
+    event_type = event.get("eventType") or event.get("type")
+    if event_type == "Microsoft.Storage.BlobCreated":
+        kind = CREATED
+    elif event_type == "Microsoft.Storage.BlobDeleted":
+        kind = DELETED
+    else:
+        return None
+    # /blobServices/default/containers/<container>/blobs/<blob>
+    match = re.match(r"/blobServices/default/containers/([^/]+)/blobs/(.+)", event.get("subject", ""))
+    if match is None:
+        return None
+    data = event.get("data", {})
+    return ObjectEvent(
+        f"az://{match.group(1)}",
+        match.group(2),
+        kind,
+        data.get("contentLength") if kind == CREATED else None,
+        data.get("sequencer"),
+        parse_time(event.get("eventTime") or event.get("time")),
+        None,
+    )
+
+
+def parse_events(document):
+    """object events of one notification document
+
+    Args:
+        document (str, bytes, dict or list): a notification as delivered, see the module docstring
+
+    Returns:
+        list: ObjectEvent, notifications about anything else than objects
+            being created or deleted (test events, metadata updates) are skipped
+    """
+    if isinstance(document, (str, bytes)):
+        document = json.loads(document)
+    if isinstance(document, list):
+        return [event for item in document for event in parse_events(item)]
+    if not isinstance(document, dict):
+        raise ValueError(f"unsupported notification: {document!r}")
+
+    if "Records" in document:
+        events = [_parse_s3_record(record) for record in document["Records"] if "s3" in record]
+    elif document.get("Type") == "Notification" and "Message" in document:
+        return parse_events(document["Message"])
+    elif document.get("source") == "aws.s3":
+        events = [_parse_s3_eventbridge(document)]
+    elif isinstance(document.get("message"), dict):
+        events = [_parse_gcs_message(document["message"])]
+    elif "attributes" in document and "eventType" in document["attributes"]:
+        events = [_parse_gcs_message(document)]
+    elif str(document.get("eventType") or document.get("type") or "").startswith("Microsoft."):
+        events = [_parse_azure_event(document)]
+    elif document.get("Event") == "s3:TestEvent":
+        events = []
+    else:
+        raise ValueError(f"unsupported notification: {json.dumps(document)[:200]}")
+    return [event for event in events if event is not None]
+
+
+class SizeTracker(object):
+    """running bytes and count of one bucket (or prefix), kept up to date by notifications
+
+    Args:
+        bucket_uri (str): e.g. "s3://bucket_name", "gs://bucket_name/prefix/"
+        path (str, optional): sqlite store, shared by the trackers of every bucket.
+            Defaults to `~/.config/ying/tracker.sqlite3`.
+    """
+
+    def __init__(self, bucket_uri, path=None):
+        parsed_url = urlparse(bucket_uri)
+        self.bucket_uri = bucket_uri
+        self.scheme = parsed_url.scheme
+        self.bucket_name = parsed_url.netloc
+        self.prefix = parsed_url.path.lstrip("/")
+        self._event_bucket_uri = f"{self.scheme}://{self.bucket_name}"
+        self.path = Path(path or DEFAULT_TRACKER_PATH)
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "bucket_uri TEXT PRIMARY KEY, bytes INTEGER NOT NULL, count INTEGER NOT NULL, "
+                "keys INTEGER NOT NULL, unknown_deletes INTEGER NOT NULL, events INTEGER NOT NULL, "
+                "seeded_at REAL NOT NULL, reconciled_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # live is 0 for a deleted object, kept as a tombstone for its sequencer,
+            # replaced is the sequencer of an overwritten object of unknown size
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS objects ("
+                "bucket_uri TEXT NOT NULL, key TEXT NOT NULL, size INTEGER, sequencer TEXT, "
+                "live INTEGER NOT NULL, replaced TEXT, PRIMARY KEY (bucket_uri, key)) WITHOUT ROWID"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(str(self.path), timeout=30)
+
+    def get(self):
+        """current totals, one row lookup
+
+        Returns:
+            dict: { "bytes", "count", "exact", "unknown_deletes", "events",
+                "seeded_at", "reconciled_at", "updated_at" }, None when not seeded.
+                "exact" is False while deletes of unknown size wait for a reconciliation.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT bytes, count, unknown_deletes, events, seeded_at, reconciled_at, updated_at "
+                "FROM buckets WHERE bucket_uri = ?",
+                (self.bucket_uri,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "bytes": row[0],
+            "count": row[1],
+            "exact": row[2] == 0,
+            "unknown_deletes": row[2],
+            "events": row[3],
+            "seeded_at": row[4],
+            "reconciled_at": row[5],
+            "updated_at": row[6],
+        }
+
+    def seed(self, keys=False, **kwargs):
+        """scan the bucket and start tracking from its totals
+
+        Notifications older than the start of the scan are skipped from then on,
+        the scan already counted them.
+
+        Args:
+            keys (bool, optional): list every object and store its size, which makes
+                deletes and overwrites exact. Defaults to False, the totals of one
+                `get_bucket_objects_count_and_bytes` run, or of one listing of the
+                prefix for a prefix tracker.
+            **kwargs: passed to `get_bucket_objects_count_and_bytes`, engine defaults
+                to "sdk" since metrics lag behind the notifications. A prefix is
+                only counted by listing it, no other engine or argument applies.
+
+        Returns:
+            dict: the scanned { "bytes", "count" }
+        """
+        started_at = time.time()
+        if keys:
+            return self._seed_keys(started_at)
+
+        from ying.cloud_storage_size import get_bucket_objects_count_and_bytes
+
+        kwargs.setdefault("engine", "sdk")
+        if self.prefix:
+            if kwargs != {"engine": "sdk"}:
+                raise ValueError(f"{self.bucket_uri} is a prefix, it can only be seeded by listing it")
+            result = self._list_prefix()
+        else:
+            result = get_bucket_objects_count_and_bytes(self.bucket_uri, **kwargs)
+        if result is None or result["bytes"] < 0 or result["count"] < 0:
+            raise ValueError(f"no size of {self.bucket_uri} to seed the tracker from")
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM objects WHERE bucket_uri = ?", (self.bucket_uri,))
+            self._save_totals(conn, result["bytes"], result["count"], False, started_at)
+        return {"bytes": result["bytes"], "count": result["count"]}
+
+    def _list_prefix(self):
+        from ying.cloud_storage_size.list_object_count_and_bytes import PAGE_ITERATORS, count_pages
+
+        if self.scheme not in PAGE_ITERATORS:
+            raise ValueError("unsupported scheme")
+        iter_pages = PAGE_ITERATORS[self.scheme]
+        return count_pages(
+            lambda page_token: iter_pages(self.bucket_name, self.prefix, page_token),
+            self.scheme, self.bucket_name, self.prefix,
+        )
+
+    def _seed_keys(self, started_at):
+        from ying.cloud_storage_size.list_object_count_and_bytes import PAGE_ITERATORS
+
+        if self.scheme not in PAGE_ITERATORS:
+            raise ValueError("unsupported scheme")
+        total_bytes = 0
+        total_count = 0
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM objects WHERE bucket_uri = ?", (self.bucket_uri,))
+            for items, _ in PAGE_ITERATORS[self.scheme](self.bucket_name, self.prefix or None):
+                conn.executemany(
+                    "INSERT OR REPLACE INTO objects (bucket_uri, key, size, sequencer, live, replaced) "
+                    "VALUES (?, ?, ?, NULL, 1, NULL)",
+                    [(self.bucket_uri, key, size) for key, size in items],
+                )
+                total_bytes += sum(size for _, size in items)
+                total_count += len(items)
+            self._save_totals(conn, total_bytes, total_count, True, started_at)
+        return {"bytes": total_bytes, "count": total_count}
+
+    def _save_totals(self, conn, total_bytes, total_count, keys, started_at):
+        now = time.time()
+        row = conn.execute(
+            "SELECT events FROM buckets WHERE bucket_uri = ?", (self.bucket_uri,)
+        ).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO buckets (bucket_uri, bytes, count, keys, unknown_deletes, events, "
+            "seeded_at, reconciled_at, updated_at) VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)",
+            (self.bucket_uri, total_bytes, total_count, int(keys), row[0] if row else 0, started_at, now, now),
+        )
+
+    def reconcile(self, **kwargs):
+        """rescan the bucket, the same way it was seeded, and replace the totals
+
+        Returns:
+            dict: { "bytes", "count" } drift, the scanned totals minus the tracked ones
+        """
+        before = self.get()
+        if before is None:
+            raise ValueError(f"{self.bucket_uri} is not tracked, seed it first")
+        with closing(self._connect()) as conn:
+            keys = bool(conn.execute(
+                "SELECT keys FROM buckets WHERE bucket_uri = ?", (self.bucket_uri,)
+            ).fetchone()[0])
+        after = self.seed(keys=keys, **kwargs)
+        drift = {"bytes": after["bytes"] - before["bytes"], "count": after["count"] - before["count"]}
+        if drift["bytes"] or drift["count"]:
+            logger.info("[bucket_uri: %s] reconciled, drift %s", self.bucket_uri, drift)
+        return drift
+
+    def apply(self, events):
+        """apply object events in one transaction
+
+        Events of other buckets, outside the prefix, or older than the last
+        scan are skipped.
+
+        Returns:
+            int: number of events that changed the totals
+        """
+        applied = 0
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT bytes, count, keys, unknown_deletes, events, seeded_at FROM buckets WHERE bucket_uri = ?",
+                (self.bucket_uri,),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"{self.bucket_uri} is not tracked, seed it first")
+            totals = {"bytes": row[0], "count": row[1], "unknown_deletes": row[3]}
+            keys, events_count, seeded_at = bool(row[2]), row[4], row[5]
+            for event in events:
+                if event.bucket_uri != self._event_bucket_uri or not event.key.startswith(self.prefix):
+                    continue
+                if event.event_time is not None and event.event_time < seeded_at:
+                    continue
+                if self._apply_event(conn, event, totals, keys):
+                    applied += 1
+            conn.execute(
+                "UPDATE buckets SET bytes = ?, count = ?, unknown_deletes = ?, events = ?, updated_at = ? "
+                "WHERE bucket_uri = ?",
+                (
+                    totals["bytes"], totals["count"], totals["unknown_deletes"], events_count + applied,
+                    time.time(), self.bucket_uri,
+                ),
+            )
+        return applied
+
+    def _apply_event(self, conn, event, totals, keys):
+        row = conn.execute(
+            "SELECT size, sequencer, live, replaced FROM objects WHERE bucket_uri = ? AND key = ?",
+            (self.bucket_uri, event.key),
+        ).fetchone()
+        size, sequencer, live, replaced = row if row is not None else (None, None, 0, None)
+        # objects from a listing have no sequencer, any notification is newer
+        newer = sequencer is None or event.sequencer is None or event.sequencer > sequencer
+
+        if event.kind == CREATED:
+            if not newer:
+                return False
+            event_size = event.size or 0
+            if live:
+                totals["bytes"] += event_size - (size or 0)
+                replaced = None
+            elif row is None and not keys and event.overwrote is not None:
+                # GCS told us an object of unknown size was replaced, its delete
+                # notification carries the size to subtract
+                totals["bytes"] += event_size
+                replaced = event.overwrote
+            else:
+                totals["bytes"] += event_size
+                totals["count"] += 1
+                replaced = None
+            self._save_object(conn, event.key, event_size, event.sequencer, 1, replaced)
+            return True
+
+        # GCS deletes name the generation they delete, equal to the live sequencer
+        if not newer and not (live and event.sequencer == sequencer):
+            if replaced is not None and event.sequencer == replaced and event.size is not None:
+                totals["bytes"] -= event.size
+                self._save_object(conn, event.key, size, sequencer, live, None)
+                return True
+            return False
+        if live:
+            totals["bytes"] -= size if size is not None else (event.size or 0)
+            totals["count"] -= 1
+        elif row is None and not keys:
+            totals["count"] -= 1
+            if event.size is not None:
+                totals["bytes"] -= event.size
+            else:
+                totals["unknown_deletes"] += 1
+        else:
+            # already deleted, or never existed in a fully listed bucket
+            self._save_object(conn, event.key, None, event.sequencer, 0, None)
+            return False
+        self._save_object(conn, event.key, None, event.sequencer, 0, None)
+        return True
+
+    def _save_object(self, conn, key, size, sequencer, live, replaced):
+        conn.execute(
+            "INSERT OR REPLACE INTO objects (bucket_uri, key, size, sequencer, live, replaced) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self.bucket_uri, key, size, sequencer, live, replaced),
+        )
+
+    def consume(self, source, timeout=0):
+        """apply the notifications `source` has now, then commit them
+
+        Returns:
+            int: number of events that changed the totals
+        """
+        documents = source.receive(timeout)
+        if not documents:
+            return 0
+        events = []
+        for document in documents:
+            try:
+                events.extend(parse_events(document))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error("[bucket_uri: %s] skipped a notification: %s", self.bucket_uri, e)
+        applied = self.apply(events)
+        source.commit()
+        return applied
+
+    def run(self, source, reconcile_every=None, poll_timeout=1, stop=None):
+        """consume notifications until `stop` is set, reconciling periodically
+
+        Args:
+            source: notification source, see `FileSource`, `DirectorySource`, `QueueSource`
+            reconcile_every (float, optional): seconds between reconciliations,
+                setting `tracker_reconcile_every` (a day) when None, 0 to never reconcile
+            poll_timeout (float, optional): seconds to wait for notifications
+            stop (threading.Event, optional): stops the loop once set
+        """
+        if reconcile_every is None:
+            reconcile_every = settings.get("tracker_reconcile_every", DEFAULT_RECONCILE_EVERY)
+        if self.get() is None:
+            self.seed()
+        while stop is None or not stop.is_set():
+            self.consume(source, poll_timeout)
+            if reconcile_every and time.time() - self.get()["reconciled_at"] >= reconcile_every:
+                self.reconcile()
+
+
+def _read_documents(path):
+    with open(path, "r") as f:
+        text = f.read()
+    try:
+        return [json.loads(text)] if text.strip() else []
+    except ValueError:
+        # JSON lines, one notification per line
+        return [line for line in text.splitlines() if line.strip()]
+
+
+class FileSource(object):
+    """notifications appended to a JSON lines file, read from the last committed offset
+
+    The offset is saved next to the file (`<path>.offset`) on commit.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._offset_path = self.path.with_name(self.path.name + ".offset")
+        try:
+            self._offset = int(self._offset_path.read_text())
+        except (OSError, ValueError):
+            self._offset = 0
+        self._next_offset = self._offset
+
+    def receive(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        while True:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            # only complete lines, a writer may be halfway through the last one
+            end = data.rfind(b"\n") + 1
+            if end or time.monotonic() >= deadline:
+                break
+            time.sleep(min(0.5, max(0, deadline - time.monotonic())))
+        self._next_offset = self._offset + end
+        return [line for line in data[:end].decode().splitlines() if line.strip()]
+
+    def commit(self):
+        self._offset = self._next_offset
+        tmp_path = self._offset_path.with_suffix(".tmp")
+        tmp_path.write_text(str(self._offset))
+        os.replace(tmp_path, self._offset_path)
+
+
+class DirectorySource(object):
+    """notification files dropped in a directory, moved to `processed/` on commit
+
+    Every `*.json` file holds one notification document or JSON lines, they
+    are read in name order.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.processed_path = self.path / "processed"
+        self._received = []
+
+    def receive(self, timeout=0):
+        deadline = time.monotonic() + timeout
+        while True:
+            files = sorted(self.path.glob("*.json")) + sorted(self.path.glob("*.jsonl"))
+            if files or time.monotonic() >= deadline:
+                break
+            time.sleep(min(0.5, max(0, deadline - time.monotonic())))
+        self._received = sorted(files)
+        return [document for file in self._received for document in _read_documents(file)]
+
+    def commit(self):
+        os.makedirs(self.processed_path, exist_ok=True)
+        for file in self._received:
+            os.replace(file, self.processed_path / file.name)
+        self._received = []
+
+
+class QueueSource(object):
+    """notifications put on a `queue.Queue`, a stand-in for SQS or Pub/Sub"""
+
+    def __init__(self, queue, batch_size=1000):
+        self.queue = queue
+        self.batch_size = batch_size
+
+    def receive(self, timeout=0):
+        import queue
+
+        documents = []
+        try:
+            documents.append(self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait())
+            while len(documents) < self.batch_size:
+                documents.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return documents
+
+    def commit(self):
+        pass
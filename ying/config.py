@@ -1,15 +1,49 @@
-import os
-from dynaconf import Dynaconf
+import threading
 from pathlib import Path
 
 config_dir = Path.home() / ".config" / "ying"
-if not config_dir.exists():
-    os.makedirs(config_dir, exist_ok=True)
-
-settings = Dynaconf(
-    root_path=config_dir,
-    settings_files=["settings.toml"],
-    environments=True,
-    envvar_prefix="YING",
-    load_dotenv=True,
-)
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def get_settings():
+    """the Dynaconf settings, built on first use
+
+    Importing dynaconf takes longer than the rest of `ying` together, so it is
+    only imported once a setting is read. The config dir is not created here,
+    the code writing below it creates what it needs.
+    """
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                from dynaconf import Dynaconf
+
+                # dynaconf walks up from an existing root looking for .env files,
+                # a missing config dir has no file to offer, start from its parent
+                root_path = next(path for path in (config_dir, *config_dir.parents) if path.exists())
+                _settings = Dynaconf(
+                    root_path=root_path,
+                    settings_files=[str(config_dir / "settings.toml")],
+                    environments=True,
+                    envvar_prefix="YING",
+                    load_dotenv=True,
+                )
+    return _settings
+
+
+class LazySettings(object):
+    """stands for the Dynaconf settings, `settings.get(...)` builds them on first use"""
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
+    def __getitem__(self, key):
+        return get_settings()[key]
+
+    def __contains__(self, key):
+        return key in get_settings()
+
+
+settings = LazySettings()
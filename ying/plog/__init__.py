@@ -2,41 +2,210 @@ import subprocess
 import os
 import pty
 import sys
+import logging
+import selectors
+import threading
 from datetime import datetime
-import re
-from ying.thirdparty.telegram import send_message, edit_message_text
+from ying.plog.stream import RingBuffer, OutputDecoder
+from ying.plog.analyzer import make_analyzer
+from ying.plog.session import SessionLog, prune_sessions, iter_session_output
+from ying.thirdparty.telegram import send_message, get_client
 from ying.utils.runtime import format_host_banner
 from ying.config import settings
 
-ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+logger = logging.getLogger(__name__)
 
-send_telegram_last_time = None
 RATE_LIMIT_MODE_APPEND = 5
 RATE_LIMIT_MODE_REPLACE = 1
 
+MAX_MESSAGE_LENGTH = 4096
+# bytes per read of the pty, large reads keep a chatty command from stalling
+READ_SIZE = 65536
+# raw output kept for the next report, only the tail fits in a message anyway
+PENDING_LIMIT = 4 * MAX_MESSAGE_LENGTH
 
-def send_data_to_telegram(data, message_id, rt=RATE_LIMIT_MODE_REPLACE):
-    global send_telegram_last_time
-    if send_telegram_last_time is not None:
-        if (datetime.now() - send_telegram_last_time).seconds < rt:
-            return message_id
 
+def send_data_to_telegram(data, message_id):
+    """send the first report of a command, later ones edit its message
+
+    Edits go through the shared client dispatcher, which coalesces them per
+    message and spreads them over the bot rate limits, so any number of
+    commands can report at once.
+    """
     chat_id = settings.get("tg_chat_id", None)
     if chat_id is None:
         raise ValueError("tg_chat_id is not configured, please add it.")
 
     if message_id is None:
         message_id = send_message(chat_id, data)
-    edit_message_text(chat_id, message_id, data)
-    send_telegram_last_time = datetime.now()
+    else:
+        get_client().schedule_edit(chat_id, message_id, data)
 
     return message_id
 
 
-def run_command(command, mode='a'):
+class TelegramReporter(object):
+    """reports the output of a command to Telegram from a background thread
+
+    The relay only hands raw bytes over with `feed`, decoding, ANSI stripping,
+    formatting and the Telegram calls all happen on the reporter thread, once
+    per rate limit interval, so a slow Telegram never blocks the command.
+    Pending output is a fixed size ring buffer and the message text is capped,
+    so memory and work per byte stay constant however long the command runs.
+    The decoded output goes through an analyzer (see `ying.plog.analyzer`),
+    which renders the message and decides whether it is worth an edit.
+    """
+
+    def __init__(self, command, host_banner, mode="a", analyzer=None):
+        self.command = command
+        self.host_banner = host_banner
+        self.mode = mode
+        self.interval = RATE_LIMIT_MODE_APPEND if mode == "a" else RATE_LIMIT_MODE_REPLACE
+        self.message_id = None
+        self.analyzer = make_analyzer(mode, analyzer, capacity=MAX_MESSAGE_LENGTH)
+        self._pending = RingBuffer(PENDING_LIMIT)
+        self._decoder = OutputDecoder()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="plog-reporter", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def feed(self, data):
+        with self._lock:
+            self._pending.write(data)
+
+    def close(self):
+        """send the last output and wait for the reporter thread"""
+        self._closed.set()
+        self._thread.join()
+        if self.message_id is not None:
+            get_client().flush(timeout=60)
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            self._report()
+        self._report(force=True)
+
+    def _report(self, force=False):
+        with self._lock:
+            data, dropped = self._pending.read()
+        if dropped:
+            # output was overwritten before this report, start over from the buffered tail
+            self._decoder.reset()
+            self.analyzer.reset()
+        if data:
+            self.analyzer.feed(self._decoder.decode(data, skip_partial_character=bool(dropped)))
+        if not force and not self.analyzer.should_report():
+            return
+
+        # a callable banner fills in the external IP once its lookup finished
+        host_banner = self.host_banner() if callable(self.host_banner) else self.host_banner
+        text = f'`{datetime.now().strftime("[%H:%M:%S]")} {host_banner}`\n'
+        text += f"$ `{self.command}`\n"
+        output = self.analyzer.render(MAX_MESSAGE_LENGTH - len(text) - len("```\n```"))
+        text += f"```\n{output}```"
+        try:
+            self.message_id = send_data_to_telegram(text, self.message_id)
+        except Exception as e:
+            logger.error("failed to report to telegram: %s", e)
+
+
+def relay(master_fd, process, on_output, out=None):
+    """copy the pty output to `out` until the command closes it
+
+    The pty is drained without blocking in READ_SIZE reads every time the
+    selector reports output, then the drained chunks are written and handed
+    to `on_output` at once, which keeps the per-read work to one syscall.
+    When the command has exited and nothing arrives for a second, the relay
+    stops even if a background child still holds the pty open.
+    """
+    out = out or sys.stdout.buffer
+    os.set_blocking(master_fd, False)
+    selector = selectors.DefaultSelector()
+    selector.register(master_fd, selectors.EVENT_READ)
+    closed = False
+    try:
+        while not closed:
+            if not selector.select(timeout=1):
+                if process.poll() is not None:
+                    break
+                continue
+            chunks = []
+            while True:
+                try:
+                    output = os.read(master_fd, READ_SIZE)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    # EIO once the last writer closed the pty
+                    closed = True
+                    break
+                if not output:
+                    closed = True
+                    break
+                chunks.append(output)
+                if len(chunks) >= 64:
+                    break
+            if chunks:
+                output = b"".join(chunks)
+                out.write(output)
+                out.flush()
+                on_output(output)
+    finally:
+        selector.close()
+
+
+class PrefixedWriter(object):
+    """writes the output of one of many commands to a shared stream, every
+    line prefixed and every chunk written at once under the shared lock"""
+
+    def __init__(self, out, prefix, lock):
+        self.out = out
+        self.prefix = prefix
+        self.lock = lock
+        self._line_start = True
+
+    def write(self, data):
+        lines = data.split(b"\n")
+        parts = []
+        for index, line in enumerate(lines):
+            if index > 0:
+                parts.append(b"\n")
+                self._line_start = True
+            if line:
+                if self._line_start:
+                    parts.append(self.prefix)
+                    self._line_start = False
+                parts.append(line)
+        with self.lock:
+            self.out.write(b"".join(parts))
+
+    def flush(self):
+        with self.lock:
+            self.out.flush()
+
+
+def run_command(command, mode='a', out=None, host_banner=None, analyzer=None):
     """
     mode: a - append, r - replace
+    analyzer: output analyzer name or class, see `ying.plog.analyzer.make_analyzer`
     """
+    if settings.get("tg_chat_id", None) is None:
+        raise ValueError("tg_chat_id is not configured, please add it.")
+
+    if host_banner is None:
+        # start the external IP lookup now, the reports pick it up once resolved
+        format_host_banner()
+        host_banner = format_host_banner
+
+    session = None
+    if settings.get("plog_session_log", True):
+        # built before the command starts, a bad compression setting fails here
+        session = SessionLog(command)
+
     master_fd, slave_fd = pty.openpty()
 
     process = subprocess.Popen(
@@ -50,40 +219,62 @@ def run_command(command, mode='a'):
 
     os.close(slave_fd)
 
-    host_banner = format_host_banner()
+    reporter = TelegramReporter(command, host_banner, mode, analyzer).start()
+    if session is not None:
+        prune_sessions()
+        session.start()
 
-    telegram_message_id = None
-    filtered_output = ""
+    def on_output(data):
+        reporter.feed(data)
+        if session is not None:
+            session.feed(data)
 
-    MAX_MESSAGE_LENGTH = 4096
-    while True:
-        try:
-            output = os.read(master_fd, 1024)
-            if not output:
-                break
-            sys.stdout.buffer.write(output)
-            sys.stdout.buffer.flush()
-
-            rt_sec = RATE_LIMIT_MODE_REPLACE
-            if mode == 'a':
-                filtered_output += ansi_escape.sub("", output.decode("utf-8"))
-                rt_sec = RATE_LIMIT_MODE_APPEND
-            else:
-                filtered_output = ansi_escape.sub("", output.decode("utf-8"))
-
-            # send to telegram
-            text = f'`{datetime.now().strftime("[%H:%M:%S]")} {host_banner}`\n'
-            text += f"$ `{command}`\n"
-            text_len = len(text)
-            if len(filtered_output) + text_len > MAX_MESSAGE_LENGTH:
-                cutted_output = filtered_output[-(MAX_MESSAGE_LENGTH - text_len):]
-                text += f"```\n{cutted_output}```"
-                filtered_output = cutted_output
-            else:
-                text += f"```\n{filtered_output.lstrip()}```"
-            telegram_message_id = send_data_to_telegram(text, telegram_message_id, rt_sec)
-
-        except OSError:
-            break
-
-    process.wait()
+    try:
+        relay(master_fd, process, on_output, out)
+    finally:
+        os.close(master_fd)
+        process.wait()
+        reporter.close()
+        if session is not None:
+            session.close(process.returncode)
+            sys.stderr.write(f"plog session {session.session_id}, see `ying plog-tail {session.session_id}`\n")
+    return process.returncode
+
+
+def run_commands(commands, mode='a', max_parallel=None, analyzer=None):
+    """run commands concurrently, each on its own pty and Telegram message
+
+    The output of command i is echoed with a "[i] " prefix on every line.
+    Telegram edits of every command go through the one client dispatcher,
+    oldest pending edit first, within the bot rate limits.
+
+    Returns:
+        list: exit code of every command, in order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if settings.get("tg_chat_id", None) is None:
+        raise ValueError("tg_chat_id is not configured, please add it.")
+
+    lock = threading.Lock()
+    out = sys.stdout.buffer
+    with ThreadPoolExecutor(max_workers=max_parallel or max(1, len(commands))) as executor:
+        futures = [
+            executor.submit(
+                run_command,
+                command,
+                mode,
+                PrefixedWriter(out, f"[{index}] ".encode(), lock),
+                analyzer=analyzer,
+            )
+            for index, command in enumerate(commands)
+        ]
+        return [future.result() for future in futures]
+
+
+def tail_session(session=None, since=None, out=None):
+    """write the recorded output of a session, from `since` on ("10m", "2h", ...)"""
+    out = out or sys.stdout.buffer
+    for data in iter_session_output(session, since):
+        out.write(data)
+    out.flush()
@@ -0,0 +1,234 @@
+import re
+import time
+from collections import deque, namedtuple
+
+from ying.config import settings
+
+DEFAULT_CAPACITY = 4096
+# percent points the progress has to move before it is reported again
+DEFAULT_PROGRESS_STEP = 5
+# seconds after which a progress change is reported even under the step
+DEFAULT_PROGRESS_HEARTBEAT = 60
+# complete lines shown above the current one in replace mode
+REPLACE_LINES = 5
+
+# "45%", "45.5 %"
+percent_pattern = re.compile(r"(?<![\d.])(\d{1,3}(?:\.\d+)?)\s?%")
+# "eta 0:00:12", "ETA: 12s", tqdm "[00:10<00:20, 5.00it/s]"
+eta_pattern = re.compile(r"(?:\beta:?\s*|<)(\d+(?::\d+)*(?:[hms]\b)?)", re.IGNORECASE)
+# "1.2/3.4 MB", "12/100", only looked at when there is no percent
+fraction_pattern = re.compile(r"(?<![\d./])(\d+(?:\.\d+)?)\s?/\s?(\d+(?:\.\d+)?)(?![\d./])")
+digits_pattern = re.compile(r"\d+(?:\.\d+)?")
+
+Progress = namedtuple("Progress", ["percent", "eta"])
+
+
+def parse_progress(line):
+    """percent done and ETA of a progress line, None when it reports neither
+
+    Args:
+        line (str): one line of output, without line endings
+
+    Returns:
+        Progress: percent (float or None) and eta (str or None)
+    """
+    percent = None
+    match = percent_pattern.search(line)
+    if match is not None:
+        percent = float(match.group(1))
+    else:
+        match = fraction_pattern.search(line)
+        if match is not None:
+            done, total = float(match.group(1)), float(match.group(2))
+            if 0 < total and done <= total:
+                percent = 100 * done / total
+    match = eta_pattern.search(line)
+    eta = match.group(1) if match is not None else None
+    if percent is None and eta is None:
+        return None
+    return Progress(percent, eta)
+
+
+def _shape(line):
+    return digits_pattern.sub("#", line)
+
+
+class OutputAnalyzer(object):
+    """passes the output through, every new output is reported
+
+    An analyzer sits between the decoded output and the Telegram message: the
+    reporter `feed`s it the text decoded since the last report, asks
+    `should_report` and `render`s the message body when it agrees. Append
+    mode keeps the tail of all output, replace mode the last chunk.
+    """
+
+    def __init__(self, mode="a", capacity=DEFAULT_CAPACITY):
+        self.mode = mode
+        self.capacity = capacity
+        self._output = ""
+        self._changed = False
+
+    def reset(self):
+        """forget the output after a gap in the stream"""
+        self._output = ""
+
+    def feed(self, text):
+        if self.mode == "a":
+            self._output = (self._output + text)[-self.capacity:]
+        else:
+            self._output = text
+        self._changed = True
+
+    def should_report(self):
+        return self._changed
+
+    def render(self, limit):
+        """message body of at most `limit` characters, the state is then reported"""
+        self._changed = False
+        if len(self._output) > limit:
+            return self._output[-limit:]
+        return self._output.lstrip()
+
+
+class ProgressAnalyzer(OutputAnalyzer):
+    """reports progress bars on meaningful changes only
+
+    The output is kept like a terminal shows it: a carriage return rewrites
+    the current line, so a tqdm, rsync or pip bar is one line whatever its
+    number of updates. Repeated lines are shown once with a count, and
+    consecutive lines only differing by their numbers and holding a percent
+    are collapsed into the last one.
+
+    New lines and partial lines (a prompt) are reported as before. A progress
+    update is only reported once its percent moved `step` points from the
+    reported one or reached 100, anything else, such as a spinner or a bar
+    without percent, at most every `heartbeat` seconds.
+    """
+
+    def __init__(self, mode="a", capacity=DEFAULT_CAPACITY, step=None, heartbeat=None, clock=time.monotonic):
+        super().__init__(mode, capacity)
+        self.step = settings.get("plog_progress_step", DEFAULT_PROGRESS_STEP) if step is None else step
+        self.heartbeat = (
+            settings.get("plog_progress_heartbeat", DEFAULT_PROGRESS_HEARTBEAT) if heartbeat is None else heartbeat
+        )
+        self.clock = clock
+        self.progress = None
+        # complete lines as [text, count], at most `capacity` characters
+        self._lines = deque()
+        self._size = 0
+        self._current = ""
+        self._carriage = False
+        self._overwritten = False
+        self._dirty = False
+        self._reported_at = clock()
+        self._reported_percent = None
+        self._reported_current = ""
+
+    def reset(self):
+        self._lines.clear()
+        self._size = 0
+        self._current = ""
+        self._carriage = False
+        self._overwritten = False
+
+    def feed(self, text):
+        # the pty turns "\n" into "\r\n", a carriage return only clears the
+        # line once something follows it on the same line
+        for index, part in enumerate(text.split("\n")):
+            if index:
+                self._end_line()
+            for position, piece in enumerate(part.split("\r")):
+                if position:
+                    self._carriage = True
+                if not piece:
+                    continue
+                if self._carriage:
+                    self._current = ""
+                    self._carriage = False
+                    self._overwritten = True
+                self._current = (self._current + piece)[-self.capacity:]
+        if text:
+            self._dirty = True
+        if self._current and self._current != self._reported_current:
+            progress = parse_progress(self._current)
+            if progress is not None:
+                self._update_progress(progress)
+            elif not self._overwritten:
+                self._changed = True
+
+    def _end_line(self):
+        line = self._current
+        self._current = ""
+        self._carriage = False
+        self._overwritten = False
+        last = self._lines[-1] if self._lines else None
+        if last is not None and last[0] == line:
+            # blank lines collapse without a count
+            if line:
+                last[1] += 1
+            return
+        progress = parse_progress(line)
+        if progress is not None and last is not None and _shape(last[0]) == _shape(line):
+            self._size += len(line) - len(last[0])
+            last[0] = line
+            self._update_progress(progress)
+            return
+        self._lines.append([line, 1])
+        self._size += len(line) + 1
+        while self._size > self.capacity and len(self._lines) > 1:
+            self._size -= len(self._lines.popleft()[0]) + 1
+        if progress is not None:
+            self.progress = progress
+        self._changed = True
+
+    def _update_progress(self, progress):
+        self.progress = progress
+        if progress.percent is None:
+            return
+        if (
+            self._reported_percent is None
+            or abs(progress.percent - self._reported_percent) >= self.step
+            or progress.percent >= 100 > self._reported_percent
+        ):
+            self._changed = True
+
+    def should_report(self):
+        return self._changed or (self._dirty and self.clock() - self._reported_at >= self.heartbeat)
+
+    def render(self, limit):
+        self._changed = False
+        self._dirty = False
+        self._reported_at = self.clock()
+        self._reported_percent = self.progress.percent if self.progress is not None else None
+        self._reported_current = self._current
+
+        lines = list(self._lines)
+        if self.mode != "a":
+            lines = lines[-REPLACE_LINES:]
+        output = "".join(f"{text}\n" if count == 1 else f"{text} [x{count}]\n" for text, count in lines)
+        output += self._current
+        if len(output) > limit:
+            return output[-limit:]
+        return output.lstrip()
+
+
+ANALYZERS = {"raw": OutputAnalyzer, "progress": ProgressAnalyzer}
+
+
+def make_analyzer(mode="a", analyzer=None, capacity=DEFAULT_CAPACITY):
+    """the analyzer of one command
+
+    Args:
+        mode (str): a - append, r - replace
+        analyzer: a name in ANALYZERS, an OutputAnalyzer subclass or a factory
+            taking (mode, capacity), setting `plog_analyzer` ("progress") when None
+
+    Returns:
+        OutputAnalyzer: a new analyzer
+    """
+    analyzer = analyzer or settings.get("plog_analyzer", "progress")
+    if isinstance(analyzer, str):
+        if analyzer not in ANALYZERS:
+            raise ValueError(f"unknown plog analyzer {analyzer!r}, expected one of {sorted(ANALYZERS)}")
+        analyzer = ANALYZERS[analyzer]
+    return analyzer(mode, capacity)
@@ -0,0 +1,327 @@
+import os
+import re
+import json
+import mmap
+import time
+import zlib
+import shutil
+import struct
+import logging
+import threading
+import itertools
+from pathlib import Path
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# raw bytes per compressed frame, and the longest a frame stays open
+FRAME_SIZE = 256 * 1024
+FRAME_SECONDS = 1.0
+# raw bytes waiting for the writer before `feed` blocks the relay, and the
+# longest it blocks before dropping the output
+MAX_PENDING = 4 * 1024 * 1024
+FEED_TIMEOUT = 1.0
+# compressed bytes per segment file before rotating to the next one, and the
+# segments kept per session, older ones are removed
+SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_SEGMENTS = 16
+DEFAULT_MAX_SESSIONS = 50
+
+# one record per frame: time of its first byte, segment, offset and length in
+# the segment, offset of its first byte in the raw output
+INDEX_RECORD = struct.Struct("<dIQIQ")
+SUFFIXES = {"gzip": "gz", "zstd": "zst"}
+
+_session_numbers = itertools.count()
+
+
+def sessions_dir():
+    from ying.config import config_dir
+
+    return config_dir / "sessions"
+
+
+def _gzip_frame(data):
+    # every frame is a gzip member, a segment is a valid .gz file
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compressor(compression):
+    if compression not in SUFFIXES:
+        raise ValueError(f"unsupported plog session compression {compression!r}, use one of {sorted(SUFFIXES)}")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("zstd plog sessions need zstandard, `pip install ying[zstd]`") from e
+
+        return zstandard.ZstdCompressor(level=3).compress
+    return _gzip_frame
+
+
+def _decompressor(compression):
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress
+    return lambda data: zlib.decompress(data, 31)
+
+
+def _split_frames(chunks):
+    """yield (time of the first byte, data) frames of at most FRAME_SIZE bytes from (time, data) chunks"""
+    parts, size, since = [], 0, None
+    for chunk_time, data in chunks:
+        while data:
+            if since is None:
+                since = chunk_time
+            part = data[: FRAME_SIZE - size]
+            parts.append(part)
+            size += len(part)
+            data = data[len(part):]
+            if size >= FRAME_SIZE:
+                yield since, b"".join(parts)
+                parts, size, since = [], 0, None
+    if parts:
+        yield since, b"".join(parts)
+
+
+class SessionLog(object):
+    """full raw output of a plog command, in independently compressed frames
+
+    The relay only appends chunks with `feed`, a writer thread compresses
+    them in frames of FRAME_SIZE bytes, at least every FRAME_SECONDS, appends
+    the frames to the current segment (`output.<n>.gz` or `.zst`, rotated every
+    SEGMENT_SIZE bytes, only the last `max_segments` are kept) and records
+    them in `index`. Readers find a position by time in the index and only
+    decompress the frames from there.
+
+    At most MAX_PENDING bytes wait for the writer. Past that `feed` blocks the
+    relay for up to FEED_TIMEOUT, then drops the output and a marker line
+    tells how much is missing, so a command writing faster than the
+    compression keeps a bounded memory use.
+    """
+
+    def __init__(self, command, session_id=None, root=None, compression=None, max_segments=None):
+        from ying.config import settings
+
+        self.compression = compression or settings.get("plog_session_compression", "gzip")
+        self.max_segments = max_segments or settings.get("plog_session_max_segments", DEFAULT_MAX_SEGMENTS)
+        self.session_id = session_id or (
+            f"{datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}-{next(_session_numbers)}"
+        )
+        self.path = (root or sessions_dir()) / self.session_id
+        self.command = command
+        self._compress = _compressor(self.compression)
+        self._pending = []
+        self._pending_size = 0
+        self._dropped = 0
+        self._raw_offset = 0
+        self._segment = 0
+        self._segment_size = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="plog-session", daemon=True)
+
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._write_meta(started_at=time.time())
+        self._index = open(self.path / "index", "ab")
+        self._output = open(self._segment_path(self._segment), "ab")
+        self._thread.start()
+        return self
+
+    def _segment_path(self, segment):
+        return self.path / f"output.{segment:06d}.{SUFFIXES[self.compression]}"
+
+    def _write_meta(self, **values):
+        meta_path = self.path / "meta.json"
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {"command": self.command, "compression": self.compression}
+        meta.update(values)
+        tmp_path = meta_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def feed(self, data):
+        with self._wake:
+            if self._pending_size >= MAX_PENDING and not self._drained.wait_for(
+                lambda: self._pending_size < MAX_PENDING or self._closed, FEED_TIMEOUT
+            ):
+                if not self._dropped:
+                    logger.warning("[%s] session log fell behind, dropping output", self.path)
+                self._dropped += len(data)
+                return
+            self._append_dropped_marker()
+            self._append(data)
+
+    def _append(self, data):
+        self._pending.append((time.time(), data))
+        self._pending_size += len(data)
+        if self._pending_size >= FRAME_SIZE:
+            self._wake.notify()
+
+    def _append_dropped_marker(self):
+        if self._dropped:
+            marker = f"\r\n[plog: {self._dropped} bytes of output dropped, the session log fell behind]\r\n"
+            self._append(marker.encode())
+            self._dropped = 0
+
+    def close(self, returncode=None):
+        with self._wake:
+            self._append_dropped_marker()
+            self._closed = True
+            self._wake.notify()
+            self._drained.notify_all()
+        self._thread.join()
+        self._index.close()
+        self._output.close()
+        self._write_meta(finished_at=time.time(), returncode=returncode, bytes=self._raw_offset)
+
+    def _run(self):
+        while True:
+            with self._wake:
+                if not self._closed and self._pending_size < FRAME_SIZE:
+                    self._wake.wait(FRAME_SECONDS)
+                chunks = self._pending
+                self._pending, self._pending_size = [], 0
+                closed = self._closed
+                self._drained.notify_all()
+            for since, data in _split_frames(chunks):
+                try:
+                    self._write_frame(data, since)
+                except OSError as e:
+                    logger.error("[%s] failed to write session log: %s", self.path, e)
+            if closed:
+                return
+
+    def _write_frame(self, data, since):
+        frame = self._compress(data)
+        if self._segment_size and self._segment_size + len(frame) > SEGMENT_SIZE:
+            self._output.close()
+            self._segment += 1
+            self._segment_size = 0
+            self._output = open(self._segment_path(self._segment), "ab")
+            expired = self._segment - self.max_segments
+            if expired >= 0:
+                try:
+                    os.remove(self._segment_path(expired))
+                except FileNotFoundError:
+                    pass
+        self._output.write(frame)
+        self._output.flush()
+        # the frame is on disk before its index record, readers never see a partial frame
+        self._index.write(
+            INDEX_RECORD.pack(since, self._segment, self._segment_size, len(frame), self._raw_offset)
+        )
+        self._index.flush()
+        self._segment_size += len(frame)
+        self._raw_offset += len(data)
+
+
+def prune_sessions(max_sessions=None, root=None):
+    """remove the oldest sessions, keeping `max_sessions` (setting `plog_max_sessions`)"""
+    from ying.config import settings
+
+    max_sessions = settings.get("plog_max_sessions", DEFAULT_MAX_SESSIONS) if max_sessions is None else max_sessions
+    root = root or sessions_dir()
+    if not root.exists():
+        return
+    sessions = sorted(path for path in root.iterdir() if path.is_dir())
+    for path in sessions[: max(0, len(sessions) - max_sessions)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def find_session(session=None, root=None):
+    """session dir from an id, a unique id prefix, a path, or the latest one when None"""
+    root = root or sessions_dir()
+    if session is not None and os.path.isdir(str(session)):
+        return Path(session)
+    sessions = sorted(path for path in root.iterdir() if path.is_dir()) if root.exists() else []
+    if session is None or session in ("last", "latest"):
+        if not sessions:
+            raise ValueError(f"no plog session in {root}")
+        return sessions[-1]
+    matches = [path for path in sessions if path.name.startswith(str(session))]
+    if len(matches) != 1:
+        raise ValueError(f"{len(matches)} plog sessions match {session!r} in {root}")
+    return matches[0]
+
+
+def parse_since(since):
+    """unix time from a duration ago ("90s", "10m", "2h", "1d") or a unix time"""
+    if since is None:
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", str(since).strip())
+    if match is None:
+        return float(since)
+    seconds = float(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    return time.time() - seconds
+
+
+def read_index(path):
+    """frame records of a session, read through mmap"""
+    index_path = path / "index"
+    size = os.path.getsize(index_path)
+    count = size // INDEX_RECORD.size
+    if count == 0:
+        return []
+    with open(index_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+        return [INDEX_RECORD.unpack_from(index, i * INDEX_RECORD.size) for i in range(count)]
+
+
+def _first_frame(records, since):
+    """index of the frame holding the output written at `since`, by binary search"""
+    low, high = 0, len(records)
+    while low < high:
+        middle = (low + high) // 2
+        if records[middle][0] <= since:
+            low = middle + 1
+        else:
+            high = middle
+    return max(0, low - 1)
+
+
+def iter_session_output(session=None, since=None, root=None):
+    """yield the raw output of a session from `since` on, frame by frame
+
+    Frames are only timed by their first byte, so the output starts at the
+    beginning of the frame written at `since`, at most FRAME_SECONDS early.
+    Frames of removed segments (see `SessionLog`) are skipped.
+    """
+    path = find_session(session, root)
+    with open(path / "meta.json", "r") as f:
+        meta = json.load(f)
+    decompress = _decompressor(meta.get("compression", "gzip"))
+    suffix = SUFFIXES[meta.get("compression", "gzip")]
+    records = read_index(path)
+    start = 0 if since is None else _first_frame(records, parse_since(since))
+
+    segment_files = {}
+    removed = set()
+    try:
+        for _, segment, offset, length, _ in records[start:]:
+            if segment in removed:
+                continue
+            if segment not in segment_files:
+                for f, mapped in segment_files.values():
+                    mapped.close()
+                    f.close()
+                segment_files.clear()
+                try:
+                    f = open(path / f"output.{segment:06d}.{suffix}", "rb")
+                except FileNotFoundError:
+                    removed.add(segment)
+                    continue
+                segment_files[segment] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            yield decompress(segment_files[segment][1][offset:offset + length])
+    finally:
+        for f, mapped in segment_files.values():
+            mapped.close()
+            f.close()
@@ -0,0 +1,111 @@
+import re
+import codecs
+
+# OSC strings (window titles, hyperlinks) up to BEL or ST, CSI sequences,
+# character set selections and two character escapes
+ansi_escape = re.compile(
+    r"\x1B(?:\][^\x07\x1B]*(?:\x07|\x1B\\)|\[[0-?]*[ -/]*[@-~]|[ -/]+[0-~]|[@-Z\\-_])"
+)
+# an escape sequence cut by the end of a chunk
+ansi_partial = re.compile(r"\x1B(?:\][^\x07\x1B]*\x1B?|\[[0-?]*[ -/]*|[ -/]+)?\Z")
+# longest partial sequence carried over, anything longer is not a sequence worth waiting for
+MAX_PARTIAL_LENGTH = 1024
+
+
+class RingBuffer(object):
+    """fixed size byte buffer keeping the last `capacity` bytes written
+
+    Writes cost their own length whatever was written before, the memory is
+    allocated once. `dropped` counts the bytes overwritten before being read.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data):
+        data = memoryview(data)
+        if len(data) >= self.capacity:
+            self.dropped += self._size + len(data) - self.capacity
+            self._buffer[:] = data[-self.capacity:]
+            self._start = 0
+            self._size = self.capacity
+            return
+
+        end = (self._start + self._size) % self.capacity
+        first = min(len(data), self.capacity - end)
+        self._buffer[end:end + first] = data[:first]
+        self._buffer[:len(data) - first] = data[first:]
+        overflow = max(0, self._size + len(data) - self.capacity)
+        self.dropped += overflow
+        self._start = (self._start + overflow) % self.capacity
+        self._size = min(self.capacity, self._size + len(data))
+
+    def read(self):
+        """the buffered bytes, oldest first, and the number of bytes dropped since
+        the last read, then empty the buffer"""
+        end = self._start + self._size
+        if end <= self.capacity:
+            data = bytes(self._buffer[self._start:end])
+        else:
+            data = bytes(self._buffer[self._start:]) + bytes(self._buffer[:end - self.capacity])
+        dropped = self.dropped
+        self._start = 0
+        self._size = 0
+        self.dropped = 0
+        return data, dropped
+
+
+class AnsiStripper(object):
+    """incremental ANSI escape sequence remover
+
+    A sequence split across two chunks is held back until its end arrives,
+    so it is removed as a whole instead of leaking its tail into the text.
+    """
+
+    def __init__(self):
+        self._partial = ""
+
+    def reset(self):
+        self._partial = ""
+
+    def feed(self, text):
+        text = self._partial + text
+        self._partial = ""
+        partial = ansi_partial.search(text, max(0, len(text) - MAX_PARTIAL_LENGTH))
+        if partial is not None:
+            self._partial = partial.group()
+            text = text[:partial.start()]
+        return ansi_escape.sub("", text)
+
+
+class OutputDecoder(object):
+    """bytes to ANSI free text, across chunk boundaries
+
+    Multibyte characters and escape sequences split by a read are completed
+    by the next chunk. `reset` starts over after a gap in the stream.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._stripper = AnsiStripper()
+
+    def reset(self):
+        self._decoder.reset()
+        self._stripper.reset()
+
+    def decode(self, data, skip_partial_character=False):
+        """decode the next chunk, `skip_partial_character` drops the continuation
+        bytes at its start, for a chunk cut from the middle of the stream"""
+        if skip_partial_character:
+            index = 0
+            while index < min(len(data), 3) and data[index] & 0xC0 == 0x80:
+                index += 1
+            data = data[index:]
+        return self._stripper.feed(self._decoder.decode(data))
@@ -1,44 +1,266 @@
 """
 https://api.telegram.org/bot{bot_token}/getUpdates
 """
+import time
+import logging
+import threading
+from collections import OrderedDict
 import requests
+from requests.adapters import HTTPAdapter
 from ying.config import settings
-import logging
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+API_URL = "https://api.telegram.org"
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+CHAT_RATE = 1.0
+GROUP_RATE = 20 / 60
+GLOBAL_RATE = 30.0
+# last sent text per message, to skip edits that change nothing
+MAX_REMEMBERED_MESSAGES = 1000
+
+
+class TelegramError(Exception):
+    def __init__(self, description, status_code=None):
+        super().__init__(description)
+        self.status_code = status_code
+
+
+class TokenBucket(object):
+    """`rate` tokens per second, up to `capacity` saved for bursts"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self):
+        """seconds until a token is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return max(self._paused_until - now, (1 - self._tokens) / self.rate, 0)
+
+    def try_acquire(self):
+        """take a token if one is available, otherwise return the seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(self._paused_until - now, (1 - self._tokens) / self.rate, 0)
+            if wait <= 0:
+                self._tokens -= 1
+            return wait
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """no token for `seconds`, e.g. after a 429 `retry_after`"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class TelegramClient(object):
+    """Bot API client on one pooled session, within Telegram's rate limits
+
+    Every call waits for a token of its chat bucket (1 message per second, 20
+    per minute in groups) and of the bot bucket (30 per second). A 429 pauses
+    the chat for its `retry_after`, network errors and 5xx are retried with
+    exponential backoff.
+
+    `schedule_edit` coalesces edits: only the latest text of a message is
+    sent, by a background thread, once its chat may be written to again.
+    That thread is the one dispatcher of every message of the client: it
+    serves the oldest pending edit whose chat has a token first, so messages
+    sharing a chat take turns. Edits to the text last sent are skipped.
+    """
+
+    def __init__(self, bot_token=None, api_url=None, max_retries=3, backoff=1.0, timeout=10):
+        self.bot_token = bot_token or settings.get("tg_bot_token", None)
+        if self.bot_token is None:
+            raise ValueError("tg_bot_token is not configured, please add it.")
+        self.api_url = (api_url or settings.get("tg_api_url", API_URL)).rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        self._global_bucket = TokenBucket(GLOBAL_RATE, capacity=GLOBAL_RATE)
+        self._chat_buckets = {}
+        self._last_texts = OrderedDict()
+        self._pending_edits = OrderedDict()
+        self._sending = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._worker = None
+
+    def chat_bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chat_buckets.get(str(chat_id))
+            if bucket is None:
+                # group and channel ids are negative
+                rate = GROUP_RATE if str(chat_id).startswith("-") else CHAT_RATE
+                bucket = self._chat_buckets[str(chat_id)] = TokenBucket(rate)
+            return bucket
+
+    def call(self, method, chat_id, **params):
+        """POST a Bot API method, waiting for the rate limits and retrying
+
+        Returns:
+            the "result" of the response
+        """
+        bucket = self.chat_bucket(chat_id)
+        url = f"{self.api_url}/bot{self.bot_token}/{method}"
+        error = None
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            self._global_bucket.acquire()
+            try:
+                response = self.session.post(
+                    url, data=dict(params, chat_id=chat_id), timeout=self.timeout
+                )
+                response_data = response.json()
+            except (requests.RequestException, ValueError) as e:
+                error = TelegramError(repr(e))
+                time.sleep(self.backoff * 2**attempt)
+                continue
+
+            if response_data.get("ok"):
+                return response_data["result"]
+            error = TelegramError(response_data.get("description"), response.status_code)
+            if response.status_code == 429:
+                retry_after = response_data.get("parameters", {}).get("retry_after", 1)
+                logger.info("rate limited on %s for %ss", chat_id, retry_after)
+                bucket.pause(retry_after)
+            elif response.status_code >= 500:
+                time.sleep(self.backoff * 2**attempt)
+            else:
+                raise error
+        raise error
+
+    def _remember(self, chat_id, message_id, text):
+        with self._lock:
+            self._last_texts[(str(chat_id), message_id)] = text
+            self._last_texts.move_to_end((str(chat_id), message_id))
+            while len(self._last_texts) > MAX_REMEMBERED_MESSAGES:
+                self._last_texts.popitem(last=False)
+
+    def send_message(self, chat_id, text):
+        result = self.call("sendMessage", chat_id, text=text, parse_mode="Markdown")
+        self._remember(chat_id, result["message_id"], text)
+        return result["message_id"]
+
+    def edit_message_text(self, chat_id, message_id, text):
+        """edit a message now, returns False when the text was already sent"""
+        with self._lock:
+            if self._last_texts.get((str(chat_id), message_id)) == text:
+                return False
+        try:
+            self.call(
+                "editMessageText", chat_id, message_id=message_id, text=text, parse_mode="Markdown"
+            )
+        except TelegramError as e:
+            if "message is not modified" not in str(e):
+                raise
+        self._remember(chat_id, message_id, text)
+        return True
+
+    def schedule_edit(self, chat_id, message_id, text):
+        """edit a message in the background, replacing any edit not sent yet"""
+        with self._changed:
+            self._pending_edits[(chat_id, message_id)] = text
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._send_edits, name="telegram-edits", daemon=True
+                )
+                self._worker.start()
+            self._changed.notify_all()
+
+    def flush(self, timeout=None):
+        """wait until the scheduled edits are sent, returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while self._pending_edits or self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def _next_edit(self):
+        """pop the first pending edit whose chat has a token, None after waiting
+        for one to become ready"""
+        with self._changed:
+            wait = 60
+            for key in list(self._pending_edits):
+                bucket = self._chat_buckets.get(str(key[0]))
+                delay = bucket.delay() if bucket is not None else 0
+                if delay <= 0:
+                    self._sending += 1
+                    return key, self._pending_edits.pop(key)
+                wait = min(wait, delay)
+            self._changed.wait(wait)
+            return None
+
+    def _send_edits(self):
+        while True:
+            edit = self._next_edit()
+            if edit is None:
+                continue
+            (chat_id, message_id), text = edit
+            try:
+                self.edit_message_text(chat_id, message_id, text)
+            except TelegramError as e:
+                logger.error("failed to edit message %s of %s: %s", message_id, chat_id, e)
+            finally:
+                with self._changed:
+                    self._sending -= 1
+                    self._changed.notify_all()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """process wide TelegramClient, built from the settings on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TelegramClient()
+        return _client
+
+
 def send_message(chat_id, text):
-    BOT_TOKEN = settings.get("tg_bot_token", None)
-    if BOT_TOKEN is None:
-        raise ValueError("tg_bot_token is not configured, please add it.")
-
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
-    response = requests.post(url, data=payload)
-    response_data = response.json()
-    if response_data["ok"]:
-        message_id = response_data["result"]["message_id"]
-        logger.info(response_data)
-    else:
-        message_id = None
+    try:
+        message_id = get_client().send_message(chat_id, text)
+    except TelegramError as e:
         logger.info(f"Failed to send message to {chat_id}: {text}")
-        logger.info(response_data)
+        logger.info(e)
+        return None
     return message_id
 
 
 def edit_message_text(chat_id, message_id, text):
-    BOT_TOKEN = settings.get("tg_bot_token", None)
-    if BOT_TOKEN is None:
-        raise ValueError("tg_bot_token is not configured, please add it.")
-
-    edit_url = f"https://api.telegram.org/bot{BOT_TOKEN}/editMessageText"
-    edit_data = {"chat_id": chat_id, "message_id": message_id, "text": text, "parse_mode": "Markdown"}
-    edit_response = requests.post(edit_url, data=edit_data)
-    edit_response_data = edit_response.json()
-
-    if edit_response_data["ok"]:
-        logger.info("Message updated successfully")
-    else:
+    try:
+        if get_client().edit_message_text(chat_id, message_id, text):
+            logger.info("Message updated successfully")
+    except TelegramError as e:
         logger.info("Failed to update message")
-        logger.info(edit_response_data)
+        logger.info(e)
@@ -21,3 +21,73 @@ def human_readable_bytes(size, decimal_places=2):
         size /= 1024.0
 
     return f"{size:.{decimal_places}f} {unit}"
+
+
+UNITS = ["B", "KB", "MB", "GB", "TB", "PB", "EB", "ZB", "YB"]
+
+
+def human_readable_bytes_array(sizes, decimal_places=2):
+    """`human_readable_bytes` of every size at once, over NumPy arrays
+
+    Negative sizes (missing values) give an empty string instead of a warning.
+
+    Args:
+        sizes (array like): sizes in bytes
+        decimal_places (int, optional): decimals of the value. Defaults to 2.
+
+    Returns:
+        numpy.ndarray: str array of the same shape
+    """
+    import numpy as np
+
+    if not isinstance(decimal_places, int) or decimal_places < 0:
+        raise ValueError("decimal_places should be a non-negative integer")
+
+    sizes = np.asarray(sizes)
+    scaled = sizes.astype(np.float64)
+    exponents = np.zeros(scaled.shape, dtype=np.intp)
+    # the same divisions as the scalar version, dividing by 1024 is exact
+    for _ in range(len(UNITS) - 1):
+        larger = scaled >= 1024.0
+        if not larger.any():
+            break
+        scaled[larger] /= 1024.0
+        exponents += larger
+
+    values = np.char.mod(f"%.{decimal_places}f ", scaled)
+    formatted = np.char.add(values, np.array(UNITS)[exponents])
+    formatted = np.where(sizes == 0, "0 B", formatted)
+    return np.where(sizes < 0, "", formatted)
+
+
+def parse_human_readable_bytes_array(values):
+    """sizes in bytes of "1.50 GB" like strings, the inverse of `human_readable_bytes_array`
+
+    Units are case insensitive, a bare number is in bytes and an empty string
+    gives -1. Values are rounded to the nearest byte.
+
+    Returns:
+        numpy.ndarray: int64 array of the same shape
+    """
+    import numpy as np
+
+    values = np.char.strip(np.char.upper(np.asarray(values, dtype=str)))
+    if values.size == 0:
+        return np.zeros(values.shape, dtype=np.int64)
+    numbers, _, units = np.moveaxis(np.char.rpartition(values, " "), -1, 0)
+    # "1024" has no unit, rpartition leaves the number in the unit part
+    bare = numbers == ""
+    numbers = np.where(bare, units, numbers)
+    units = np.where(bare, "B", units)
+
+    unique_units, inverse = np.unique(units, return_inverse=True)
+    known = {unit: 1024.0 ** index for index, unit in enumerate(UNITS)}
+    unknown = [unit for unit in unique_units.tolist() if unit not in known]
+    if unknown:
+        raise ValueError(f"unknown byte units {unknown}, expected one of {UNITS}")
+    multipliers = np.array([known[unit] for unit in unique_units.tolist()], dtype=np.float64)[inverse]
+
+    missing = values == ""
+    numbers = np.where(missing, "0", numbers).astype(np.float64)
+    sizes = np.rint(numbers * multipliers.reshape(numbers.shape)).astype(np.int64)
+    return np.where(missing, -1, sizes)
@@ -1,8 +1,23 @@
-import requests
 import socket
 import getpass
 import pwd
 import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+EXTERNAL_IP_UNKNOWN = "Unable to get IP"
+# shown while the first external IP lookup of this host is running
+EXTERNAL_IP_PENDING = "..."
+DEFAULT_HOST_BANNER_TTL = 3600
+DEFAULT_EXTERNAL_IP_TIMEOUT = 3
+
+_lock = threading.Lock()
+_host_info = None
+_lookup = None
 
 
 def get_hostname():
@@ -32,24 +47,121 @@ def get_internal_ip():
     return IP
 
 
-def get_external_ip():
+def get_external_ip(timeout=DEFAULT_EXTERNAL_IP_TIMEOUT):
     """
     http://ip-api.com/json?fields=status,message,continent,continentCode,country,countryCode,region,regionName,city,district,zip,lat,lon,timezone,isp,org,as,asname,query
     """
-    response = requests.get("https://api.ipify.org")
+    import requests
+
+    try:
+        response = requests.get("https://api.ipify.org", timeout=timeout)
+    except requests.RequestException as e:
+        logger.info("external ip lookup failed: %s", e)
+        return EXTERNAL_IP_UNKNOWN
     if response.status_code == 200:
         return response.text
     else:
-        return "Unable to get IP"
+        return EXTERNAL_IP_UNKNOWN
 
 
 def get_working_directory():
     return os.getcwd()
 
 
-def format_host_banner():
-    user = get_current_user()
-    hostname = get_hostname()
-    internal_ip = get_internal_ip()
-    external_ip = get_external_ip()
-    return f"{user}@{hostname}[{internal_ip}][{external_ip}]:{get_working_directory()}"
+def host_banner_cache_path():
+    from ying.config import config_dir
+
+    return config_dir / "host_banner.json"
+
+
+def _load_host_info(hostname):
+    """cached banner pieces of this host, the cache file may be shared by several hosts"""
+    try:
+        with open(host_banner_cache_path(), "r") as f:
+            return json.load(f).get(hostname)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_host_info(host_info):
+    path = host_banner_cache_path()
+    try:
+        os.makedirs(path.parent, exist_ok=True)
+        try:
+            with open(path, "r") as f:
+                hosts = json.load(f)
+        except (OSError, ValueError):
+            hosts = {}
+        hosts[host_info["hostname"]] = host_info
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(hosts, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.info("[%s] cannot cache host banner: %s", path, e)
+
+
+def _lookup_external_ip(host_info, timeout):
+    global _host_info
+    external_ip = get_external_ip(timeout)
+    if external_ip == EXTERNAL_IP_UNKNOWN and host_info.get("external_ip") not in (None, EXTERNAL_IP_PENDING):
+        # keep the last known address of an offline host, retried at the next expiry
+        external_ip = host_info["external_ip"]
+    host_info = dict(host_info, external_ip=external_ip, resolved_at=time.time())
+    with _lock:
+        _host_info = host_info
+    _save_host_info(host_info)
+
+
+def get_host_info(ttl=None, timeout=None, wait=0):
+    """user, hostname, internal and external IP of this host, without blocking
+
+    The pieces are cached in memory and in `~/.config/ying/host_banner.json`
+    for `ttl` seconds (setting `host_banner_ttl`). Once expired, or on the
+    first run on a host, the external IP is looked up on a background thread
+    with a `timeout` (setting `external_ip_timeout`) while the last known one,
+    or "...", is returned. `wait` gives that lookup some seconds to finish.
+
+    Returns:
+        dict: { "user", "hostname", "internal_ip", "external_ip", "resolved_at" }
+    """
+    global _host_info, _lookup
+    from ying.config import settings
+
+    ttl = settings.get("host_banner_ttl", DEFAULT_HOST_BANNER_TTL) if ttl is None else ttl
+    timeout = settings.get("external_ip_timeout", DEFAULT_EXTERNAL_IP_TIMEOUT) if timeout is None else timeout
+    with _lock:
+        if _host_info is None:
+            hostname = get_hostname()
+            _host_info = _load_host_info(hostname) or {
+                "user": get_current_user(),
+                "hostname": hostname,
+                "internal_ip": get_internal_ip(),
+                "external_ip": EXTERNAL_IP_PENDING,
+                "resolved_at": 0,
+            }
+        host_info = _host_info
+        lookup = _lookup
+        if time.time() - host_info["resolved_at"] >= ttl and (lookup is None or not lookup.is_alive()):
+            refreshed = dict(
+                host_info,
+                user=get_current_user(),
+                internal_ip=get_internal_ip(),
+            )
+            lookup = _lookup = threading.Thread(
+                target=_lookup_external_ip, args=(refreshed, timeout), name="external-ip", daemon=True
+            )
+            lookup.start()
+    if wait and lookup is not None:
+        lookup.join(wait)
+        with _lock:
+            host_info = _host_info
+    return host_info
+
+
+def format_host_banner(wait=0):
+    host_info = get_host_info(wait=wait)
+    return (
+        f"{host_info['user']}@{host_info['hostname']}"
+        f"[{host_info['internal_ip']}][{host_info['external_ip']}]:{get_working_directory()}"
+    )